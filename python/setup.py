@@ -48,7 +48,12 @@ setup(name='diva-framework',
           '{}/scripts/cli_helpers/cleanup_chunk.py'.format(diva_source_dir),
           '{}/scripts/cli_helpers/cleanup_experiment.py'.format(diva_source_dir),
           '{}/scripts/cli_helpers/generate_experiments.py'.format(diva_source_dir),
-          '{}/scripts/cli_helpers/merge_videos.py'.format(diva_source_dir)],
+          '{}/scripts/cli_helpers/merge_videos.py'.format(diva_source_dir),
+          '{}/scripts/cli_helpers/cache_manager.py'.format(diva_source_dir),
+          # (Modules the scripts import, installed next to them)
+          '{}/scripts/cli_helpers/chunk_index.py'.format(diva_source_dir),
+          '{}/scripts/cli_helpers/compressed_io.py'.format(diva_source_dir),
+          '{}/scripts/cli_helpers/image_list.py'.format(diva_source_dir)],
       classifiers=[
           'Development Status :: 3 - Alpha',
           'Programming Language :: Python :: 3.5',
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import re
+import warnings
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# (Run from the scripts.cli_helpers package, or as scripts installed
+# next to each other)
+if __package__:
+    from .chunk_index import JsonIndex
+    from .compressed_io import EXTENSIONS
+else:
+    from chunk_index import JsonIndex
+    from compressed_io import EXTENSIONS
+
+# Files unlinked by each task of the pool
+UNLINK_BATCH_SIZE = 64
+
+JSON_SUFFIXES = tuple(".json" + ext
+                      for ext in [""] + sorted(EXTENSIONS.values()))
+VIDEO_SUFFIXES = ("_experiment.yml", "_imagelist.txt")
+
+SIZE_UNITS = {'': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+CacheEntry = namedtuple('CacheEntry', ['name', 'kind', 'paths', 'size',
+                                       'last_access'])
+
+def parse_size(size):
+    """
+    Parse a number of bytes, e.g. "512", "20M" or "1.5G"
+    """
+    match = re.match(r"^\s*([0-9.]+)\s*([kmgt]?)i?b?\s*$", size, re.I)
+    if match is None:
+        raise ValueError("Invalid size {0}".format(size))
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+def _entry_name(file_name):
+    """
+    :return (name of the video or chunk a cache file is for, whether it's
+        only written for videos), or None for files that aren't cached
+    """
+    for suffix in VIDEO_SUFFIXES:
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)], True
+    for suffix in JSON_SUFFIXES:
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)], False
+    return None
+
+def _unlink_batch(paths):
+    removed = []
+    for path in paths:
+        try:
+            os.remove(path)
+            removed.append(path)
+        except FileNotFoundError:
+            pass
+    return removed
+
+class CacheDirectory(object):
+    """
+    Directory of the per-video (json, experiment yml and image list) and
+    per-chunk (json) files of the pipeline, with the files for each video
+    or chunk kept and evicted together.  Only the files of the videos and
+    chunks in the chunk json are seen as cache files.
+    """
+
+    def __init__(self, cache_dir, chunks, workers=None, protected=()):
+        """
+        :param cache_dir: Cache directory
+        :param chunks: Chunk json (a JsonIndex)
+        :param workers: Number of threads to remove files with (default is
+            set by Python's thread pool from the number of CPUs)
+        :param protected: Paths of files (e.g. the chunk json and file
+            index) never to remove, even if named as cache files
+        """
+        self.cache_dir = cache_dir
+        self.chunks = chunks
+        self.workers = workers
+        # (Every removed path is a name in cache_dir, so compared by name)
+        real_cache_dir = os.path.realpath(cache_dir)
+        self.protected_names = set(
+            os.path.basename(path) for path in protected
+            if os.path.realpath(os.path.dirname(path)) == real_cache_dir)
+        self._video_names = None
+
+    def video_names(self):
+        """
+        :return Set of the names (without extension) of the videos in the
+            chunk json
+        """
+        if self._video_names is None:
+            self._video_names = set(
+                os.path.splitext(video_name)[0]
+                for chunk_id in self.chunks.keys()
+                for video_name in self.chunks[chunk_id]["files"])
+        return self._video_names
+
+    def entries(self):
+        """
+        Scan the cache directory
+        :return List of the CacheEntry for each video and chunk, least
+            recently used first
+        """
+        video_names = self.video_names()
+        files = {}
+        with os.scandir(self.cache_dir) as it:
+            for dir_entry in it:
+                if dir_entry.name in self.protected_names or \
+                        not dir_entry.is_file(follow_symlinks=False):
+                    continue
+                name = _entry_name(dir_entry.name)
+                if name is None:
+                    continue
+                name, video_only = name
+                if name in video_names:
+                    kind = "video"
+                elif not video_only and name in self.chunks:
+                    kind = "chunk"
+                else:
+                    continue
+                files.setdefault((kind, name), []).append(
+                    (dir_entry.path, dir_entry.stat()))
+
+        entries = []
+        for (kind, name), name_files in files.items():
+            # (atime alone isn't kept up to date on every mount)
+            entries.append(CacheEntry(
+                name, kind, sorted(path for path, _ in name_files),
+                sum(st.st_size for _, st in name_files),
+                max(max(st.st_atime, st.st_mtime)
+                    for _, st in name_files)))
+        entries.sort(key=lambda entry: (entry.last_access, entry.name))
+        return entries
+
+    def remove(self, paths):
+        """
+        Remove the files among paths that exist (other than protected
+        ones), in batches on a pool of threads
+        :return Set of the removed paths
+        """
+        paths = [path for path in paths
+                 if os.path.basename(path) not in self.protected_names]
+        batches = [paths[i:i + UNLINK_BATCH_SIZE]
+                   for i in range(0, len(paths), UNLINK_BATCH_SIZE)]
+        removed = set()
+        if len(batches) == 1:
+            removed.update(_unlink_batch(batches[0]))
+        elif len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for batch_removed in pool.map(_unlink_batch, batches):
+                    removed.update(batch_removed)
+        for path in paths:
+            if path in removed:
+                print("Removing {0}".format(path))
+        return removed
+
+    def remove_videos(self, video_names):
+        """
+        Remove the cache files of videos, warning of missing json and
+        experiment files
+        """
+        video_paths = []
+        for video_name in video_names:
+            stem = os.path.join(self.cache_dir,
+                                os.path.splitext(video_name)[0])
+            video_paths.append(([stem + suffix for suffix in JSON_SUFFIXES],
+                                stem + "_experiment.yml",
+                                stem + "_imagelist.txt"))
+        removed = self.remove([path for json_paths, yml_path, imagelist_path
+                               in video_paths
+                               for path in json_paths + [yml_path,
+                                                         imagelist_path]])
+        for json_paths, yml_path, _ in video_paths:
+            if not removed.intersection(json_paths):
+                warnings.warn("{0} not found".format(json_paths[0]))
+            if yml_path not in removed:
+                warnings.warn("{0} not found".format(yml_path))
+
+    def remove_chunks(self, chunk_ids):
+        """
+        Remove the json files of chunks, warning of missing ones
+        """
+        chunk_paths = [[os.path.join(self.cache_dir, chunk_id + suffix)
+                        for suffix in JSON_SUFFIXES]
+                       for chunk_id in chunk_ids]
+        removed = self.remove([path for paths in chunk_paths
+                               for path in paths])
+        for chunk_id, paths in zip(chunk_ids, chunk_paths):
+            if not removed.intersection(paths):
+                warnings.warn("Json file associated with {0} not found in {1}"
+                              .format(chunk_id, self.cache_dir))
+
+    def trim(self, max_bytes=None, max_entries=None, keep=()):
+        """
+        Evict the least recently used videos and chunks until the cache is
+        within budget
+        :param max_bytes: Maximum total size of the cache files
+        :param max_entries: Maximum number of videos and chunks
+        :param keep: Names of videos and chunks not to evict
+        :return List of the evicted CacheEntry
+        """
+        entries = self.entries()
+        total_bytes = sum(entry.size for entry in entries)
+        num_entries = len(entries)
+        keep = set(keep)
+        evicted = []
+        for entry in entries:
+            if ((max_bytes is None or total_bytes <= max_bytes) and
+                    (max_entries is None or num_entries <= max_entries)):
+                break
+            if entry.name in keep:
+                continue
+            evicted.append(entry)
+            total_bytes -= entry.size
+            num_entries -= 1
+
+        self.remove([path for entry in evicted for path in entry.paths])
+        return evicted
+
+def main(args):
+    if not os.path.isdir(args.cache_dir):
+        raise OSError("Invalid path {0} provided for cache directory"
+                      .format(args.cache_dir))
+    if not os.path.exists(args.chunk_json):
+        raise OSError("Invalid path {0} provided for Chunk.json".format(args.chunk_json))
+    chunks = JsonIndex(args.chunk_json, args.index_dir)
+    keep = set()
+    for chunk_id in args.keep_chunk:
+        if chunk_id not in chunks:
+            raise KeyError("Invalid chunk id {0} provided".format(chunk_id))
+        keep.add(chunk_id)
+        keep.update(os.path.splitext(video_name)[0]
+                    for video_name in chunks[chunk_id]["files"])
+    protected = [args.chunk_json]
+    if args.file_index is not None:
+        protected.append(args.file_index)
+    cache = CacheDirectory(args.cache_dir, chunks, args.workers, protected)
+    evicted = cache.trim(args.max_bytes, args.max_entries, keep)
+    print("Evicted {0} entries ({1} bytes) from {2}".format(
+        len(evicted), sum(entry.size for entry in evicted), args.cache_dir))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Evict the least recently used videos and chunks (of "
+        "the chunk json) from a cache directory until it's within budget")
+    parser.add_argument("--cache-dir", help="Cache directory with the json files")
+    parser.add_argument("--max-bytes", type=parse_size,
+            help="Maximum size of the cache (e.g. 500M or 20G)")
+    parser.add_argument("--max-entries", type=int,
+            help="Maximum number of videos and chunks in the cache")
+    parser.add_argument("--chunk-json", help="JSON file with all the chunks")
+    parser.add_argument("--file-index",
+            help="File index for all the videos, never evicted if it's in "
+            "the cache directory (nor is the chunk json)")
+    parser.add_argument("--keep-chunk", action='append', default=[],
+            help="Chunk id whose files are not evicted (may be repeated)")
+    parser.add_argument("--index-dir",
+            help="Directory to keep the compiled index of the chunk json in "
+            "(default is next to the chunk json)")
+    parser.add_argument("--workers", type=int,
+            help="Number of threads to remove files with (default is set by "
+            "Python's thread pool from the number of CPUs)")
+    args = parser.parse_args()
+    if args.chunk_json is None:
+        parser.error("--chunk-json is required")
+    if args.max_bytes is None and args.max_entries is None:
+        parser.error("One of --max-bytes or --max-entries is required")
+    main(args)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import sqlite3
+import uuid
+import warnings
+
+# (Run from the scripts.cli_helpers package, or as scripts installed
+# next to each other)
+if __package__:
+    from .compressed_io import open_file
+else:
+    from compressed_io import open_file
+
+# Bump when the layout of the index changes
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".index.sqlite"
+
+
+class JsonIndex(object):
+    """
+    Compiled index of a JSON object file (e.g. the chunk JSON or the file
+    index), looking up the value of one of its keys without loading the
+    rest of the file.
+
+    The index is a SQLite file alongside the JSON file (or in index_dir),
+    built on first use and rebuilt whenever the JSON file's size or
+    modification time changes.  If it can't be written, the index is
+    built in memory for this run instead.
+    """
+
+    def __init__(self, json_path, index_dir=None):
+        """
+        :param json_path: Path of the JSON file (possibly compressed)
+        :param index_dir: Directory to keep the index in (default is the
+            directory of the JSON file)
+        """
+        self.json_path = json_path
+        if index_dir is None:
+            self.index_path = json_path + INDEX_SUFFIX
+        else:
+            # (Named for the JSON file's full path, as several JSON files
+            # may share a name)
+            path_hash = hashlib.sha1(os.path.abspath(json_path).encode(
+                'utf-8', 'surrogateescape')).hexdigest()[:12]
+            self.index_path = os.path.join(
+                index_dir, "{0}.{1}{2}".format(os.path.basename(json_path),
+                                               path_hash, INDEX_SUFFIX))
+
+        self._source = self._source_stamp()
+        self._db = self._open_current()
+        if self._db is None:
+            self._db = self._build()
+
+    def _source_stamp(self):
+        st = os.stat(self.json_path)
+        return {'version': str(INDEX_VERSION),
+                'size': str(st.st_size),
+                'mtime_ns': str(st.st_mtime_ns)}
+
+    def _open_current(self):
+        """
+        Open the existing index, if it's up to date with the JSON file
+        :return sqlite3 connection, or None
+        """
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            db = sqlite3.connect(self.index_path)
+        except sqlite3.DatabaseError:
+            return None
+        try:
+            stamp = dict(db.execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError:
+            db.close()
+            return None
+        if stamp != self._source:
+            db.close()
+            return None
+        return db
+
+    def _fill(self, db):
+        with open_file(self.json_path, 'r') as f:
+            entries = json.load(f)
+        db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, "
+                   "position INTEGER, value TEXT)")
+        db.executemany("INSERT INTO meta VALUES (?, ?)",
+                       sorted(self._source.items()))
+        db.executemany("INSERT INTO entries VALUES (?, ?, ?)",
+                       ((key, position, json.dumps(value))
+                        for position, (key, value)
+                        in enumerate(entries.items())))
+        db.commit()
+
+    def _build(self):
+        """
+        Build the index from the JSON file, replacing any existing one
+        :return sqlite3 connection
+        """
+        index_dir = os.path.dirname(self.index_path) or "."
+        try:
+            os.makedirs(index_dir, exist_ok=True)
+        except OSError:
+            pass
+        if not os.access(index_dir, os.W_OK):
+            warnings.warn("Can't write an index of {0} to {1}; indexing it "
+                          "in memory".format(self.json_path, index_dir))
+            db = sqlite3.connect(":memory:")
+            self._fill(db)
+            return db
+
+        # Built aside and renamed into place, so concurrent runs only
+        # ever see a complete index
+        tmp_path = os.path.join(index_dir, ".{0}.{1}.tmp".format(
+            os.path.basename(self.index_path), uuid.uuid4().hex))
+        try:
+            db = sqlite3.connect(tmp_path)
+            try:
+                self._fill(db)
+            finally:
+                db.close()
+            os.replace(tmp_path, self.index_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return sqlite3.connect(self.index_path)
+
+    def get(self, key, default=None):
+        row = self._db.execute("SELECT value FROM entries WHERE key = ?",
+                               (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def __getitem__(self, key):
+        row = self._db.execute("SELECT value FROM entries WHERE key = ?",
+                               (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __contains__(self, key):
+        return self._db.execute("SELECT 1 FROM entries WHERE key = ?",
+                                (key,)).fetchone() is not None
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def keys(self):
+        """
+        :return List of the keys, in the order of the JSON file
+        """
+        return [key for key, in self._db.execute(
+            "SELECT key FROM entries ORDER BY position")]
+
+    def close(self):
+        self._db.close()
@@ -2,25 +2,33 @@
 
 import argparse
 import os
-import warnings
-import json
+
+# (Run from the scripts.cli_helpers package, or as scripts installed
+# next to each other)
+if __package__:
+    from .cache_manager import CacheDirectory
+    from .chunk_index import JsonIndex
+else:
+    from cache_manager import CacheDirectory
+    from chunk_index import JsonIndex
 
 def main(args):
     if not os.path.exists(args.chunk_json):
         raise OSError("Invalid path {0} provided for Chunk.json".format(args.chunk_json))
-    chunks = json.load(open(args.chunk_json, 'r'))
-    for chunk_id in chunks.keys():
-        chunk_file = "{0}.json".format(chunk_id)
-        chunk_path = os.path.join(args.cache_dir, chunk_file)
-        if os.path.exists( chunk_path ):
-            print("Removing {0}".format(chunk_path))
-            os.remove(chunk_path)
-        else:
-            warnings.warn("Json file associated with {0} not found in {1}".format( chunk_id, args.cache_dir))
+    chunks = JsonIndex(args.chunk_json, args.index_dir)
+    cache = CacheDirectory(args.cache_dir, chunks, args.workers,
+                           [args.chunk_json])
+    cache.remove_chunks(chunks.keys())
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--chunk-json", help="JSON file with all the chunks")
     parser.add_argument("--cache-dir", help="Cache directory with the json files")
+    parser.add_argument("--index-dir",
+            help="Directory to keep the compiled index of the chunk json in "
+            "(default is next to the chunk json)")
+    parser.add_argument("--workers", type=int,
+            help="Number of threads to remove files with (default is set by "
+            "Python's thread pool from the number of CPUs)")
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,167 @@
+import collections
+import gzip
+import io
+import lzma
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    # (Only needed for .zst files)
+    zstandard = None
+
+
+# Compressed file extensions, and those of the compressions
+COMPRESSION_EXTENSIONS = {'.gz': 'gz', '.xz': 'xz', '.zst': 'zst'}
+EXTENSIONS = {'gz': '.gz', 'xz': '.xz', 'zst': '.zst'}
+
+GZIP_LEVEL = 6
+XZ_PRESET = 6
+ZSTD_LEVEL = 3
+
+# Uncompressed bytes per independently compressed block when writing
+# with multiple threads
+BLOCK_SIZE = 4 << 20
+
+
+def compression_of(path):
+    """'gz', 'xz' or 'zst' by the extension of 'path', or None"""
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def strip_compression(path):
+    # 'path' without its compressed file extension (if any)
+    if compression_of(path) is None:
+        return path
+    return os.path.splitext(path)[0]
+
+
+def with_compression(path, compression):
+    # Append the extension for 'compression' (if any) to 'path'
+    return path + EXTENSIONS[compression] if compression else path
+
+
+def existing_path(path):
+    """'path' if it exists, otherwise the first existing compressed
+    variant of it (e.g. 'path'.gz), or 'path' if there's none"""
+    if not os.path.exists(path):
+        for ext in sorted(COMPRESSION_EXTENSIONS):
+            if os.path.exists(path + ext):
+                return path + ext
+    return path
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError("Reading or writing .zst files requires the "
+                          "zstandard package (pip install zstandard)")
+
+
+def _num_threads(threads):
+    # None or 1 for single-threaded; 0 for one thread per CPU
+    if threads == 0:
+        return os.cpu_count() or 1
+    return threads or 1
+
+
+class _BlockCompressingWriter(io.BufferedIOBase):
+    """Binary writer compressing blocks of BLOCK_SIZE bytes in a pool
+    of threads (zlib and lzma release the GIL), writing each block as a
+    separate gzip member or xz stream in order; the concatenation
+    decompresses as one file."""
+
+    def __init__(self, path, compress_block, threads):
+        self._file = open(path, 'wb')
+        self._compress_block = compress_block
+        self._threads = threads
+        self._pool = ThreadPoolExecutor(threads)
+        self._pending = collections.deque()
+        self._buf = bytearray()
+        self._num_blocks = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buf += b
+        while len(self._buf) >= BLOCK_SIZE:
+            self._submit(bytes(self._buf[:BLOCK_SIZE]))
+            del self._buf[:BLOCK_SIZE]
+        return len(b)
+
+    def _submit(self, block):
+        self._pending.append(self._pool.submit(self._compress_block, block))
+        self._num_blocks += 1
+        # Bound the blocks in flight to keep memory use bounded
+        while len(self._pending) > 2 * self._threads:
+            self._file.write(self._pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            # (An empty file is still written as one empty block)
+            if len(self._buf) > 0 or self._num_blocks == 0:
+                self._submit(bytes(self._buf))
+                self._buf = bytearray()
+            while self._pending:
+                self._file.write(self._pending.popleft().result())
+        finally:
+            self._pool.shutdown()
+            self._file.close()
+            super().close()
+
+
+def _open_binary(path, mode, compression, threads):
+    writing = mode.startswith('w')
+    if compression == 'zst':
+        _require_zstandard()
+        if writing:
+            cctx = zstandard.ZstdCompressor(
+                level=ZSTD_LEVEL,
+                threads=threads if threads > 1 else 0)
+            return cctx.stream_writer(open(path, 'wb'), closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(path, 'rb'), read_across_frames=True, closefd=True)
+
+    if writing and threads > 1:
+        if compression == 'gz':
+            def _compress(block):
+                return gzip.compress(block, GZIP_LEVEL, mtime=0)
+        else:
+            def _compress(block):
+                return lzma.compress(block, preset=XZ_PRESET)
+        return _BlockCompressingWriter(path, _compress, threads)
+
+    if compression == 'gz':
+        return gzip.GzipFile(path, mode.replace('b', ''),
+                             compresslevel=GZIP_LEVEL, mtime=0)
+    return lzma.LZMAFile(path, mode.replace('b', ''),
+                         preset=XZ_PRESET if writing else None)
+
+
+def open_file(path, mode='r', encoding=None, newline=None, buffering=-1,
+              threads=None):
+    """Open 'path' as with open() (for modes 'r', 'w', 'rb' or 'wb'),
+    transparently decompressing or compressing by its extension (.gz,
+    .xz or .zst).
+
+    'threads' is the number of threads to compress output with (0 for
+    one per CPU); with more than one, gzip and xz output is written as
+    a sequence of independently compressed blocks, and zstd output uses
+    zstandard's own threads.  Reading is always single-threaded.
+    'buffering' only applies to uncompressed files.
+    """
+    if mode not in ('r', 'w', 'rb', 'wb'):
+        raise ValueError("Unsupported mode '{}'".format(mode))
+
+    compression = compression_of(path)
+    if compression is None:
+        return open(path, mode, buffering=buffering, encoding=encoding,
+                    newline=newline)
+
+    binary = _open_binary(path, mode, compression, _num_threads(threads))
+    if 'b' in mode:
+        return binary
+    return io.TextIOWrapper(binary, encoding=encoding, newline=newline)
@@ -2,8 +2,18 @@
 
 import diva.utils as du
 import os
+import time
 import argparse
-import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# (Run from the scripts.cli_helpers package, or as scripts installed
+# next to each other)
+if __package__:
+    from .chunk_index import JsonIndex
+    from .image_list import write_image_list
+else:
+    from chunk_index import JsonIndex
+    from image_list import write_image_list
 
 def _generate_dummy_output(diva_experiment):
     """
@@ -42,22 +52,20 @@ def generate_experiment_file_from_videos(video_root, experiment_root, video_name
         raise Exception("Invalid experiment file")
 
 def generate_experiment_file_from_images(image_root, experiment_root, imagelist_root,
-                                         video_name):
+                                         video_name, imagelist_file_name=None):
     """
     Generate experiment files from images
     :param image_root: Root folder with images
     :param experiment_root: Root folder where experiment specification would be stored in yml file
     :param imagelist_root: Root folder where a text file containing path to images of a video would be stored
     :param video_name: Name of the video
+    :param imagelist_file_name: Name of the image list, if already written
+        (by write_image_list)
     :return None
     """
     experiment_file_name = os.path.basename(image_root) + "_experiment.yml"
-    imagelist_file_name = os.path.basename(image_root) + "_imagelist.txt"
-
-    with open(os.path.join(imagelist_root, imagelist_file_name), "w") as f:
-        for image_name in sorted(os.listdir(image_root)):
-            image_path = os.path.join(image_root, image_name)
-            f.write(image_path + "\n")
+    if imagelist_file_name is None:
+        imagelist_file_name = write_image_list(image_root, imagelist_root)
     diva_experiment = du.experiment()
     diva_experiment.set_type(du.experiment_type.activity_detection)
     diva_input = diva_experiment.get_input()
@@ -71,6 +79,57 @@ def generate_experiment_file_from_images(image_root, experiment_root, imagelist_
     else:
         raise Exception("Invalid experiment file")
 
+def _prepare_experiment(args, video_name, video_path):
+    """
+    Check that a video's data is present and write its image list (if
+    from images), the filesystem work for its experiment
+    :param args: Command line arguments from argparser
+    :param video_name: Name of the video
+    :param video_path: Path of video relative to the data root
+    :return Name of the image list file (or None for videos)
+    """
+    if args.use_videos:
+        if not os.path.exists(os.path.join(args.data_root, video_path)):
+            raise OSError("{0} is not present in {1}".format(video_name,
+                                                             args.data_root))
+        return None
+    video_folder, _ = os.path.splitext(video_name)
+    image_root = os.path.join(args.data_root, video_folder)
+    if not os.path.isdir(image_root):
+        raise OSError("{0} is not present in {1}".format(video_name,
+                                                         args.data_root))
+    return write_image_list(image_root, args.imagelist_root)
+
+def _write_experiment(args, video_name, video_path, imagelist_file_name):
+    """
+    Write the experiment file of a video, once prepared
+    :param args: Command line arguments from argparser
+    :param video_name: Name of the video
+    :param video_path: Path of video relative to the data root
+    :param imagelist_file_name: Name of its image list (from
+        _prepare_experiment)
+    """
+    if args.use_videos:
+        generate_experiment_file_from_videos(args.data_root,
+                                             args.experiment_root,
+                                             video_name,
+                                             video_path)
+    else:
+        video_folder, _ = os.path.splitext(video_name)
+        generate_experiment_file_from_images(
+            os.path.join(args.data_root, video_folder),
+            args.experiment_root,
+            args.imagelist_root,
+            video_name,
+            imagelist_file_name)
+
+def _timed(fn, *args):
+    """
+    :return Result of fn(*args), and the time taken in seconds
+    """
+    start = time.time()
+    return fn(*args), time.time() - start
+
 def main(args):
     """
     Main function
@@ -81,9 +140,10 @@ def main(args):
     if not os.path.exists(args.data_root):
         raise OSError("Invalid path {0} provided for data root".format(args.data_root))
 
-    chunks = json.load(open(args.chunk_json, 'r'))
-
-    file_index = json.load(open(args.file_index, 'r'))
+    # (Indexed, rather than loaded, as they're large and only a chunk's
+    # worth of entries is needed)
+    chunks = JsonIndex(args.chunk_json, args.index_dir)
+    file_index = JsonIndex(args.file_index, args.index_dir)
 
     if not os.path.exists(args.experiment_root):
         print("{0} not found. Creating {0}.".format(args.experiment_root))
@@ -93,27 +153,39 @@ def main(args):
             print("{0} not found. Creating {0}.".format(args.imagelist_root))
             os.makedirs(args.imagelist_root)
 
-    if args.chunk_id in chunks.keys():
+    if args.chunk_id in chunks:
         chunk_files = chunks[args.chunk_id]["files"]
-        for video_name in chunk_files:
-            video_path = file_index[video_name]["filename"]
-            if args.use_videos:
-                if not os.path.exists(os.path.join(args.data_root, video_path)):
-                    raise OSError("{0} is not present in {1}".format(video_name,
-                                                                     args.data_root))
-                generate_experiment_file_from_videos(args.data_root,
-                                                     args.experiment_root,
-                                                     video_name,
-                                                     video_path)
-            else:
-                video_folder, _ = os.path.splitext(video_name)
-                if video_folder not in all_videos:
-                   raise OSError("{0} is not present in {1}".format(video_name,
-                                                                    args.data_root))
-                generate_experiment_file_from_images(os.path.join(args.data_root, video_folder),
-                                                     args.experiment_root,
-                                                     args.imagelist_root,
-                                                     video_name)
+        video_paths = {video_name: file_index[video_name]["filename"]
+                       for video_name in chunk_files}
+        # Videos are independent (and mostly waiting on storage), so their
+        # data is checked and image lists written by a pool of threads.
+        # The experiments are written through the diva.utils bindings as
+        # each video is prepared, on this thread, as the bindings aren't
+        # known to be thread-safe
+        start = time.time()
+        errors = []
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = {pool.submit(_timed, _prepare_experiment, args,
+                                   video_name, video_paths[video_name]):
+                       video_name for video_name in chunk_files}
+            for done, future in enumerate(as_completed(futures), 1):
+                video_name = futures[future]
+                try:
+                    imagelist_file_name, elapsed = future.result()
+                    elapsed += _timed(_write_experiment, args, video_name,
+                                      video_paths[video_name],
+                                      imagelist_file_name)[1]
+                    print("[{0}/{1}] {2}: OK ({3:.2f}s)".format(
+                        done, len(futures), video_name, elapsed), flush=True)
+                except Exception as e:
+                    print("[{0}/{1}] {2}: FAILED ({3})".format(
+                        done, len(futures), video_name, e), flush=True)
+                    errors.append(e)
+        print("Generated {0} of {1} experiments in {2:.2f}s".format(
+            len(chunk_files) - len(errors), len(chunk_files),
+            time.time() - start))
+        if len(errors) > 0:
+            raise errors[0]
     else:
         raise KeyError("Invalid chunk id {0} provided".format(args.chunk_id))
 
@@ -129,6 +201,13 @@ if __name__ == "__main__":
     parser.add_argument("--imagelist-root", help="Root folder where imagelist.txt would be stored")
     parser.add_argument("--use-videos", action='store_true',
             help="Flag to specify that videos instead of image folders are present in data-root")
+    parser.add_argument("--index-dir",
+            help="Directory to keep the compiled indexes of the chunk json "
+            "and file index in (default is next to each json file)")
+    parser.add_argument("--workers", type=int,
+            help="Number of threads to check the videos' data and write their "
+            "image lists with (default is set by Python's thread pool from "
+            "the number of CPUs)")
     parser.set_defaults(use_videos=False)
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,41 @@
+import os
+import re
+
+def frame_sort_key(name):
+    """
+    Sort key ordering file names by the numbers in them, so that frame_2
+    comes before frame_10 whether or not the frame numbers are padded
+    :param name: File name
+    :return List alternating the text and numbers of the name, and the name
+        (to order names such as frame_2 and frame_002 the same every time)
+    """
+    return ([int(part) if part.isdigit() else part
+             for part in re.split(r"(\d+)", name)],
+            name)
+
+def list_images(image_root):
+    """
+    List the images in a folder in frame order
+    :param image_root: Folder with images
+    :return List of the paths of the images
+    """
+    # (scandir gives the entry types without a stat per file)
+    image_names = [entry.name for entry in os.scandir(image_root)
+                   if not entry.is_dir()]
+    return [os.path.join(image_root, image_name)
+            for image_name in sorted(image_names, key=frame_sort_key)]
+
+def write_image_list(image_root, imagelist_root):
+    """
+    Write the paths of the images in a folder, in frame order, to the
+    folder's image list
+    :param image_root: Folder with images
+    :param imagelist_root: Root folder where the image list is written
+    :return Name of the image list file (<folder>_imagelist.txt)
+    """
+    imagelist_file_name = os.path.basename(image_root) + "_imagelist.txt"
+    image_paths = list_images(image_root)
+    # Written at once, rather than a write per frame
+    with open(os.path.join(imagelist_root, imagelist_file_name), "w") as f:
+        f.write("".join(image_path + "\n" for image_path in image_paths))
+    return imagelist_file_name
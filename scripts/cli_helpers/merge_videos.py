@@ -3,41 +3,111 @@
 import argparse
 import os
 import json
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-def merge_video_json( json_dict, video_json, current_activity_id ):
-    json_dict["filesProcessed"].extend(video_json["filesProcessed"])
-    for activity in video_json["activities"]:
-        activity["activityID"] += current_activity_id
-        json_dict["activities"].append(activity)
-    current_activity_id += len(video_json["activities"])
-    return json_dict, current_activity_id
+# (Run from the scripts.cli_helpers package, or as scripts installed
+# next to each other)
+if __package__:
+    from .chunk_index import JsonIndex
+    from .compressed_io import EXTENSIONS, existing_path, open_file
+else:
+    from chunk_index import JsonIndex
+    from compressed_io import EXTENSIONS, existing_path, open_file
+
+INDENT = "  "
+
+def load_video_json(video_root, video_name):
+    video_folder, _ = os.path.splitext(video_name)
+    json_path = existing_path(os.path.join(video_root,
+                                           video_folder + ".json"))
+    if not os.path.exists(json_path):
+        raise OSError("Not output found for {0}"\
+                .format(video_name))
+    with open_file(json_path, 'r') as f:
+        return json.load(f)
+
+def iter_video_jsons(video_root, video_names, workers=None):
+    """
+    Load the json file of each video, in the order of video_names
+    :param workers: Number of threads to read the files with (None or 1 to
+        read them one at a time)
+    """
+    if workers is None or workers <= 1:
+        for video_name in video_names:
+            yield load_video_json(video_root, video_name)
+        return
+
+    # Only a few files are read ahead of the one being merged, so memory
+    # doesn't grow with the number of videos
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for video_name in video_names:
+            pending.append(pool.submit(load_video_json, video_root,
+                                       video_name))
+            if len(pending) > 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _dumps(value, level):
+    # Serialized as json.dump(..., indent=2) would, nested 'level' deep
+    # (strings can't hold a newline, so every newline is formatting)
+    return json.dumps(value, indent=len(INDENT)).replace(
+        "\n", "\n" + INDENT * level)
+
+def write_merged_json(f, video_jsons, spool_dir=None):
+    """
+    Write the merge of video_jsons to f, as json.dump(..., indent=2) of the
+    whole chunk would, renumbering activityIDs to be unique in the chunk
+
+    Activities are written out as each video is read (to a temporary file
+    in spool_dir, as they follow the filesProcessed of every video), so
+    only one video's json is held at a time
+    """
+    files_processed = []
+    current_activity_id = 1
+    num_activities = 0
+    with tempfile.TemporaryFile('w+', encoding='utf-8',
+                                dir=spool_dir) as spool:
+        for video_json in video_jsons:
+            files_processed.extend(video_json["filesProcessed"])
+            for activity in video_json["activities"]:
+                activity["activityID"] += current_activity_id
+                spool.write(",\n" if num_activities > 0 else "\n")
+                spool.write(INDENT * 2 + _dumps(activity, 2))
+                num_activities += 1
+            current_activity_id += len(video_json["activities"])
+
+        f.write("{\n" + INDENT + '"filesProcessed": ' +
+                _dumps(files_processed, 1) + ",\n" +
+                INDENT + '"activities": [')
+        if num_activities > 0:
+            spool.seek(0)
+            shutil.copyfileobj(spool, f)
+            f.write("\n" + INDENT)
+        f.write("]\n}")
 
 def main(args):
     if not os.path.exists(args.chunk_json):
         raise OSError("Invalid path {0} provided for Chunk.json".format(args.chunk_json))
-    if not os.path.exists(args.chunk_json):
+    if not os.path.exists(args.video_root):
         raise OSError("Invalid path {0} provided for video_root"\
                 .format(args.video_root))
-    chunks = json.load(open(args.chunk_json, 'r'))
-    json_dict = { "filesProcessed": [],
-                  "activities": []
-                }
-    current_activity_id = 1
-    if args.chunk_id in chunks.keys():
+    chunks = JsonIndex(args.chunk_json, args.index_dir)
+    if args.chunk_id in chunks:
         chunk_files = chunks[args.chunk_id]["files"]
-        for video_name in chunk_files:
-            video_folder, _ = os.path.splitext(video_name)
-            json_path = os.path.join(args.video_root,
-                                        video_folder + ".json")
-            video_json = json.load(open(json_path, 'r'))
-            if not os.path.exists(json_path):
-                raise OSError("Not output found for {0}"\
-                        .format(video_name))
-            json_dict, current_activity_id = merge_video_json(json_dict, video_json,
-                                                               current_activity_id)
         chunk_file_name = args.chunk_id + ".json"
+        if args.compress is not None:
+            chunk_file_name += EXTENSIONS[args.compress]
         chunk_path = os.path.join(args.out_chunk_root, chunk_file_name)
-        json.dump(json_dict, open(chunk_path, 'w'), indent=2)
+        with open_file(chunk_path, 'w', threads=args.compress_threads) as f:
+            write_merged_json(f, iter_video_jsons(args.video_root,
+                                                  chunk_files,
+                                                  args.workers),
+                              spool_dir=args.out_chunk_root)
     else:
         raise KeyError("Invalid chunk id {0} provided".format(args.chunk_id))
 
@@ -50,5 +120,16 @@ if __name__ == "__main__":
             help="Root folder where json file for a video is saved")
     parser.add_argument("--out-chunk-root",
             help="Root folder where json file for a chunk is saved")
+    parser.add_argument("--index-dir",
+            help="Directory to keep the compiled index of the chunk json in "
+            "(default is next to the chunk json)")
+    parser.add_argument("--compress", choices=sorted(EXTENSIONS),
+            help="Compress the chunk json file (adding a .gz, .xz or .zst "
+            "extension); compressed input json files are read by extension")
+    parser.add_argument("--compress-threads", type=int, default=1,
+            help="Number of threads to compress with (0 for one per CPU)")
+    parser.add_argument("--workers", type=int, default=1,
+            help="Number of threads to read the video json files with "
+            "(the merged output is the same for any number)")
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+import unittest
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+import cache_manager  # noqa
+from cache_manager import CacheDirectory, parse_size  # noqa
+
+
+CHUNKS = {"c1": {"files": ["a.mp4", "b.mp4"]},
+          "c2": {"files": ["c.mp4"]}}
+
+
+class TestCacheDirectory(unittest.TestCase):
+    def setUp(self):
+        super(TestCacheDirectory, self).setUp()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.cache_dir = self.tmp_dir.name
+        self.chunk_json = self._path("chunks.json")
+        self._write("chunks.json", json.dumps(CHUNKS), age=0)
+        self._write("file-index.json", "{}", age=0)
+        self.now = time.time()
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _write(self, name, content, age):
+        # Writes a file last accessed 'age' seconds ago
+        with open(self._path(name), 'w') as of:
+            of.write(content)
+        t = time.time() - age
+        os.utime(self._path(name), (t, t))
+
+    def _write_video(self, stem, age, size=100):
+        self._write(stem + ".json", "j" * size, age)
+        self._write(stem + "_experiment.yml", "e" * 10, age)
+        self._write(stem + "_imagelist.txt", "i", age)
+
+    def _cache(self, **kwargs):
+        return CacheDirectory(self.cache_dir, CHUNKS,
+                              protected=[self.chunk_json,
+                                         self._path("file-index.json")],
+                              **kwargs)
+
+    def _remove(self, fn, *args):
+        # Returns the lines printed and the messages warned of
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), \
+                self.assertWarns(UserWarning) as warned:
+            fn(*args)
+        return (output.getvalue().splitlines(),
+                [str(w.message) for w in warned.warnings])
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("512"), 512)
+        self.assertEqual(parse_size("20M"), 20 << 20)
+        self.assertEqual(parse_size("1.5g"), 3 << 29)
+        self.assertEqual(parse_size("2 KiB"), 2048)
+        with self.assertRaises(ValueError):
+            parse_size("lots")
+
+    def test_entries(self):
+        self._write_video("a", age=30)
+        self._write("b.json.gz", "j" * 50, age=10)
+        self._write("c1.json", "c" * 1000, age=20)
+        # Not files of known videos or chunks
+        self._write("d.json", "?", age=100)
+        self._write("d_experiment.yml", "?", age=100)
+        self._write("c9.json", "?", age=100)
+        self._write("notes.txt", "?", age=100)
+        os.mkdir(self._path("c2.json"))
+
+        entries = self._cache().entries()
+        self.assertEqual([(e.name, e.kind, e.size) for e in entries],
+                         [("a", "video", 111),
+                          ("c1", "chunk", 1000),
+                          ("b", "video", 50)])
+        self.assertEqual(entries[0].paths,
+                         [self._path("a.json"),
+                          self._path("a_experiment.yml"),
+                          self._path("a_imagelist.txt")])
+        self.assertAlmostEqual(entries[0].last_access, self.now - 30,
+                               delta=5)
+
+    def test_protected(self):
+        # Files of a video or chunk that happen to be protected
+        chunks = dict(CHUNKS, chunks={"files": ["file-index.mp4"]})
+        cache = CacheDirectory(self.cache_dir, chunks,
+                               protected=[self.chunk_json,
+                                          self._path("file-index.json")])
+        self.assertEqual(cache.entries(), [])
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(cache.trim(max_entries=0), [])
+            self.assertEqual(cache.remove([self.chunk_json]), set())
+        self.assertTrue(os.path.exists(self.chunk_json))
+        self.assertTrue(os.path.exists(self._path("file-index.json")))
+
+    def test_trim(self):
+        self._write_video("a", age=40)
+        self._write_video("b", age=10)
+        self._write_video("c", age=30)
+        self._write("c1.json", "c" * 1000, age=20)
+        self._write("c2.json", "c" * 1000, age=50)
+
+        def trim(**kwargs):
+            with contextlib.redirect_stdout(io.StringIO()):
+                evicted = self._cache().trim(**kwargs)
+            return [e.name for e in evicted]
+
+        # Within budget
+        self.assertEqual(trim(max_bytes=10000, max_entries=5), [])
+
+        # Least recently used first, until within the entry budget
+        self.assertEqual(trim(max_entries=4, keep=["c2"]), ["a"])
+        self.assertFalse(os.path.exists(self._path("a.json")))
+        self.assertFalse(os.path.exists(self._path("a_imagelist.txt")))
+
+        # ... and the byte budget (of 2222 bytes)
+        self.assertEqual(trim(max_bytes=1200), ["c2", "c"])
+        self.assertEqual([e.name for e in self._cache().entries()],
+                         ["c1", "b"])
+
+        # Both
+        self.assertEqual(trim(max_bytes=2000, max_entries=1), ["c1"])
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         ["b.json", "b_experiment.yml", "b_imagelist.txt",
+                          "chunks.json", "file-index.json"])
+
+    def test_remove_videos(self):
+        self._write_video("a", age=0)
+        self._write("b.json.xz", "j", age=0)
+        self._write("b_experiment.yml", "e", age=0)
+        self._write_video("keep", age=0)
+
+        printed, warned = self._remove(
+            self._cache(workers=2).remove_videos, ["a.mp4", "b.mp4", "c.mp4"])
+        self.assertEqual(printed,
+                         ["Removing " + self._path(name) for name in
+                          ("a.json", "a_experiment.yml", "a_imagelist.txt",
+                           "b.json.xz", "b_experiment.yml")])
+        self.assertEqual(warned,
+                         [self._path("c.json") + " not found",
+                          self._path("c_experiment.yml") + " not found"])
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         ["chunks.json", "file-index.json", "keep.json",
+                          "keep_experiment.yml", "keep_imagelist.txt"])
+
+    def test_remove_chunks(self):
+        self._write("c1.json.gz", "c", age=0)
+
+        printed, warned = self._remove(self._cache().remove_chunks,
+                                       ["c1", "c2"])
+        self.assertEqual(printed, ["Removing " + self._path("c1.json.gz")])
+        self.assertEqual(warned, ["Json file associated with c2 not found "
+                                  "in " + self.cache_dir])
+
+    def test_batches(self):
+        # Enough files for several batches, on a pool of threads
+        batch_size = cache_manager.UNLINK_BATCH_SIZE
+        cache_manager.UNLINK_BATCH_SIZE = 4
+        self.addCleanup(setattr, cache_manager, 'UNLINK_BATCH_SIZE',
+                        batch_size)
+
+        names = ["f%02d" % i for i in range(30)]
+        for name in names:
+            self._write(name, "x", age=0)
+        paths = [self._path(name) for name in names]
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            removed = self._cache(workers=3).remove(
+                paths + [self._path("missing")])
+        self.assertEqual(removed, set(paths))
+        self.assertEqual(output.getvalue().splitlines(),
+                         ["Removing " + path for path in paths])
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         ["chunks.json", "file-index.json"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import unittest
+import gzip
+import json
+import os
+import sys
+import tempfile
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+from chunk_index import INDEX_SUFFIX, JsonIndex  # noqa
+
+
+CHUNKS = {"c2": {"files": ["b.mp4", "c.mp4"]},
+          "c1": {"files": ["a.mp4"]},
+          "c3": {"files": []}}
+
+
+class TestJsonIndex(unittest.TestCase):
+    def setUp(self):
+        super(TestJsonIndex, self).setUp()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.json_path = self._path("chunks.json")
+        self._write_json(self.json_path, CHUNKS)
+
+    def _path(self, *names):
+        return os.path.join(self.tmp_dir.name, *names)
+
+    def _write_json(self, path, value):
+        with open(path, 'w') as of:
+            json.dump(value, of)
+
+    def _index(self, json_path=None, index_dir=None):
+        index = JsonIndex(json_path or self.json_path, index_dir)
+        self.addCleanup(index.close)
+        return index
+
+    def test_lookup(self):
+        index = self._index()
+        self.assertEqual(index.index_path, self.json_path + INDEX_SUFFIX)
+        self.assertTrue(os.path.exists(index.index_path))
+
+        self.assertEqual(index["c2"], CHUNKS["c2"])
+        self.assertEqual(index.get("c1"), CHUNKS["c1"])
+        self.assertIsNone(index.get("c4"))
+        self.assertEqual(index.get("c4", {}), {})
+        with self.assertRaises(KeyError):
+            index["c4"]
+        self.assertIn("c3", index)
+        self.assertNotIn("c4", index)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.keys(), ["c2", "c1", "c3"])
+
+    def test_compressed(self):
+        gz_path = self._path("chunks.json.gz")
+        with gzip.open(gz_path, 'wt') as of:
+            json.dump(CHUNKS, of)
+        self.assertEqual(self._index(gz_path)["c2"], CHUNKS["c2"])
+
+    def test_reused_while_unchanged(self):
+        index_path = self._index().index_path
+        inode = os.stat(index_path).st_ino
+        self.assertEqual(self._index()["c1"], CHUNKS["c1"])
+        self.assertEqual(os.stat(index_path).st_ino, inode)
+
+    def test_rebuilt_on_change(self):
+        self._index()
+
+        # A change of size
+        self._write_json(self.json_path, {"c1": {"files": ["z.mp4"]},
+                                          "c5": {"files": []}})
+        index = self._index()
+        self.assertEqual(index["c1"], {"files": ["z.mp4"]})
+        self.assertEqual(index.keys(), ["c1", "c5"])
+
+        # A change of mtime alone (the index is only stale once it
+        # changes)
+        st = os.stat(self.json_path)
+        self._write_json(self.json_path, {"c1": {"files": ["y.mp4"]},
+                                          "c5": {"files": []}})
+        os.utime(self.json_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(self._index()["c1"], {"files": ["z.mp4"]})
+        os.utime(self.json_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+        self.assertEqual(self._index()["c1"], {"files": ["y.mp4"]})
+
+    def test_rebuilt_if_corrupt(self):
+        with open(self.json_path + INDEX_SUFFIX, 'w') as of:
+            of.write("not an index")
+        self.assertEqual(self._index()["c2"], CHUNKS["c2"])
+
+    def test_index_dir(self):
+        # JSON files of the same name have their own index
+        other_path = self._path("other", "chunks.json")
+        os.mkdir(self._path("other"))
+        self._write_json(other_path, {"c9": {"files": []}})
+        index_dir = self._path("indexes")
+
+        index = self._index(index_dir=index_dir)
+        other_index = self._index(other_path, index_dir)
+        self.assertEqual(os.path.dirname(index.index_path), index_dir)
+        self.assertTrue(os.path.basename(index.index_path).startswith(
+            "chunks.json."))
+        self.assertNotEqual(index.index_path, other_index.index_path)
+        self.assertEqual(sorted(os.listdir(index_dir)),
+                         sorted([os.path.basename(index.index_path),
+                                 os.path.basename(other_index.index_path)]))
+        self.assertFalse(os.path.exists(self.json_path + INDEX_SUFFIX))
+
+        self.assertEqual(index.keys(), ["c2", "c1", "c3"])
+        self.assertEqual(other_index.keys(), ["c9"])
+
+    def test_in_memory_fallback(self):
+        # (A directory that can't be created, even by root)
+        index_dir = self._path("chunks.json", "indexes")
+        with self.assertWarns(UserWarning):
+            index = self._index(index_dir=index_dir)
+        self.assertEqual(index["c2"], CHUNKS["c2"])
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)),
+                         ["chunks.json"])
+
+
+if __name__ == '__main__':
+    unittest.main()
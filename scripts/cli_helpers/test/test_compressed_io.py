@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import unittest
+import gzip
+import lzma
+import os
+import sys
+import tempfile
+
+import pytest
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+import compressed_io  # noqa
+from compressed_io import (open_file,  # noqa
+                           compression_of,
+                           existing_path,
+                           strip_compression,
+                           with_compression)
+
+
+class TestCompressedIO(unittest.TestCase):
+    def setUp(self):
+        super(TestCompressedIO, self).setUp()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.text = "".join("- { geom: { id0: %d, id1: 1, ts0: %d } }\n" %
+                            (i, i) for i in range(5000))
+
+    def _path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_compression_of(self):
+        self.assertEqual(compression_of("a.geom.yml.gz"), 'gz')
+        self.assertEqual(compression_of("a.kw18.XZ"), 'xz')
+        self.assertEqual(compression_of("a.json.zst"), 'zst')
+        self.assertIsNone(compression_of("a.geom.yml"))
+        self.assertEqual(strip_compression("a.json.gz"), "a.json")
+        self.assertEqual(strip_compression("a.json"), "a.json")
+        self.assertEqual(with_compression("a.kw18", 'xz'), "a.kw18.xz")
+        self.assertEqual(with_compression("a.kw18", None), "a.kw18")
+
+    def test_round_trip(self):
+        for ext in ("", ".gz", ".xz"):
+            for threads in (1, 3):
+                with self.subTest(ext=ext, threads=threads):
+                    path = self._path("out%d.yml%s" % (threads, ext))
+                    with open_file(path, 'w', threads=threads) as of:
+                        of.write(self.text)
+
+                    with open_file(path) as inf:
+                        self.assertEqual(inf.read(), self.text)
+
+    def test_multithreaded_blocks(self):
+        # Written as several blocks, which the standard decompressors
+        # read as one file
+        block_size = compressed_io.BLOCK_SIZE
+        compressed_io.BLOCK_SIZE = 1000
+        self.addCleanup(setattr, compressed_io, 'BLOCK_SIZE', block_size)
+
+        for ext, decompress in ((".gz", gzip.decompress),
+                                (".xz", lzma.decompress)):
+            with self.subTest(ext=ext):
+                path = self._path("blocks.yml" + ext)
+                with open_file(path, 'w', threads=4) as of:
+                    of.write(self.text)
+
+                with open(path, 'rb') as inf:
+                    self.assertEqual(decompress(inf.read()).decode('utf-8'),
+                                     self.text)
+
+    def test_empty(self):
+        for ext in (".gz", ".xz"):
+            path = self._path("empty.yml" + ext)
+            with open_file(path, 'w', threads=2):
+                pass
+
+            with open_file(path) as inf:
+                self.assertEqual(inf.read(), "")
+
+    def test_existing_path(self):
+        path = self._path("video.json")
+        self.assertEqual(existing_path(path), path)
+        with open_file(path + ".xz", 'w') as of:
+            of.write("{}")
+        self.assertEqual(existing_path(path), path + ".xz")
+
+    def test_zstd(self):
+        zstandard = pytest.importorskip('zstandard')
+
+        # Enough for zstandard to compress on several threads
+        text = self.text * 20
+        for threads in (1, 3):
+            with self.subTest(threads=threads):
+                path = self._path("out%d.yml.zst" % threads)
+                with open_file(path, 'w', threads=threads) as of:
+                    of.write(text)
+
+                with open_file(path) as inf:
+                    self.assertEqual(inf.read(), text)
+                with open(path, 'rb') as inf:
+                    self.assertEqual(
+                        zstandard.ZstdDecompressor().stream_reader(
+                            inf, read_across_frames=True).read(),
+                        text.encode('utf-8'))
+
+        # Several frames (e.g. of appended output) are read as one file
+        path = self._path("frames.yml.zst")
+        with open(path, 'wb') as of:
+            for part in (self.text[:1000], self.text[1000:]):
+                of.write(zstandard.ZstdCompressor().compress(
+                    part.encode('utf-8')))
+        with open_file(path) as inf:
+            self.assertEqual(inf.read(), self.text)
+
+        path = self._path("empty.yml.zst")
+        with open_file(path, 'w', threads=2):
+            pass
+        with open_file(path) as inf:
+            self.assertEqual(inf.read(), "")
+
+    @unittest.skipIf(compressed_io.zstandard is not None,
+                     "zstandard is installed")
+    def test_zstd_missing(self):
+        with self.assertRaises(ImportError):
+            open_file(self._path("out.yml.zst"), 'w')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import unittest
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+
+class TestGenerateExperiments(unittest.TestCase):
+    def setUp(self):
+        super(TestGenerateExperiments, self).setUp()
+
+        # (The diva.utils bindings are only available in a full build)
+        pytest.importorskip("diva.utils")
+        import generate_experiments
+        self.generate_experiments = generate_experiments
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.data_root = self._path("data")
+        self.frames = {"v1": ["frame_10.png", "frame_2.png", "frame_1.png"],
+                       "v2": ["img_0002.jpg", "img_0001.jpg"],
+                       "v3": []}
+        for video, frames in self.frames.items():
+            os.makedirs(os.path.join(self.data_root, video))
+            for frame in frames:
+                open(os.path.join(self.data_root, video, frame), 'w').close()
+
+        self.chunk_json = self._path("chunks.json")
+        self.file_index = self._path("file-index.json")
+        with open(self.chunk_json, 'w') as of:
+            json.dump({"c1": {"files": ["v1.mp4", "v2.mp4", "v3.mp4"]},
+                       "c2": {"files": ["v1.mp4", "v4.mp4"]}}, of)
+        with open(self.file_index, 'w') as of:
+            json.dump({video + ".mp4": {"filename": video + ".mp4"}
+                       for video in ("v1", "v2", "v3", "v4")}, of)
+
+    def _path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def _main(self, chunk_id, workers):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.generate_experiments.main(argparse.Namespace(
+                chunk_id=chunk_id,
+                chunk_json=self.chunk_json,
+                file_index=self.file_index,
+                data_root=self.data_root,
+                experiment_root=self._path("experiments"),
+                imagelist_root=self._path("imagelists"),
+                use_videos=False,
+                index_dir=None,
+                workers=workers))
+        return output.getvalue().splitlines()
+
+    def test_images(self):
+        for workers in (1, 3):
+            with self.subTest(workers=workers):
+                printed = self._main("c1", workers)
+                self.assertEqual(printed[-1][:len("Generated 3 of 3")],
+                                 "Generated 3 of 3")
+                for video, frames in (("v1", ["frame_1.png", "frame_2.png",
+                                              "frame_10.png"]),
+                                      ("v2", ["img_0001.jpg",
+                                              "img_0002.jpg"]),
+                                      ("v3", [])):
+                    self.assertTrue(os.path.exists(os.path.join(
+                        self._path("experiments"),
+                        video + "_experiment.yml")))
+                    with open(os.path.join(self._path("imagelists"),
+                                           video + "_imagelist.txt")) as f:
+                        self.assertEqual(
+                            f.read().splitlines(),
+                            [os.path.join(self.data_root, video, frame)
+                             for frame in frames])
+
+    def test_missing_video(self):
+        # The other videos are still generated
+        with self.assertRaises(OSError):
+            self._main("c2", 2)
+        self.assertTrue(os.path.exists(os.path.join(
+            self._path("experiments"), "v1_experiment.yml")))
+
+
+if __name__ == '__main__':
+    unittest.main()
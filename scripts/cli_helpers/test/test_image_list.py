@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import sys
+import tempfile
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+from image_list import frame_sort_key, list_images, write_image_list  # noqa
+
+
+class TestImageList(unittest.TestCase):
+    def setUp(self):
+        super(TestImageList, self).setUp()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def test_frame_sort_key(self):
+        names = ["frame_10.png", "frame_2.png", "frame_1.png",
+                 "frame_002.jpg", "frame_2.jpg", "frame_0100.png",
+                 "frame_11.jpg", "frame.png", "other_3.png", "frame_2a.png"]
+        expected = ["frame.png", "frame_1.png", "frame_002.jpg",
+                    "frame_2.jpg", "frame_2.png", "frame_2a.png",
+                    "frame_10.png", "frame_11.jpg", "frame_0100.png",
+                    "other_3.png"]
+        self.assertEqual(sorted(names, key=frame_sort_key), expected)
+        # (The same whatever the order listed in)
+        self.assertEqual(sorted(reversed(names), key=frame_sort_key),
+                         expected)
+
+        self.assertLess(frame_sort_key("frame_2.png"),
+                        frame_sort_key("frame_10.png"))
+        self.assertLess(frame_sort_key("1.png"), frame_sort_key("a.png"))
+
+    def test_list_images(self):
+        image_root = os.path.join(self.tmp_dir.name, "video")
+        os.makedirs(os.path.join(image_root, "frame_5"))
+        names = ["frame_9.jpg", "frame_10.jpg", "frame_8.png"]
+        for name in names:
+            open(os.path.join(image_root, name), 'w').close()
+
+        image_paths = [os.path.join(image_root, name)
+                       for name in ("frame_8.png", "frame_9.jpg",
+                                    "frame_10.jpg")]
+        self.assertEqual(list_images(image_root), image_paths)
+
+        self.assertEqual(write_image_list(image_root, self.tmp_dir.name),
+                         "video_imagelist.txt")
+        with open(os.path.join(self.tmp_dir.name,
+                               "video_imagelist.txt")) as f:
+            self.assertEqual(f.read().splitlines(), image_paths)
+
+        empty_root = os.path.join(self.tmp_dir.name, "empty")
+        os.mkdir(empty_root)
+        write_image_list(empty_root, self.tmp_dir.name)
+        with open(os.path.join(self.tmp_dir.name,
+                               "empty_imagelist.txt")) as f:
+            self.assertEqual(f.read(), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
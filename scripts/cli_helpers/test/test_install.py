@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import unittest
+import importlib.util
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+source_dir = os.path.join(script_dir, os.pardir, os.pardir)
+
+
+def _installed_scripts():
+    # Files of the cli_helpers that setup.py installs as scripts
+    with open(os.path.join(source_dir, "python", "setup.py")) as f:
+        return re.findall(r"/scripts/cli_helpers/(\w+\.py)'", f.read())
+
+
+def _package_modules():
+    # Modules of the cli_helpers that CMake installs in the
+    # scripts.cli_helpers package
+    with open(os.path.join(script_dir, "CMakeLists.txt")) as f:
+        return re.findall(r"kwiver_add_python_module\(\s*\S+/(\w+)\.py\s+"
+                          r"scripts/cli_helpers\s", f.read())
+
+
+def _source(name):
+    with open(os.path.join(script_dir, name)) as f:
+        return f.read()
+
+
+def _needs_diva(name):
+    # (diva.utils is only available in a full build)
+    return ("import diva" in _source(name) and
+            importlib.util.find_spec("diva") is None)
+
+
+class TestInstall(unittest.TestCase):
+    def setUp(self):
+        super(TestInstall, self).setUp()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        # Run away from the source directories
+        self.env = dict(os.environ, PYTHONPATH="")
+        self.cwd = os.path.join(self.tmp_dir.name, "cwd")
+        os.mkdir(self.cwd)
+
+    def _run(self, argv):
+        return subprocess.run([sys.executable] + argv,
+                              cwd=self.cwd,
+                              env=self.env,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE,
+                              universal_newlines=True)
+
+    def _copy(self, names, dest_dir):
+        os.makedirs(dest_dir)
+        for name in names:
+            shutil.copy(os.path.join(script_dir, name), dest_dir)
+
+    def test_setup_scripts(self):
+        # Every module the scripts import is installed next to them
+        names = _installed_scripts()
+        self.assertIn("merge_videos.py", names)
+        bin_dir = os.path.join(self.tmp_dir.name, "bin")
+        self._copy(names, bin_dir)
+
+        for name in names:
+            if ("__main__" not in _source(name) or
+                    _needs_diva(name)):
+                continue
+            with self.subTest(script=name):
+                result = self._run([os.path.join(bin_dir, name), "--help"])
+                self.assertEqual(result.returncode, 0, result.stderr)
+                self.assertIn("usage:", result.stdout)
+
+    def test_package_modules(self):
+        names = _package_modules()
+        self.assertIn("merge_videos", names)
+        package_dir = os.path.join(self.cwd, "scripts", "cli_helpers")
+        self._copy([name + ".py" for name in names], package_dir)
+        for init_dir in (os.path.dirname(package_dir), package_dir):
+            open(os.path.join(init_dir, "__init__.py"), 'w').close()
+
+        for name in names:
+            if _needs_diva(name + ".py"):
+                continue
+            with self.subTest(module=name):
+                result = self._run(["-c",
+                                    "import scripts.cli_helpers." + name])
+                self.assertEqual(result.returncode, 0, result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import unittest
+import argparse
+import copy
+import gzip
+import json
+import os
+import sys
+import tempfile
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+from compressed_io import open_file  # noqa
+from merge_videos import main, write_merged_json  # noqa
+
+
+def _activity(activity_id, frames):
+    return {"activity": "Closing",
+            "activityID": activity_id,
+            "presenceConf": 0.75,
+            "alertFrame": frames[0],
+            "localization": {"video.mp4": {str(frames[0]): 1,
+                                           str(frames[1]): 0}},
+            "objects": [{"objectType": "Person", "objectID": 3,
+                         "name": "café \"door\""}]}
+
+
+VIDEO_JSONS = {
+    "a": {"filesProcessed": ["a.mp4"],
+          "activities": [_activity(0, (10, 20)), _activity(1, (5, 9))]},
+    # Nothing found
+    "b": {"filesProcessed": [], "activities": []},
+    "c": {"filesProcessed": ["c.mp4"],
+          "activities": [_activity(0, (1, 2))]},
+    "d": {"filesProcessed": ["d.mp4", "d2.mp4"],
+          "activities": [_activity(4, (7, 8))]},
+}
+
+
+def _merged(video_jsons):
+    # The merge as it was done in memory, before being streamed
+    merged = {"filesProcessed": [], "activities": []}
+    current_activity_id = 1
+    for video_json in copy.deepcopy(video_jsons):
+        merged["filesProcessed"].extend(video_json["filesProcessed"])
+        for activity in video_json["activities"]:
+            activity["activityID"] += current_activity_id
+            merged["activities"].append(activity)
+        current_activity_id += len(video_json["activities"])
+    return json.dumps(merged, indent=2)
+
+
+class TestMergeVideos(unittest.TestCase):
+    def setUp(self):
+        super(TestMergeVideos, self).setUp()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.video_root = self._path("videos")
+        self.out_root = self._path("out")
+        os.mkdir(self.video_root)
+        os.mkdir(self.out_root)
+
+        for name, video_json in VIDEO_JSONS.items():
+            path = os.path.join(self.video_root, name + ".json")
+            if name == "c":
+                with gzip.open(path + ".gz", 'wt') as of:
+                    json.dump(video_json, of)
+            else:
+                with open(path, 'w') as of:
+                    json.dump(video_json, of)
+
+        self.chunk_json = self._path("chunks.json")
+        with open(self.chunk_json, 'w') as of:
+            json.dump({"all": {"files": ["a.mp4", "b.mp4", "c.mp4",
+                                         "d.mp4"]},
+                       "empty": {"files": ["b.mp4"]},
+                       "missing": {"files": ["a.mp4", "e.mp4"]}}, of)
+
+    def _path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def _main(self, chunk_id, compress=None, workers=1):
+        main(argparse.Namespace(chunk_id=chunk_id,
+                                chunk_json=self.chunk_json,
+                                video_root=self.video_root,
+                                out_chunk_root=self.out_root,
+                                index_dir=None,
+                                compress=compress,
+                                compress_threads=1,
+                                workers=workers))
+
+    def _read(self, name):
+        with open_file(os.path.join(self.out_root, name)) as f:
+            return f.read()
+
+    def test_write_merged_json(self):
+        for names in (["a", "b", "c", "d"], ["b"], ["b", "a"], []):
+            with self.subTest(names=names):
+                video_jsons = [VIDEO_JSONS[name] for name in names]
+                expected = _merged(video_jsons)
+                with tempfile.TemporaryFile('w+') as f:
+                    write_merged_json(f, copy.deepcopy(video_jsons))
+                    f.seek(0)
+                    merged = f.read()
+                self.assertEqual(merged, expected)
+                self.assertEqual(json.loads(merged), json.loads(expected))
+
+    def test_main(self):
+        expected = _merged([VIDEO_JSONS[name] for name in "abcd"])
+        for workers in (1, 3):
+            with self.subTest(workers=workers):
+                self._main("all", workers=workers)
+                self.assertEqual(self._read("all.json"), expected)
+
+        self._main("all", compress='xz')
+        self.assertEqual(self._read("all.json.xz"), expected)
+
+        self._main("empty")
+        self.assertEqual(json.loads(self._read("empty.json")),
+                         {"filesProcessed": [], "activities": []})
+        # (Only the merged json files, the spool files are gone)
+        self.assertEqual(sorted(os.listdir(self.out_root)),
+                         ["all.json", "all.json.xz", "empty.json"])
+
+    def test_missing_video(self):
+        with self.assertRaises(OSError):
+            self._main("missing")
+        with self.assertRaises(KeyError):
+            self._main("none")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from functools import reduce
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+import eo_to_ir  # noqa
+from lib.camera_io import load_camera_krtd_file  # noqa
+from lib.geom_table import GeomTable  # noqa
+from lib.homography import (load_homography_file,  # noqa
+                            apply_homography,
+                            apply_homography_batch)
+from lib.kpf_writer import KPFWriter  # noqa
+from lib.profiling import StageProfiler  # noqa
+from lib.transduce import appender, chunks  # noqa
+from lib.utils import (load_yaml_list,  # noqa
+                       parse_activities_yaml,
+                       parse_geom_yaml,
+                       dump_geoms_as_kw18)
+from lib.view import view_to_view, view_to_view_batch  # noqa
+from synthetic_kpf import generate_synthetic_kpf  # noqa
+
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+
+
+def benchmark_clip(clip, work_dir, per_box_sample):
+    """Time each stage of eo_to_ir on a clip (from generate_synthetic_kpf),
+    returning the profiler's report"""
+    profiler = StageProfiler()
+
+    with profiler.stage("load_yaml_list") as stage:
+        stage.add_records(records_out=len(load_yaml_list(clip['geom'])))
+
+    with profiler.stage("parse_geom_yaml") as stage:
+        _, geom_table = parse_geom_yaml(clip['geom'])
+        stage.add_records(records_out=len(geom_table))
+
+    _, activity_records, _ = parse_activities_yaml(clip['activities'])
+    homography = load_homography_file(clip['homography'])
+    src_cam = load_camera_krtd_file(clip['src_camera'])
+    dest_cam = load_camera_krtd_file(clip['dest_camera'])
+
+    # The per-box functions are timed over a sample of the boxes
+    sample = geom_table.bounds[:per_box_sample].tolist()
+    with profiler.stage("apply_homography", records_in=len(sample)):
+        for bounds in sample:
+            apply_homography(homography, bounds)
+
+    with profiler.stage("apply_homography_batch",
+                        records_in=len(geom_table)):
+        apply_homography_batch(homography, geom_table.bounds)
+
+    # (Quietly, as it warns of each box that can't be transferred)
+    with profiler.stage("view_to_view", records_in=len(sample)), \
+            contextlib.redirect_stdout(io.StringIO()):
+        for bounds in sample:
+            view_to_view(src_cam, dest_cam, bounds)
+
+    with profiler.stage("view_to_view_batch", records_in=len(geom_table)):
+        view_to_view_batch(src_cam, dest_cam, geom_table.bounds)
+
+    # The geom pipeline as eo_to_ir builds it (with its steps profiled
+    # as geom.*)
+    args = eo_to_ir.build_arg_parser().parse_args(
+        ["-g", clip['geom'],
+         "-a", clip['activities'],
+         "-t", clip['types'],
+         "-p", "benchmark",
+         "-o", work_dir,
+         "-H", clip['homography'],
+         "-b", "1920x1080",
+         "-f", "5",
+         "--min-spatial-overlap", "0.5"])
+    geom_pipeline, activity_pipeline = eo_to_ir._build_pipelines(args,
+                                                                 profiler)
+    with profiler.stage("transduce_pipeline",
+                        records_in=len(geom_table)) as stage:
+        out_tables = reduce(geom_pipeline(appender),
+                            chunks(geom_table, eo_to_ir.GEOM_CHUNK_SIZE),
+                            [])
+        out_table = GeomTable.concatenate(out_tables).dedup_ts0()
+        stage.add_records(records_out=len(out_table))
+
+    with profiler.stage("timespan_adjuster",
+                        records_in=len(activity_records)) as stage:
+        out_activities = reduce(
+            activity_pipeline(
+                eo_to_ir._build_activity_timespan_adjuster(out_table)),
+            activity_records,
+            [])
+        stage.add_records(records_out=len(out_activities))
+
+    with profiler.stage("write_activities",
+                        records_out=len(out_activities)), \
+            KPFWriter(os.path.join(work_dir, "activities.yml")) as writer:
+        for activity_rec in out_activities:
+            writer.write_activity(activity_rec)
+
+    with profiler.stage("write_geom", records_out=len(out_table)), \
+            KPFWriter(os.path.join(work_dir, "geom.yml")) as writer:
+        writer.write_geom_table(out_table)
+
+    num_frames_per_actor = {
+        actor_id: eo_to_ir._num_track_frames(
+            int(out_table.ts0[start:end].min()),
+            int(out_table.ts0[start:end].max()))
+        for actor_id, start, end in out_table.iter_actor_slices()
+        if end > start}
+    with profiler.stage("write_kw18", records_out=len(out_table)):
+        dump_geoms_as_kw18(out_table,
+                           num_frames_per_actor,
+                           os.path.join(work_dir, "geom.kw18"))
+
+    return profiler.report()
+
+
+def _add_rates(report):
+    for stage in report['stages']:
+        records = stage.get('records_in', stage.get('records_out'))
+        if records is not None and stage['wall_time'] > 0:
+            stage['records_per_second'] = records / stage['wall_time']
+
+
+def compare(results, baseline):
+    # Print the ratio of baseline to current wall time for each stage at
+    # each size in both
+    baseline_stages = {
+        (r['num_boxes'], s['name']): s
+        for r in baseline['results'] for s in r['stages']}
+    for result in results['results']:
+        print(f"{result['num_boxes']} boxes:")
+        for stage in result['stages']:
+            base = baseline_stages.get((result['num_boxes'], stage['name']))
+            if base is None or stage['wall_time'] <= 0:
+                continue
+            print(f"  {stage['name']:<32} {base['wall_time']:10.4f}s -> "
+                  f"{stage['wall_time']:10.4f}s "
+                  f"({base['wall_time'] / stage['wall_time']:.2f}x)")
+
+
+def main(args):
+    sizes = [int(s) for s in args.sizes.split(',')]
+    results = {'created': datetime.datetime.now().isoformat(),
+               'environment': {'python': platform.python_version(),
+                               'numpy': np.__version__,
+                               'platform': platform.platform(),
+                               'cpu_count': os.cpu_count()},
+               'config': {'sizes': sizes,
+                          'track_length': args.track_length,
+                          'activity_density': args.activity_density,
+                          'per_box_sample': args.per_box_sample,
+                          'seed': args.seed},
+               'results': []}
+
+    with tempfile.TemporaryDirectory(prefix="eo_to_ir_benchmark_") as tmp:
+        data_dir = args.data_dir or tmp
+        for num_boxes in sizes:
+            clip_dir = os.path.join(data_dir, str(num_boxes))
+            start = time.perf_counter()
+            clip = generate_synthetic_kpf(
+                clip_dir,
+                num_boxes,
+                track_length=args.track_length,
+                activity_density=args.activity_density,
+                seed=args.seed)
+            generate_time = time.perf_counter() - start
+
+            work_dir = os.path.join(tmp, "work_%d" % num_boxes)
+            os.makedirs(work_dir)
+            report = benchmark_clip(clip, work_dir, args.per_box_sample)
+            _add_rates(report)
+            results['results'].append({
+                'num_boxes': num_boxes,
+                'num_actors': clip['num_actors'],
+                'num_activities': clip['num_activities'],
+                'generate_time': generate_time,
+                **report})
+
+            print(f"{num_boxes} boxes:")
+            for stage in report['stages']:
+                print(f"  {stage['name']:<32} {stage['wall_time']:10.4f}s")
+
+    with open(args.output, 'w') as of:
+        json.dump(results, of, indent=2)
+        of.write('\n')
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as inf:
+            compare(results, json.load(inf))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the stages of eo_to_ir (parsing, homography, "
+        "camera transfer, the geom pipeline, timespan adjustment and the "
+        "writers) on synthetic clips of increasing size, writing the "
+        "results as JSON")
+    parser.add_argument("-o", "--output",
+                        type=str,
+                        default="benchmark_results.json",
+                        help="Output JSON path (default is "
+                        "benchmark_results.json)")
+    parser.add_argument("--sizes",
+                        type=str,
+                        default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated numbers of boxes to benchmark "
+                        "(default is %(default)s)")
+    parser.add_argument("--track-length",
+                        type=int,
+                        default=300,
+                        help="Mean actor track length in frames (default "
+                        "is 300)")
+    parser.add_argument("--activity-density",
+                        type=float,
+                        default=0.5,
+                        help="Number of activities per actor (default is "
+                        "0.5)")
+    parser.add_argument("--per-box-sample",
+                        type=int,
+                        default=10000,
+                        help="Number of boxes to time the per-box "
+                        "apply_homography and view_to_view on (default is "
+                        "10000)")
+    parser.add_argument("--data-dir",
+                        type=str,
+                        help="Directory to keep the generated clips in "
+                        "(default is a temporary directory)")
+    parser.add_argument("--baseline",
+                        type=str,
+                        help="Results JSON of an earlier run to compare "
+                        "against")
+    parser.add_argument("-s", "--seed",
+                        type=int,
+                        default=0,
+                        help="Random seed (default is 0)")
+
+    main(parser.parse_args())
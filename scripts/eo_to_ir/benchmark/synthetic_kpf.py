@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+from lib.camera_io import Camera, write_camera_krtd_file  # noqa
+
+
+ACTIVITY_NAMES = ("Casing_Facility",
+                  "Exit_Facility",
+                  "Enter_Facility",
+                  "Talking",
+                  "Transport_HeavyCarry")
+
+ACTOR_TYPES = ("Person", "Vehicle")
+
+# Geom lines are formatted this many at a time
+_LINES_PER_BLOCK = 65536
+
+_GEOM_TEMPLATE = ("- { geom: { id0: %d, id1: %d, ts0: %d, ts1: %.6g, "
+                  "g0: %.6g %.6g %.6g %.6g, src: truth,  } }\n")
+
+
+def _camera(rng, yaw, x):
+    # A camera 15 units up, looking down (and across) the ground plane
+    f = 1000.0
+    K = [[f, 0, 960], [0, f, 540], [0, 0, 1]]
+    pitch = np.radians(rng.uniform(110, 140))
+    Rx = np.array([[1, 0, 0],
+                   [0, np.cos(pitch), -np.sin(pitch)],
+                   [0, np.sin(pitch), np.cos(pitch)]])
+    Rz = np.array([[np.cos(yaw), -np.sin(yaw), 0],
+                   [np.sin(yaw), np.cos(yaw), 0],
+                   [0, 0, 1]])
+    R = np.matmul(Rx, Rz)
+    t = -np.matmul(R, [x, -30.0, 15.0])
+    return Camera(K, R, t, [0, 0, 0, 0, 0])
+
+
+def _actor_tracks(rng, num_boxes, track_length, num_frames):
+    # Track lengths around 'track_length' (summing to 'num_boxes'), and
+    # the start frame of each
+    num_actors = max(1, int(round(num_boxes / float(track_length))))
+    lengths = np.maximum(
+        1, rng.normal(track_length, track_length / 4.0,
+                      num_actors)).astype(np.int64)
+    # Adjust to the exact total, a box at a time from the longest
+    diff = num_boxes - int(lengths.sum())
+    order = np.argsort(-lengths, kind='stable')
+    while diff != 0:
+        step = 1 if diff > 0 else -1
+        for i in order.tolist():
+            if diff == 0:
+                break
+            if lengths[i] + step >= 1:
+                lengths[i] += step
+                diff -= step
+
+    starts = rng.integers(0, np.maximum(num_frames - lengths, 0) + 1)
+    return lengths, starts
+
+
+def _write_geoms(path, rng, lengths, starts, frame_size, framerate):
+    num_boxes = int(lengths.sum())
+    actor_ids = np.repeat(np.arange(1, len(lengths) + 1), lengths)
+    offsets = np.arange(num_boxes) - np.repeat(np.cumsum(lengths) - lengths,
+                                               lengths)
+    ts0 = np.repeat(starts, lengths) + offsets
+
+    # Each actor is a random walk from a random point, with a fixed box
+    # size; some walk (partly) out of frame
+    width, height = frame_size
+    sizes = np.repeat(rng.uniform([10, 20], [120, 160], (len(lengths), 2)),
+                      lengths, axis=0)
+    steps = rng.normal(0, 2.0, (num_boxes, 2))
+    steps[offsets == 0] = rng.uniform([0, 0], [width, height],
+                                      (len(lengths), 2))
+    first = np.cumsum(lengths) - lengths
+    walk = np.cumsum(steps, axis=0)
+    origin = np.repeat(walk[first] - steps[first], lengths, axis=0)
+    corner = np.round(walk - origin, 3)
+    bounds = np.concatenate((corner, np.round(corner + sizes, 3)), axis=1)
+
+    # Geoms are written in frame order, as the actors interleave
+    order = np.lexsort((actor_ids, ts0))
+    columns = np.column_stack((np.arange(1, num_boxes + 1),
+                               actor_ids[order],
+                               ts0[order],
+                               ts0[order] / framerate,
+                               bounds[order]))
+
+    with open(path, 'w') as of:
+        of.write("- { meta: { team: Kitware,  } }\n")
+        for start in range(0, num_boxes, _LINES_PER_BLOCK):
+            block = columns[start:start + _LINES_PER_BLOCK]
+            of.write((_GEOM_TEMPLATE * len(block)) %
+                     tuple(block.ravel().tolist()))
+
+
+def _write_activities(path, rng, lengths, starts, activity_density,
+                      max_actors_per_activity):
+    num_actors = len(lengths)
+    num_activities = int(round(activity_density * num_actors))
+    names = rng.choice(len(ACTIVITY_NAMES), num_activities)
+
+    lines = []
+    for id2, name in enumerate(names.tolist(), 1):
+        k = int(rng.integers(1, min(max_actors_per_activity,
+                                    num_actors) + 1))
+        members = np.sort(rng.choice(num_actors, k, replace=False))
+        actor_spans = []
+        for m in members.tolist():
+            # A random sub-span of the actor's track
+            s = int(starts[m])
+            e = s + int(lengths[m]) - 1
+            s, e = sorted(rng.integers(s, e + 1, 2).tolist())
+            actor_spans.append((m + 1, s, e))
+
+        act_s = min(s for _, s, _ in actor_spans)
+        act_e = max(e for _, _, e in actor_spans)
+        actors = ", ".join(
+            f"{{ id1: {m}, timespan: [{{ tsr0: [{s} , {e}],  }}],  }}"
+            for m, s, e in actor_spans)
+        lines.append(f"- {{ act: {{ act2: {{ {ACTIVITY_NAMES[name]}: 1, }}, "
+                     f"id2: {id2}, timespan: [{{ tsr0: [{act_s} , {act_e}], "
+                     f" }}], src_status: refiner_agreement, actors: "
+                     f"[ {actors}, ],  }} }}\n")
+
+    with open(path, 'w') as of:
+        of.write("- { meta: { team: Kitware,  } }\n")
+        counts = np.bincount(names, minlength=len(ACTIVITY_NAMES))
+        for name, count in zip(ACTIVITY_NAMES, counts.tolist()):
+            if count > 0:
+                of.write(f"- {{ meta: {name} {count} instances }}\n")
+        of.writelines(lines)
+
+    return num_activities
+
+
+def _write_types(path, rng, num_actors):
+    types = rng.choice(len(ACTOR_TYPES), num_actors)
+    with open(path, 'w') as of:
+        of.write("- { meta: { team: Kitware,  } }\n")
+        for id1, t in enumerate(types.tolist(), 1):
+            of.write(f"- {{ types: {{ cset3: {{ {ACTOR_TYPES[t]}: 1.0 }}, "
+                     f"id1: {id1} }} }}\n")
+
+
+def generate_synthetic_kpf(out_dir,
+                           num_boxes,
+                           prefix="synthetic",
+                           track_length=300,
+                           activity_density=0.5,
+                           max_actors_per_activity=3,
+                           num_frames=9000,
+                           frame_size=(1920, 1080),
+                           framerate=30.0,
+                           seed=0):
+    """Write a synthetic clip of KPF geom, activity and types files (plus
+    a homography and a pair of KRTD cameras for the clip) to 'out_dir'.
+
+    There are 'num_boxes' geoms over actors with tracks around
+    'track_length' frames long, within the first 'num_frames' frames,
+    and 'activity_density' activities (of up to
+    'max_actors_per_activity' actors) per actor.  Returns a dict of the
+    paths written and the counts of each record type.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+
+    def _path(suffix):
+        return os.path.join(out_dir, prefix + suffix)
+
+    lengths, starts = _actor_tracks(rng, num_boxes, track_length, num_frames)
+    _write_geoms(_path(".geom.yml"), rng, lengths, starts, frame_size,
+                 framerate)
+    num_activities = _write_activities(_path(".activities.yml"), rng,
+                                       lengths, starts, activity_density,
+                                       max_actors_per_activity)
+    _write_types(_path(".types.yml"), rng, len(lengths))
+
+    homography = np.array([[rng.uniform(0.4, 0.6), 0, rng.uniform(-20, 20)],
+                           [0, rng.uniform(0.4, 0.6), rng.uniform(-20, 20)],
+                           [0, 0, 1]])
+    np.savetxt(_path(".homography.txt"), homography)
+    write_camera_krtd_file(_camera(rng, rng.uniform(-0.2, 0.2), 0.0),
+                           _path(".src.krtd"))
+    write_camera_krtd_file(_camera(rng, rng.uniform(-0.4, 0.4), 5.0),
+                           _path(".dest.krtd"))
+
+    return {'geom': _path(".geom.yml"),
+            'activities': _path(".activities.yml"),
+            'types': _path(".types.yml"),
+            'homography': _path(".homography.txt"),
+            'src_camera': _path(".src.krtd"),
+            'dest_camera': _path(".dest.krtd"),
+            'num_boxes': num_boxes,
+            'num_actors': len(lengths),
+            'num_activities': num_activities}
+
+
+def main(args):
+    width, height = map(int, args.frame_size.split('x'))
+    clip = generate_synthetic_kpf(args.output_dir,
+                                  args.num_boxes,
+                                  prefix=args.prefix,
+                                  track_length=args.track_length,
+                                  activity_density=args.activity_density,
+                                  max_actors_per_activity=args.max_actors,
+                                  num_frames=args.num_frames,
+                                  frame_size=(width, height),
+                                  framerate=args.framerate,
+                                  seed=args.seed)
+    print(f"Wrote {clip['num_boxes']} geoms, {clip['num_actors']} actors "
+          f"and {clip['num_activities']} activities to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic clip of KPF geom, activity and "
+        "types files (with a homography and source/destination KRTD "
+        "cameras) for testing eo_to_ir at scale")
+    parser.add_argument("-n", "--num-boxes",
+                        type=int,
+                        required=True,
+                        help="Number of geom records")
+    parser.add_argument("-o", "--output-dir",
+                        type=str,
+                        required=True,
+                        help="Output directory")
+    parser.add_argument("-p", "--prefix",
+                        type=str,
+                        default="synthetic",
+                        help="Output filename prefix (default is "
+                        "'synthetic')")
+    parser.add_argument("--track-length",
+                        type=int,
+                        default=300,
+                        help="Mean actor track length in frames, which "
+                        "sets the number of actors (default is 300)")
+    parser.add_argument("--activity-density",
+                        type=float,
+                        default=0.5,
+                        help="Number of activities per actor (default is "
+                        "0.5)")
+    parser.add_argument("--max-actors",
+                        type=int,
+                        default=3,
+                        help="Maximum number of actors per activity "
+                        "(default is 3)")
+    parser.add_argument("--num-frames",
+                        type=int,
+                        default=9000,
+                        help="Length of the clip in frames (default is "
+                        "9000)")
+    parser.add_argument("-b", "--frame-size",
+                        type=str,
+                        default="1920x1080",
+                        help="Frame size (default is 1920x1080)")
+    parser.add_argument("-F", "--framerate",
+                        type=float,
+                        default=30.0,
+                        help="Framerate for geom timestamps (default is 30)")
+    parser.add_argument("-s", "--seed",
+                        type=int,
+                        default=0,
+                        help="Random seed (default is 0)")
+
+    main(parser.parse_args())
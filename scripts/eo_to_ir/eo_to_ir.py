@@ -1,38 +1,102 @@
 #!/usr/bin/env python3
 
 import argparse
+import contextlib
+import copy
+import glob
+import io
+import multiprocessing
 import os
 import re
+import tempfile
+import time
+import traceback
 import itertools
 from functools import reduce
 
-from lib.homography import load_homography_file, apply_homography
+import numpy as np
+
+from lib.homography import load_homography_file, apply_homography_batch
+from lib.box_cache import BoxTransferCache, DEFAULT_MAX_ENTRIES
 from lib.camera_io import load_camera_krtd_file
-from lib.view import view_to_view
+from lib.view import (view_to_view_batch,
+                      camera_pair_key,
+                      load_view_lut,
+                      VIEW_LUT_GRID,
+                      VIEW_LUT_TOLERANCE)
 from lib.utils import (parse_activities_yaml,
                        parse_geom_yaml,
                        parse_type_yaml,
+                       iter_geom_yaml_chunks,
                        abort_if_file_exists,
-                       kpf_yaml_dump,
                        dump_geoms_as_kw18,
-                       area_of_bounds)
+                       area_of_bounds,
+                       round_as_formatted)
+from lib.geom_table import GeomTable, ActorFrameIndex
+from lib.streaming import ActorFrameSummary, GeomSpill
+from lib.kpf_writer import KPFWriter, format_geom_lines
+from lib.kw18 import format_kw18
+from lib.parse_cache import ParseCache
+from lib.compressed_io import EXTENSIONS, open_file, with_compression
+from lib.manifest import load_manifest, manifest_entry_to_argv, flag_dests
+from lib.profiling import StageProfiler
+from lib.run_manifest import (fingerprint,
+                              source_version,
+                              run_key,
+                              load_run_manifest,
+                              outputs_match,
+                              write_run_manifest)
 from lib.transduce import (xd_map,
-                           xd_filter,
+                           xd_filter_mask,
                            appender,
+                           chunks,
                            xd)
 
+# Number of geom records to push through the geom pipeline at a time
+GEOM_CHUNK_SIZE = 65536
+
+# Output files of each target, by suffix (after the IR prefix)
+OUTPUT_SUFFIXES = (".activities.yml", ".geom.yml", ".kw18", ".types.yml")
+RUN_MANIFEST_SUFFIX = ".manifest.json"
+
+# Options giving input files, which the run manifest records by content
+_INPUT_OPTIONS = ('input_geom',
+                  'input_activities',
+                  'input_types',
+                  'homography_file',
+                  'camera_to_camera')
+
+# Options that don't change the outputs, left out of the run manifest
+_RUN_OPTIONS = {'output_dir',
+                'parse_cache',
+                'parse_cache_size',
+                'profile',
+                'profile_stage',
+                'targets',
+                'target_processes',
+                'workers',
+                'streaming',
+                'compress_threads',
+                'transfer_cache_size',
+                'incremental'}
+
+
+def _clip(values, min_value, max_value):
+    # Elementwise min(max(v, min_value), max_value), including which
+    # operand is kept for ties (e.g. -0.0) and NaNs
+    values = np.where(min_value > values, min_value, values)
+    return np.where(max_value < values, max_value, values)
+
 
 def _build_cropper(crop_bounds):
     min_x, min_y = 0.0, 0.0
     max_x, max_y = crop_bounds
 
     def _f(bounds):
-        x0, y0, x1, y1 = bounds
-        c_x0 = min(max(x0, min_x), max_x)
-        c_x1 = min(max(x1, min_x), max_x)
-        c_y0 = min(max(y0, min_y), max_y)
-        c_y1 = min(max(y1, min_y), max_y)
-        return (c_x0, c_y0, c_x1, c_y1)
+        cropped = np.empty_like(bounds)
+        cropped[:, 0::2] = _clip(bounds[:, 0::2], min_x, max_x)
+        cropped[:, 1::2] = _clip(bounds[:, 1::2], min_y, max_y)
+        return cropped
 
     return _f
 
@@ -40,76 +104,113 @@ def _build_cropper(crop_bounds):
 def _build_geom_cropper(crop_bounds):
     cropper_fn = _build_cropper(crop_bounds)
 
-    def _geom_cropper(geom):
-        orig_bounds = tuple(map(float, geom.get('g0').split(' ')))
+    def _geom_cropper(geom_table):
+        orig_bounds = geom_table.bounds
         cropped_bounds = cropper_fn(orig_bounds)
-        x0, y0, x1, y1 = cropped_bounds
-        x0 = int(x0)
-        y0 = int(y0)
-        x1 = int(x1)
-        y1 = int(y1)
 
-        geom['g0'] = ' '.join(map(str, cropped_bounds))
+        geom_table.bounds = cropped_bounds
         # Keep track of how much of the bounding box remains after
         # cropping
-        orig_area = area_of_bounds(orig_bounds)
-        geom['_ov0'] = (area_of_bounds(cropped_bounds) /
-                        orig_area) if orig_area > 0 else 0.0
+        orig_area = area_of_bounds(orig_bounds.T)
+        overlap = np.zeros(len(geom_table))
+        np.divide(area_of_bounds(cropped_bounds.T), orig_area,
+                  out=overlap, where=orig_area > 0)
+        geom_table.overlap = overlap
 
-        return geom
+        return geom_table
 
     return _geom_cropper
 
 
-def geom_0area_filter(geom):
-    x0, y0, x1, y1 = tuple(map(float, geom.get('g0').split(' ')))
-
-    return x0 != x1 and y0 != y1
-
+def geom_0area_filter(geom_table):
+    x0, y0, x1, y1 = geom_table.bounds.T
 
-def geom_negative_framenum_filter(geom):
-    ts0 = int(geom.get('ts0'))
+    return (x0 != x1) & (y0 != y1)
 
-    return ts0 >= 0
 
+def geom_negative_framenum_filter(geom_table):
+    return geom_table.ts0 >= 0
 
-def strip_geom_internal_fields(geom):
-    # Any field with a leading underscore should be stripped off prior
-    # to dumping
-    to_remove = []
-    for k in geom.keys():
-        if k.startswith('_'):
-            to_remove.append(k)
 
-    for k in to_remove:
-        del geom[k]
+def strip_geom_internal_fields(geom_table):
+    # Internal columns (e.g. the post-crop overlap) aren't dumped, but
+    # there's no need to carry them any further
+    geom_table.overlap = None
 
-    return geom
+    return geom_table
 
 
 def _build_offscreen_flagger(min_overlap):
-    def _offscreen_flagger(geom):
-        if geom.get('_ov0', float('Inf')) < min_overlap:
-            geom["occlusion"] = "off-screen"
+    def _offscreen_flagger(geom_table):
+        if geom_table.overlap is not None:
+            offscreen = geom_table.overlap < min_overlap
+            if geom_table.offscreen is not None:
+                offscreen |= geom_table.offscreen
+            geom_table.offscreen = offscreen
 
-        return geom
+        return geom_table
 
     return _offscreen_flagger
 
 
-def _build_homography_mapper(homography_file):
-    homography = load_homography_file(homography_file)
+# Homographies and cameras loaded so far, by loader and path; shared by
+# every clip processed in this process (see eo_to_ir_batch.py)
+_loaded_files = {}
+
+
+def load_shared(load_fn, path):
+    key = (load_fn.__name__, os.path.abspath(path))
+    if key not in _loaded_files:
+        _loaded_files[key] = load_fn(path)
+
+    return _loaded_files[key]
+
+
+def _build_memoizer(args, profiler, stage_name):
+    # Wraps box transfers in a BoxTransferCache, if asked to, counting
+    # its hits and misses under 'stage_name'
+    if args.transfer_cache_tolerance is None:
+        return None
+
+    def _memoize(transfer_fn):
+        cache = BoxTransferCache(transfer_fn,
+                                 args.transfer_cache_tolerance,
+                                 args.transfer_cache_size)
+
+        def _cached_transfer(bounds):
+            hits, misses = cache.hits, cache.misses
+            out = cache(bounds)
+            profiler.add_counts(stage_name,
+                                cache_hits=cache.hits - hits,
+                                cache_misses=cache.misses - misses)
+            return out
+
+        return _cached_transfer
+
+    return _memoize
+
+
+def _build_homography_mapper(homography_file, memoize=None):
+    homography = load_shared(load_homography_file, homography_file)
+
+    def _transfer(bounds):
+        return apply_homography_batch(homography, bounds)
 
-    def _apply_homography(geom_rec):
-        new_bounds = apply_homography(
-            homography,
-            [float(b) for b in geom_rec.get('g0').split(' ')])
+    if memoize is not None:
+        _transfer = memoize(_transfer)
 
-        geom_rec['g0'] = ' '.join(map(str, new_bounds))
+    def _apply_homography(geom_table):
+        new_bounds = _transfer(geom_table.bounds)
 
-        # geom_rect is modified in place, so returning here is just a
+        # As with bad camera-to-camera projections, boxes warped to
+        # infinity are given bounds that will be cropped away
+        new_bounds[np.isnan(new_bounds).any(axis=1)] = -1
+
+        geom_table.bounds = new_bounds
+
+        # geom_table is modified in place, so returning here is just a
         # convenience
-        return geom_rec
+        return geom_table
 
     return _apply_homography
 
@@ -117,14 +218,15 @@ def _build_homography_mapper(homography_file):
 def _build_time_shifter(frame_offset, framerate):
     time_offset = frame_offset / framerate
 
-    def _apply_offset(geom_rec):
-        geom_rec['ts0'] += frame_offset
+    def _apply_offset(geom_table):
+        geom_table.ts0 = geom_table.ts0 + frame_offset
         # NOTE ** Formatting our timestamps to 3 decimal places
-        geom_rec['ts1'] = float("%0.3f" % (geom_rec['ts1'] + time_offset))
+        geom_table.ts1 = round_as_formatted(geom_table.ts1 + time_offset, 3)
+        geom_table.ts1_int = np.zeros(len(geom_table), dtype=bool)
 
-        # geom_rect is modified in place, so returning here is just a
+        # geom_table is modified in place, so returning here is just a
         # convenience
-        return geom_rec
+        return geom_table
 
     return _apply_offset
 
@@ -143,37 +245,39 @@ def _build_activity_time_shifter(frame_offset):
     return _apply_offset
 
 
-def _build_activity_timespan_adjuster(geoms_by_actor_by_ts0,
-                                      geom_qualifier=lambda g: True,
+def _build_activity_timespan_adjuster(geom_table,
+                                      geom_qualifier=None,
                                       minimum_frames=0):
     # Correct our activity timespans against mapped/filtered (cropped)
-    # geom records.  The 'geom_qualifier' function determines whether
-    # a given geom should be taken into account when considering the
-    # bounds (e.g. if a geom record is "off-screen"); 'minimum_frames'
-    # is the number of geoms that pass the 'geom_qualifier' for the
-    # actor to be kept in the event
+    # geom records.  The 'geom_qualifier' function takes the geom
+    # table and returns a mask of the geoms that should be taken into
+    # account when considering the bounds (e.g. if a geom record is
+    # "off-screen"); 'minimum_frames' is the number of geoms that pass
+    # the 'geom_qualifier' for the actor to be kept in the event
     # ** NOTE ** This function assumes that there's only a single
     # ** record for a given "timespan" value
+    if geom_qualifier is None:
+        frame_index = ActorFrameIndex(geom_table)
+    else:
+        frame_index = ActorFrameIndex(geom_table, geom_qualifier(geom_table))
+
+    return _build_frame_index_timespan_adjuster(frame_index, minimum_frames)
+
 
+def _build_frame_index_timespan_adjuster(frame_index, minimum_frames=0):
+    # As above, but given anything with a 'qualifying_range' lookup
+    # (e.g. the streaming ActorFrameSummary)
     def _adjust_timespans_reducer(out_activities, activity_rec):
         min_ts0, max_ts0 = float('inf'), -float('inf')
         adjusted_actors = []
         for actor_rec in activity_rec.get('actors', []):
-            actor_id = actor_rec['id1']
-
-            min_a_ts0, max_a_ts0 = float('inf'), -float('inf')
             ts0_s, ts0_e = actor_rec['timespan'][0]['tsr0']
-            qualifying_frames = 0
-            for ts0 in range(ts0_s, ts0_e + 1):
-                geom = geoms_by_actor_by_ts0.get(actor_id, {}).get(ts0)
-                if geom is not None and geom_qualifier(geom):
-                    qualifying_frames += 1
-                    min_a_ts0 = min(ts0, min_a_ts0)
-                    max_a_ts0 = max(ts0, max_a_ts0)
+            qualifying_frames, min_a_ts0, max_a_ts0 =\
+                frame_index.qualifying_range(actor_rec['id1'], ts0_s, ts0_e)
 
             # Don't output the actor if there are no qualifying geoms,
             # or if the number of qualifying geoms < minimum_frames
-            if max_a_ts0 - min_a_ts0 < 0 or qualifying_frames < minimum_frames:
+            if qualifying_frames == 0 or qualifying_frames < minimum_frames:
                 continue
             else:
                 # Adjust the actor timespan
@@ -200,54 +304,93 @@ def _build_activity_timespan_adjuster(geoms_by_actor_by_ts0,
     return _adjust_timespans_reducer
 
 
-def _build_cam_to_cam_mapper(src_cam_file, dest_cam_file):
-    src_cam = load_camera_krtd_file(src_cam_file)
-    dest_cam = load_camera_krtd_file(dest_cam_file)
-
-    def _apply_cam_to_cam_map(geom_rec):
-        new_bounds = view_to_view(
-            src_cam,
-            dest_cam,
-            [float(b) for b in geom_rec.get('g0').split(' ')])
-
-        if new_bounds is None:
-            new_bounds = (-1, -1, -1, -1)
-
-        geom_rec['g0'] = ' '.join(map(str, new_bounds))
-
-        # geom_rect is modified in place, so returning here is just a
+def load_shared_view_lut(args):
+    """The --view-lut table for the --camera-to-camera cameras, loaded
+    (or built) once per process, as with load_shared"""
+    src_cam_file, dest_cam_file =\
+        map(str.strip, args.camera_to_camera.split(':'))
+    src_cam = load_shared(load_camera_krtd_file, src_cam_file)
+    dest_cam = load_shared(load_camera_krtd_file, dest_cam_file)
+    grid = tuple(map(int, args.view_lut_grid.split('x')))
+
+    key = ('load_view_lut', os.path.abspath(args.view_lut))
+    lut = _loaded_files.get(key)
+    if (lut is None or
+            lut.key != camera_pair_key(src_cam, dest_cam) or
+            lut.grid != grid or
+            lut.tolerance != args.view_lut_tolerance):
+        lut, built = load_view_lut(args.view_lut, src_cam, dest_cam, grid,
+                                   args.view_lut_tolerance)
+        print(f"{'Built' if built else 'Loaded'} view LUT "
+              f"'{args.view_lut}': {lut.describe()}")
+        if lut.max_error > lut.tolerance:
+            print(f"Warning, view LUT errors of up to {lut.max_error:.3f} "
+                  f"px exceed its tolerance of {lut.tolerance} px; a finer "
+                  "--view-lut-grid may be needed")
+        _loaded_files[key] = lut
+
+    return lut
+
+
+def _build_cam_to_cam_mapper(src_cam_file, dest_cam_file, view_lut=None,
+                             memoize=None):
+    src_cam = load_shared(load_camera_krtd_file, src_cam_file)
+    dest_cam = load_shared(load_camera_krtd_file, dest_cam_file)
+
+    # Boxes are interpolated from the ViewLUT, if given, where it's
+    # accurate enough
+    transfer_fn = view_to_view_batch if view_lut is None else \
+        view_lut.transfer
+
+    def _transfer(bounds):
+        # (Boxes that can't be transferred come back as NaN)
+        return transfer_fn(src_cam, dest_cam, bounds)[0]
+
+    if memoize is not None:
+        _transfer = memoize(_transfer)
+
+    def _apply_cam_to_cam_map(geom_table):
+        new_bounds = _transfer(geom_table.bounds)
+        valid = np.all(np.isfinite(new_bounds), axis=1)
+
+        # Boxes that couldn't be projected are given bounds that will
+        # be cropped away
+        new_bounds[~valid] = -1
+
+        geom_table.bounds = new_bounds
+
+        # geom_table is modified in place, so returning here is just a
         # convenience
-        return geom_rec
+        return geom_table
 
     return _apply_cam_to_cam_map
 
 
-def main(args):
-    yaml_activities, activity_records, non_activity_records =\
-        parse_activities_yaml(args.input_activities)
-
-    yaml_geoms, non_geom_records, geoms_by_actor =\
-        parse_geom_yaml(args.input_geom)
-
-    yaml_types, yaml_type_by_actor =\
-        parse_type_yaml(args.input_types)
-
+def _build_pipelines(args, profiler):
+    # Each geom stage is profiled under its own name
     geom_mapper_fns = []
     activity_mapper_fns = []
 
     # Pre-crop mapping
     if args.homography_file is not None:
         geom_mapper_fns.append(
-            xd_map(_build_homography_mapper(args.homography_file)))
+            xd_map(profiler.wrap_batch(
+                "geom.homography",
+                _build_homography_mapper(
+                    args.homography_file,
+                    _build_memoizer(args, profiler, "geom.homography")))))
 
     if args.frame_offset is not None:
         geom_mapper_fns.append(
-            xd_map(_build_time_shifter(args.frame_offset,
-                                       args.framerate)))
+            xd_map(profiler.wrap_batch(
+                "geom.time_shift",
+                _build_time_shifter(args.frame_offset, args.framerate))))
         # Go ahead and add the negative framenum filter here so that
         # we don't have to process the geom further if filtered
         geom_mapper_fns.append(
-            xd_filter(geom_negative_framenum_filter))
+            xd_filter_mask(profiler.wrap_mask(
+                "geom.negative_framenum_filter",
+                geom_negative_framenum_filter)))
         activity_mapper_fns.append(
             xd_map(_build_activity_time_shifter(args.frame_offset)))
 
@@ -256,76 +399,354 @@ def main(args):
             map(str.strip, args.camera_to_camera.split(':'))
 
         geom_mapper_fns.append(
-            xd_map(_build_cam_to_cam_mapper(src_cam_file,
-                                            dest_cam_file)))
+            xd_map(profiler.wrap_batch(
+                "geom.camera_to_camera",
+                _build_cam_to_cam_mapper(
+                    src_cam_file, dest_cam_file,
+                    None if args.view_lut is None else
+                    load_shared_view_lut(args),
+                    _build_memoizer(args, profiler,
+                                    "geom.camera_to_camera")))))
 
     crop_bounds = map(float, args.crop_bounds.split('x'))
     geom_mapper_fns.append(
-        xd_map(_build_geom_cropper(crop_bounds)))
+        xd_map(profiler.wrap_batch(
+            "geom.crop", _build_geom_cropper(crop_bounds))))
 
     # Post-crop mapping
     if args.min_spatial_overlap is not None:
         geom_mapper_fns.append(
-            xd_map(_build_offscreen_flagger(args.min_spatial_overlap)))
+            xd_map(profiler.wrap_batch(
+                "geom.offscreen_flag",
+                _build_offscreen_flagger(args.min_spatial_overlap))))
 
     geom_pipeline = xd(*geom_mapper_fns,
-                       xd_filter(geom_0area_filter),
+                       xd_filter_mask(profiler.wrap_mask(
+                           "geom.0area_filter", geom_0area_filter)),
                        xd_map(strip_geom_internal_fields))
 
-    cropped_geoms_by_actor_by_ts0 = {}
-    for actor, actor_geoms in geoms_by_actor.items():
-        cropped_geoms_by_actor_by_ts0[actor] =\
-            {g.get('ts0'): g for g in
-             reduce(geom_pipeline(appender), actor_geoms, [])}
+    return geom_pipeline, xd(*activity_mapper_fns)
 
-    os.makedirs(args.output_dir, exist_ok=True)
 
-    # Useful for filtering out orphaned actors
+def _write_activities(args,
+                      profiler,
+                      activity_pipeline,
+                      activity_timespan_adjuster,
+                      activity_records,
+                      non_activity_records):
+    # Returns the set of actors surviving in the output activities
     surviving_actors = set()
 
-    activity_pipeline = xd(*activity_mapper_fns)
-    out_act_path = os.path.join(
-        args.output_dir, "%s.activities.yml" % args.ir_prefix)
-    abort_if_file_exists(out_act_path)
-    with open(out_act_path, 'w') as of:
-        out_meta_records = []
-        activity_counts = {}
-        activity_timespan_adjuster =\
-            _build_activity_timespan_adjuster(cropped_geoms_by_actor_by_ts0)
-        for rec in non_activity_records:
-            meta_val = rec.get('meta')
-            # Don't include original activity count meta records as we
-            # have to recompute after the crop
-            if(isinstance(meta_val, str) and
-               re.search(r'\w+ \d+ instances', meta_val)):
-                continue
-            else:
-                out_meta_records.append(rec)
-
+    out_act_path = _temp_output_path(args, ".activities.yml")
+    out_meta_records = []
+    activity_counts = {}
+    for rec in non_activity_records:
+        meta_val = rec.get('meta')
+        # Don't include original activity count meta records as we
+        # have to recompute after the crop
+        if(isinstance(meta_val, str) and
+           re.search(r'\w+ \d+ instances', meta_val)):
+            continue
+        else:
+            out_meta_records.append(rec)
+
+    with profiler.stage("activities.adjust_timespans",
+                        records_in=len(activity_records)) as stage:
         out_activity_records = reduce(
             activity_pipeline(activity_timespan_adjuster),
             activity_records,
             [])
+        stage.add_records(records_out=len(out_activity_records))
 
-        for activity in out_activity_records:
-            # Keep track of surviving actors
-            for actor_rec in activity.get('actors', []):
-                surviving_actors.add(actor_rec['id1'])
+    for activity in out_activity_records:
+        # Keep track of surviving actors
+        for actor_rec in activity.get('actors', []):
+            surviving_actors.add(actor_rec['id1'])
 
-            # Count the instances for out meta counts
-            for activity_name, count in activity.get('act2', {}).items():
-                activity_counts[activity_name] =\
-                    activity_counts.get(activity_name, 0) + count
+        # Count the instances for out meta counts
+        for activity_name, count in activity.get('act2', {}).items():
+            activity_counts[activity_name] =\
+                activity_counts.get(activity_name, 0) + count
 
+    with profiler.stage("write.activities",
+                        records_out=len(out_activity_records)), \
+            KPFWriter(out_act_path, args.compress_threads) as writer:
         for out_meta_rec in out_meta_records:
-            print(f"- {kpf_yaml_dump(out_meta_rec)}", file=of)
+            writer.write_record(out_meta_rec)
 
         for activity_name, count in activity_counts.items():
-            meta_rec = {"meta": f"{activity_name} {int(count)} instances"}
-            print(f"- {kpf_yaml_dump(meta_rec)}", file=of)
+            writer.write_meta(f"{activity_name} {int(count)} instances")
 
         for out_activity_rec in out_activity_records:
-            print(f"- {kpf_yaml_dump({'act': out_activity_rec})}", file=of)
+            writer.write_activity(out_activity_rec)
+
+    return surviving_actors
+
+
+def _write_types(args,
+                 profiler,
+                 yaml_types,
+                 yaml_type_by_actor,
+                 surviving_actors):
+    out_types_path = _temp_output_path(args, ".types.yml")
+    with profiler.stage("write.types",
+                        records_out=len(surviving_actors)), \
+            KPFWriter(out_types_path, args.compress_threads) as writer:
+        for type_rec in yaml_types:
+            # Preserving "meta" records
+            if 'meta' in type_rec:
+                writer.write_record(type_rec)
+
+        for actor_id in sorted(surviving_actors):
+            type_rec = yaml_type_by_actor[actor_id]
+            writer.write_record(type_rec)
+
+
+def _output_path(args, suffix):
+    # e.g. <output_dir>/<ir_prefix>.geom.yml(.gz)
+    return os.path.join(args.output_dir, with_compression(
+        args.ir_prefix + suffix, args.compress))
+
+
+def _temp_output_path(args, suffix):
+    # Where an output is written before being moved into place (see
+    # _writing_outputs); the extension is kept, as it sets compression
+    path = _output_path(args, suffix)
+    return os.path.join(os.path.dirname(path),
+                        ".tmp%d.%s" % (os.getpid(), os.path.basename(path)))
+
+
+@contextlib.contextmanager
+def _writing_outputs(args):
+    """The body writes each output of a target to its temporary path;
+    they're moved into place together once it completes, so a failed
+    run leaves no partial outputs.  With --incremental, existing outputs
+    are replaced and the run manifest is written after them."""
+    out_paths = [_output_path(args, s) for s in OUTPUT_SUFFIXES]
+    if not args.incremental:
+        for path in out_paths:
+            abort_if_file_exists(path)
+
+    try:
+        yield
+        for suffix, path in zip(OUTPUT_SUFFIXES, out_paths):
+            os.replace(_temp_output_path(args, suffix), path)
+    finally:
+        for suffix in OUTPUT_SUFFIXES:
+            with contextlib.suppress(OSError):
+                os.unlink(_temp_output_path(args, suffix))
+
+    if args.incremental:
+        key, inputs = _run_key(args)
+        write_run_manifest(_run_manifest_path(args),
+                           key,
+                           _tool_version(),
+                           _run_options(args),
+                           inputs,
+                           out_paths)
+
+
+# Fingerprints of input files seen so far, by path; reused while the
+# size and mtime match, so inputs shared by targets are hashed once
+_input_fingerprints = {}
+
+# Hash of our source files (see _tool_version)
+_source_version = None
+
+
+def _tool_version():
+    global _source_version
+    if _source_version is None:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        _source_version = source_version(
+            [os.path.abspath(__file__)] +
+            glob.glob(os.path.join(script_dir, "lib", "*.py")))
+
+    return _source_version
+
+
+def _run_manifest_path(args):
+    return os.path.join(args.output_dir, args.ir_prefix + RUN_MANIFEST_SUFFIX)
+
+
+def _run_options(args):
+    return {k: v for k, v in sorted(vars(args).items())
+            if k not in _RUN_OPTIONS and k not in _INPUT_OPTIONS}
+
+
+def _run_inputs(args, previous=None):
+    # Fingerprints of the input files (with their paths), by option;
+    # files are only hashed when changed since the 'previous' manifest
+    input_paths = {}
+    for option in _INPUT_OPTIONS:
+        value = getattr(args, option, None)
+        if value is None:
+            continue
+        if option == 'camera_to_camera':
+            input_paths['src_camera'], input_paths['dest_camera'] = \
+                map(str.strip, value.split(':'))
+        else:
+            input_paths[option] = value
+
+    previous_inputs = previous.get('inputs', {}) if previous else {}
+    inputs = {}
+    for name, path in input_paths.items():
+        path = os.path.abspath(path)
+        known = _input_fingerprints.get(path)
+        if known is None and \
+                previous_inputs.get(name, {}).get('path') == path:
+            known = previous_inputs[name]
+        _input_fingerprints[path] = fingerprint(path, known)
+        inputs[name] = {'path': path, **_input_fingerprints[path]}
+
+    return inputs
+
+
+def _run_key(args, previous=None):
+    # The run key for the target's outputs, and the input fingerprints
+    inputs = _run_inputs(args, previous)
+    return run_key(_tool_version(),
+                   _run_options(args),
+                   {name: i['sha256'] for name, i in inputs.items()}), inputs
+
+
+def outputs_up_to_date(args):
+    """Whether the target's run manifest matches its inputs, options and
+    our source, and its outputs are as the manifest records"""
+    previous = load_run_manifest(_run_manifest_path(args))
+    if previous is None:
+        return False
+
+    key, _ = _run_key(args, previous)
+    return previous.get('key') == key and outputs_match(
+        previous, [_output_path(args, s) for s in OUTPUT_SUFFIXES])
+
+
+def _num_track_frames(min_ts0, max_ts0):
+    # (max_ts0 starts from 0.0 as the frame range is counted from frame
+    # 0 for tracks entirely at negative frames)
+    return (max(max_ts0, 0.0) - min_ts0) + 1
+
+
+def main(args):
+    profiler = StageProfiler(args.profile_stage)
+
+    extra_report = {}
+    if args.targets is not None:
+        extra_report['targets'] = main_targets(args, profiler)
+    elif args.incremental and outputs_up_to_date(args):
+        print(f"Outputs for '{args.ir_prefix}' are up to date, skipping")
+        extra_report['skipped'] = True
+    else:
+        with _writing_outputs(args):
+            if args.streaming:
+                main_streaming(args, profiler)
+            else:
+                main_in_memory(args, profiler)
+
+    if args.transfer_cache_tolerance is not None:
+        for stage in profiler.report()['stages']:
+            counts = stage.get('counts', {})
+            if 'cache_hits' in counts:
+                lookups = counts['cache_hits'] + counts['cache_misses']
+                print(f"Transfer cache ({stage['name']}): "
+                      f"{counts['cache_hits']} hits, "
+                      f"{counts['cache_misses']} misses "
+                      f"({counts['cache_hits'] / max(lookups, 1):.1%} hit "
+                      f"rate)")
+
+    if args.profile is not None:
+        profiler.write(args.profile, **extra_report)
+
+
+def _build_parse_cache(args):
+    # None without --parse-cache
+    if args.parse_cache is None:
+        return None
+    return ParseCache(args.parse_cache,
+                      int(args.parse_cache_size * 1024 ** 2))
+
+
+def _parse_activities_and_types(args, profiler, parse_cache=None):
+    with profiler.stage("parse.activities") as stage:
+        yaml_activities, activity_records, non_activity_records =\
+            parse_activities_yaml(args.input_activities, parse_cache)
+        stage.add_records(records_out=len(yaml_activities))
+
+    with profiler.stage("parse.types") as stage:
+        yaml_types, yaml_type_by_actor =\
+            parse_type_yaml(args.input_types, parse_cache)
+        stage.add_records(records_out=len(yaml_types))
+
+    return (activity_records, non_activity_records,
+            yaml_types, yaml_type_by_actor)
+
+
+def _parse_inputs(args, profiler):
+    # The parsed inputs, as used by _process_target
+    parse_cache = _build_parse_cache(args)
+    activity_inputs = _parse_activities_and_types(args, profiler,
+                                                  parse_cache)
+
+    with profiler.stage("parse.geom") as stage:
+        non_geom_records, geom_table = parse_geom_yaml(args.input_geom,
+                                                       parse_cache)
+        stage.add_records(records_out=len(non_geom_records) +
+                          len(geom_table))
+
+    return (*activity_inputs, non_geom_records, geom_table)
+
+
+def main_in_memory(args, profiler):
+    _process_target(args, profiler, _parse_inputs(args, profiler))
+
+
+def _process_target(args, profiler, inputs):
+    # Map, crop and adjust the parsed inputs, and write out the results.
+    # The inputs are left as they are, other than the activity records
+    # (which are adjusted in place)
+    if (args.workers is not None and args.workers > 1 and
+            can_start_processes()):
+        return _process_target_sharded(args, profiler, inputs)
+
+    activity_records, non_activity_records, yaml_types, yaml_type_by_actor, \
+        non_geom_records, geom_table = inputs
+
+    geom_pipeline, activity_pipeline = _build_pipelines(args, profiler)
+
+    # The geom table goes through the pipeline a chunk of rows at a
+    # time; we keep a single geom per actor and frame
+    with profiler.stage("geom.pipeline",
+                        records_in=len(geom_table)) as stage:
+        cropped_chunks = reduce(geom_pipeline(appender),
+                                chunks(geom_table, GEOM_CHUNK_SIZE),
+                                [])
+        if len(cropped_chunks) > 0:
+            cropped_geom_table = GeomTable.concatenate(cropped_chunks)
+        else:
+            cropped_geom_table = geom_table[0:0]
+        stage.add_records(records_out=len(cropped_geom_table))
+
+    with profiler.stage("geom.dedup",
+                        records_in=len(cropped_geom_table)) as stage:
+        cropped_geom_table = cropped_geom_table.dedup_ts0()
+        stage.add_records(records_out=len(cropped_geom_table))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    with profiler.stage("activities.frame_index",
+                        records_in=len(cropped_geom_table)):
+        activity_timespan_adjuster =\
+            _build_activity_timespan_adjuster(cropped_geom_table)
+
+    # Useful for filtering out orphaned actors
+    surviving_actors = _write_activities(
+        args,
+        profiler,
+        activity_pipeline,
+        activity_timespan_adjuster,
+        activity_records,
+        non_activity_records)
 
     # This is needed for when we dump out the kw18
     num_frames_per_actor = {}
@@ -333,73 +754,470 @@ def main(args):
     # Since we're using the input basename for our output filename,
     # want to prevent ourselves from accidently overwriting the input
     # file if we're not careful when specifying our output directory
-    out_geom_path = os.path.join(
-        args.output_dir, "%s.geom.yml" % args.ir_prefix)
-    abort_if_file_exists(out_geom_path)
-    with open(out_geom_path, 'w') as of:
+    out_geom_path = _temp_output_path(args, ".geom.yml")
+    with profiler.stage("write.geom") as stage, \
+            KPFWriter(out_geom_path, args.compress_threads) as writer:
         # Write out non-geom records preserved from the original/input
         # geoms file
         for non_geom_rec in non_geom_records:
-            print(f"- {kpf_yaml_dump(non_geom_rec)}", file=of)
+            writer.write_record(non_geom_rec)
 
-        for actor_id, geom_recs_by_ts0 in cropped_geoms_by_actor_by_ts0.items():
-            geom_recs = geom_recs_by_ts0.values()
-            if len(geom_recs) > 0:
+        for actor_id, start, end in cropped_geom_table.iter_actor_slices():
+            if end > start:
                 if args.include_orphans:
                     surviving_actors.add(actor_id)
                 elif actor_id not in surviving_actors:
                     continue
 
-                min_ts0, max_ts0 = float('inf'), 0.0
-                for geom_rec in geom_recs:
-                    min_ts0 = min(geom_rec.get('ts0', min_ts0), min_ts0)
-                    max_ts0 = max(geom_rec.get('ts0', max_ts0), max_ts0)
-                    # Write out the geom record
-                    print(f"- {kpf_yaml_dump({'geom': geom_rec})}", file=of)
+                # Write out the geom records
+                writer.write_geom_table(cropped_geom_table, start, end)
+                stage.add_records(records_out=end - start)
 
-                num_frames_per_actor[actor_id] = (max_ts0 - min_ts0) + 1
+                actor_ts0s = cropped_geom_table.ts0[start:end]
+                num_frames_per_actor[actor_id] = _num_track_frames(
+                    int(actor_ts0s.min()), int(actor_ts0s.max()))
 
     # Dump kw18 of geoms
-    kw18_base, _ = os.path.splitext(args.input_geom)
-    kw18_outpath = os.path.join(args.output_dir, "%s.kw18" % args.ir_prefix)
-    abort_if_file_exists(kw18_outpath)
-    dump_geoms_as_kw18(itertools.chain(
-        *[v.values() for k, v in cropped_geoms_by_actor_by_ts0.items()
-          if args.include_orphans or k in surviving_actors]),
-                       num_frames_per_actor,
-                       kw18_outpath)
-
-    out_types_path = os.path.join(
-        args.output_dir, "%s.types.yml" % args.ir_prefix)
-    abort_if_file_exists(out_types_path)
-    with open(out_types_path, 'w') as of:
-        for type_rec in yaml_types:
-            # Preserving "meta" records
-            if 'meta' in type_rec:
-                print(f"- {kpf_yaml_dump(type_rec)}", file=of)
+    kw18_outpath = _temp_output_path(args, ".kw18")
+    with profiler.stage("write.kw18") as stage:
+        kw18_geom_table = cropped_geom_table.select_actors(
+            [args.include_orphans or a in surviving_actors
+             for a in cropped_geom_table.actor_ids.tolist()])
+        dump_geoms_as_kw18(kw18_geom_table,
+                           num_frames_per_actor,
+                           kw18_outpath,
+                           args.kw18_precision,
+                           args.compress_threads)
+        stage.add_records(records_out=len(kw18_geom_table))
+
+    _write_types(args,
+                 profiler,
+                 yaml_types,
+                 yaml_type_by_actor,
+                 surviving_actors)
+
+
+# Arguments and geom table for --workers processes; inherited when
+# forked, rather than sent to each worker
+_shard_args = None
+_shard_geom_table = None
+
+
+def can_start_processes():
+    # Daemonic processes (e.g. eo_to_ir_batch's pool workers) can't have
+    # children, so the pools run in-process there
+    return not multiprocessing.current_process().daemon
+
+
+def _init_shard_worker(args, geom_table):
+    global _shard_args, _shard_geom_table
+    _shard_args = args
+    _shard_geom_table = geom_table
+
+
+def _shard_actors(geom_table, num_shards):
+    # Split the actors into (up to) 'num_shards' runs of consecutive
+    # actors with about the same number of rows; returns the runs as
+    # (first, end) actor indices
+    n_actors = len(geom_table.actor_ids)
+    cuts = np.searchsorted(
+        geom_table.actor_offsets,
+        np.linspace(0, len(geom_table), num_shards + 1)[1:-1])
+    bounds = np.unique(np.concatenate(([0], cuts, [n_actors]))).tolist()
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _join_by_actor(pieces, actor_counts):
+    # Join the per-row pieces of text for each actor, returning the text
+    # and the (n_actors + 1) offsets of each actor's text within it
+    offsets = np.concatenate(([0], np.cumsum(actor_counts))).tolist()
+    actor_texts = ["".join(pieces[offsets[i]:offsets[i + 1]])
+                   for i in range(len(actor_counts))]
+    return "".join(actor_texts), np.concatenate(
+        ([0], np.cumsum([len(t) for t in actor_texts], dtype=np.int64)))
+
+
+def _process_shard(shard):
+    # Map, crop and dedup the geoms of a run of actors, and format their
+    # output lines.  Returns the actors' row counts and frames, the geom
+    # and kw18 text (with each actor's offsets within them) and the
+    # profiler report
+    first, end = shard
+    args = _shard_args
+    geom_table = _shard_geom_table
+    profiler = StageProfiler()
+    geom_pipeline, _ = _build_pipelines(args, profiler)
+
+    offsets = geom_table.actor_offsets
+    shard_table = geom_table[int(offsets[first]):int(offsets[end])]
+    with profiler.stage("geom.pipeline",
+                        records_in=len(shard_table)) as stage:
+        cropped_chunks = reduce(geom_pipeline(appender),
+                                chunks(shard_table, GEOM_CHUNK_SIZE),
+                                [])
+        if len(cropped_chunks) > 0:
+            cropped_geom_table = GeomTable.concatenate(cropped_chunks)
+        else:
+            cropped_geom_table = shard_table[0:0]
+        stage.add_records(records_out=len(cropped_geom_table))
+
+    with profiler.stage("geom.dedup",
+                        records_in=len(cropped_geom_table)) as stage:
+        cropped_geom_table = cropped_geom_table.dedup_ts0()
+        stage.add_records(records_out=len(cropped_geom_table))
+
+    actor_counts = cropped_geom_table.actor_counts()[first:end]
+    with profiler.stage("format.geom", records_in=len(cropped_geom_table)):
+        geom_text, geom_offsets = _join_by_actor(
+            format_geom_lines(cropped_geom_table), actor_counts)
+
+    with profiler.stage("format.kw18", records_in=len(cropped_geom_table)):
+        track_frames = []
+        for actor_id, start, stop in cropped_geom_table.iter_actor_slices():
+            if stop > start:
+                actor_ts0s = cropped_geom_table.ts0[start:stop]
+                track_frames.extend(
+                    [_num_track_frames(int(actor_ts0s.min()),
+                                       int(actor_ts0s.max()))] *
+                    (stop - start))
+        kw18_text, kw18_offsets = _join_by_actor(
+            format_kw18(cropped_geom_table.id1,
+                        track_frames,
+                        cropped_geom_table.ts0,
+                        cropped_geom_table.bounds,
+                        cropped_geom_table.ts1_values(),
+                        args.kw18_precision).splitlines(keepends=True),
+            actor_counts)
+
+    return (actor_counts,
+            cropped_geom_table.ts0,
+            geom_text,
+            geom_offsets,
+            kw18_text,
+            kw18_offsets,
+            profiler.report())
+
+
+def _process_target_sharded(args, profiler, inputs):
+    # As _process_target, with the geoms mapped, cropped and formatted by
+    # a pool of processes, each given runs of actors.  The shards' results
+    # are merged in actor order, so the output is the same
+    activity_records, non_activity_records, yaml_types, yaml_type_by_actor, \
+        non_geom_records, geom_table = inputs
+
+    _, activity_pipeline = _build_pipelines(args, profiler)
+
+    # More shards than workers, to even out the load
+    shards = _shard_actors(geom_table, args.workers * 4)
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+
+    results = []
+    with profiler.stage("geom.shards", records_in=len(geom_table)), \
+            context.Pool(processes=min(args.workers, max(len(shards), 1)),
+                         initializer=_init_shard_worker,
+                         initargs=(args, geom_table)) as pool:
+        for result in pool.imap(_process_shard, shards):
+            results.append(result[:-1])
+            profiler.add_report(result[-1])
+
+    actor_counts = np.concatenate(
+        [r[0] for r in results] + [np.zeros(0, dtype=np.int64)])
+    with profiler.stage("activities.frame_index",
+                        records_in=int(actor_counts.sum())):
+        activity_timespan_adjuster = _build_frame_index_timespan_adjuster(
+            ActorFrameIndex.from_actor_frames(
+                geom_table.actor_ids,
+                actor_counts,
+                np.concatenate([r[1] for r in results] +
+                               [np.zeros(0, dtype=np.int64)])))
 
-        for actor_id in sorted(surviving_actors):
-            type_rec = yaml_type_by_actor[actor_id]
-            print(f"- {kpf_yaml_dump(type_rec)}", file=of)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    surviving_actors = _write_activities(
+        args,
+        profiler,
+        activity_pipeline,
+        activity_timespan_adjuster,
+        activity_records,
+        non_activity_records)
+
+    out_geom_path = _temp_output_path(args, ".geom.yml")
+    kw18_outpath = _temp_output_path(args, ".kw18")
+
+    # The geom and kw18 writes are profiled together
+    with profiler.stage("write.geom_and_kw18") as stage, \
+            KPFWriter(out_geom_path, args.compress_threads) as writer, \
+            open_file(kw18_outpath, 'w', buffering=1 << 20,
+                      threads=args.compress_threads) as kf:
+        for non_geom_rec in non_geom_records:
+            writer.write_record(non_geom_rec)
+
+        actor_ids = iter(geom_table.actor_ids.tolist())
+        for counts, _, geom_text, geom_offsets, kw18_text, kw18_offsets in \
+                results:
+            geom_offsets = geom_offsets.tolist()
+            kw18_offsets = kw18_offsets.tolist()
+            for i, count in enumerate(counts.tolist()):
+                actor_id = next(actor_ids)
+                if count > 0:
+                    if args.include_orphans:
+                        surviving_actors.add(actor_id)
+                    elif actor_id not in surviving_actors:
+                        continue
+
+                    writer.write_lines(
+                        [geom_text[geom_offsets[i]:geom_offsets[i + 1]]])
+                    kf.write(kw18_text[kw18_offsets[i]:kw18_offsets[i + 1]])
+                    stage.add_records(records_out=count)
+
+    _write_types(args,
+                 profiler,
+                 yaml_types,
+                 yaml_type_by_actor,
+                 surviving_actors)
+
+
+def main_streaming(args, profiler):
+    # Bounded memory variant of main; geoms are read a chunk at a time
+    # and, once through the pipeline, spilled to disk as output lines
+    # (a piece per actor) with only a per-actor frame summary kept in
+    # memory.  A second pass over the spilled pieces writes out the
+    # geoms and kw18 grouped by actor, as main does
+    activity_records, non_activity_records, yaml_types, yaml_type_by_actor =\
+        _parse_activities_and_types(args, profiler, _build_parse_cache(args))
+
+    geom_pipeline, activity_pipeline = _build_pipelines(args, profiler)
 
+    os.makedirs(args.output_dir, exist_ok=True)
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="Given a homography, a time offset and a pair of geom and "
-        "activity YAML files, crop the activities")
-    parser.add_argument("-g", "--input-geom",
-                        type=str,
-                        required=True,
-                        help="Path to input geometry KPF YAML to warp and "
-                        "crop")
-    parser.add_argument("-a", "--input-activities",
-                        type=str,
-                        required=True,
-                        help="Path to input activity KPF YAML")
-    parser.add_argument("-t", "--input-types",
-                        type=str,
-                        required=True,
-                        help="Path to input types KPF YAML")
+    with tempfile.TemporaryDirectory(prefix=".eo_to_ir_spill_",
+                                     dir=args.output_dir) as spill_dir:
+        summary = ActorFrameSummary()
+        spill = GeomSpill(spill_dir)
+        non_geom_records = []
+
+        # First pass: map, crop and filter geoms; keep per-actor frame
+        # summaries and spill the output lines
+        for chunk_non_geom_records, chunk_table in profiler.iterate(
+                "parse.geom",
+                iter_geom_yaml_chunks(args.input_geom, GEOM_CHUNK_SIZE),
+                lambda chunk: len(chunk[0]) + len(chunk[1])):
+            non_geom_records.extend(chunk_non_geom_records)
+            # Actors are ranked on first appearance, whether or not
+            # their geoms survive, to match the output order of main
+            summary.add_actors(chunk_table.actor_ids.tolist())
+
+            with profiler.stage("geom.pipeline",
+                                records_in=len(chunk_table)) as stage:
+                out_tables = reduce(geom_pipeline(appender),
+                                    [chunk_table],
+                                    [])
+                stage.add_records(
+                    records_out=sum(len(t) for t in out_tables))
+
+            for out_table in out_tables:
+                with profiler.stage("geom.spill",
+                                    records_in=len(out_table)):
+                    for actor_id, start, end in \
+                            out_table.iter_actor_slices():
+                        summary.add_frames(actor_id,
+                                           out_table.ts0[start:end])
+
+                    spill.write(
+                        np.repeat(
+                            summary.ranks(out_table.actor_ids.tolist()),
+                            out_table.actor_counts()),
+                        out_table.ts0,
+                        list(zip(format_geom_lines(out_table),
+                                 out_table.ts1_values(),
+                                 map(tuple, out_table.bounds.tolist()))))
+
+        surviving_actors = _write_activities(
+            args,
+            profiler,
+            activity_pipeline,
+            _build_frame_index_timespan_adjuster(summary),
+            activity_records,
+            non_activity_records)
+
+        out_geom_path = _temp_output_path(args, ".geom.yml")
+        kw18_outpath = _temp_output_path(args, ".kw18")
+
+        # Second pass: write out the spilled geoms an actor at a time,
+        # streaming each actor's pieces (the geom and kw18 writes are
+        # profiled together)
+        with profiler.stage("write.geom_and_kw18") as stage, \
+                KPFWriter(out_geom_path, args.compress_threads) as writer, \
+                open_file(kw18_outpath, 'w',
+                          threads=args.compress_threads) as kf:
+            for non_geom_rec in non_geom_records:
+                writer.write_record(non_geom_rec)
+
+            for rank, pieces in spill.iter_actors():
+                actor_id = summary.actor_ids[rank]
+                if args.include_orphans:
+                    surviving_actors.add(actor_id)
+                elif actor_id not in surviving_actors:
+                    continue
+
+                num_frames = _num_track_frames(
+                    *summary.frame_range(actor_id))
+                for ts0s, lines in pieces:
+                    stage.add_records(records_out=len(lines))
+                    writer.write_lines([line[0] for line in lines])
+                    kf.write(format_kw18(
+                        [actor_id] * len(lines),
+                        [num_frames] * len(lines),
+                        ts0s,
+                        [line[2] for line in lines],
+                        [line[1] for line in lines],
+                        args.kw18_precision))
+
+    _write_types(args,
+                 profiler,
+                 yaml_types,
+                 yaml_type_by_actor,
+                 surviving_actors)
+
+
+# Parsed inputs shared by the targets of a --targets run; worker
+# processes inherit them when forked, rather than each target
+# re-parsing (or being sent) them
+_target_inputs = None
+
+
+def _init_target_worker(inputs):
+    global _target_inputs
+    _target_inputs = inputs
+
+
+def _target_cprofile_path(args):
+    root, ext = os.path.splitext(args.profile)
+    return "%s.%s%s" % (root, args.ir_prefix, ext)
+
+
+def _run_target(job):
+    index, args = job
+    start = time.time()
+    profiler = StageProfiler(args.profile_stage)
+    output = io.StringIO()
+    error = None
+
+    # Activity records are adjusted in place, so each target has its own
+    activity_records, *other_inputs = _target_inputs
+    inputs = (copy.deepcopy(activity_records), *other_inputs)
+    try:
+        with contextlib.redirect_stdout(output), _writing_outputs(args):
+            _process_target(args, profiler, inputs)
+    except SystemExit as e:
+        # We print our reason before exiting
+        lines = output.getvalue().strip().splitlines()
+        error = lines[-1] if lines else f"exited with status {e.code}"
+    except Exception as e:
+        error = "".join(
+            traceback.format_exception_only(type(e), e)).strip()
+
+    if args.profile is not None:
+        profiler.dump_cprofile(
+            profiler.cprofile_path(_target_cprofile_path(args)))
+
+    return (index, error, output.getvalue(), time.time() - start,
+            profiler.report())
+
+
+def load_targets(args):
+    """Per-target arguments for each entry of the --targets manifest; any
+    options a target doesn't give are taken from 'args'"""
+    parser = _build_target_arg_parser()
+    target_flag_dests = flag_dests(parser)
+
+    targets = []
+    outputs = set()
+    for entry in load_manifest(args.targets):
+        target_args = parser.parse_args(
+            manifest_entry_to_argv(entry, target_flag_dests),
+            namespace=argparse.Namespace(**vars(args)))
+
+        output = (os.path.abspath(target_args.output_dir or ''),
+                  target_args.ir_prefix)
+        if output in outputs:
+            parser.error(f"Target output prefix '{target_args.ir_prefix}' "
+                         "is used more than once for the same output "
+                         "directory")
+        outputs.add(output)
+        targets.append(target_args)
+
+    return targets
+
+
+def main_targets(args, profiler):
+    # Fan out: parse the inputs once, then map, crop, adjust and write
+    # each target with a pool of processes.  Returns the profiler
+    # report of each target, by IR prefix
+    targets = load_targets(args)
+    if args.incremental:
+        stale_targets = [t for t in targets if not outputs_up_to_date(t)]
+        print(f"{len(targets) - len(stale_targets)} of {len(targets)} "
+              "targets are up to date, skipping them")
+        targets = stale_targets
+        if len(targets) == 0:
+            return {}
+
+    inputs = _parse_inputs(args, profiler)
+
+    processes = min(args.target_processes or os.cpu_count() or 1,
+                    max(len(targets), 1))
+    if not can_start_processes():
+        processes = 1
+    jobs = list(enumerate(targets))
+    if processes > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+
+    reports = {}
+    errors = {}
+    with profiler.stage("targets", records_in=len(targets)):
+        if processes > 1:
+            pool = context.Pool(processes=processes,
+                                initializer=_init_target_worker,
+                                initargs=(inputs,))
+            results = pool.imap_unordered(_run_target, jobs)
+        else:
+            pool = None
+            _init_target_worker(inputs)
+            results = map(_run_target, jobs)
+
+        try:
+            for done, (i, error, output, elapsed, report) in enumerate(
+                    results, 1):
+                status = "OK" if error is None else "FAILED"
+                print(f"[{done}/{len(jobs)}] {targets[i].ir_prefix}: "
+                      f"{status} ({elapsed:.2f}s)")
+                if output:
+                    print(output, end='' if output.endswith('\n') else '\n')
+                if error is not None:
+                    errors[i] = error
+                reports[targets[i].ir_prefix] = report
+        finally:
+            _init_target_worker(None)
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    if len(errors) > 0:
+        for i in sorted(errors):
+            print(f"  {targets[i].ir_prefix}: {errors[i]}")
+        exit(1)
+
+    return reports
+
+
+def _add_target_arguments(parser):
+    # Options that can be given per target (see --targets)
     parser.add_argument("-H", "--homography-file",
                         type=str,
                         help="Path to homography text file")
@@ -422,9 +1240,15 @@ if __name__ == "__main__":
                         type=str,
                         help="Two KRTD camera file paths (colon-separated)"
                         "being the source:destination cameras")
+    parser.add_argument("--view-lut",
+                        type=str,
+                        help="Approximate the --camera-to-camera transfer "
+                        "by interpolating in a lookup table of sampled "
+                        "transfers saved at this (.npz) path, building it "
+                        "there if there's none for the cameras yet (see "
+                        "--view-lut-grid)")
     parser.add_argument("-p", "--ir-prefix",
                         type=str,
-                        required=True,
                         help="IR clip prefix for output")
     parser.add_argument("--min-spatial-overlap",
                         type=float,
@@ -436,5 +1260,173 @@ if __name__ == "__main__":
                         help="Include geom and type records for actors"
                         "that no longer belong to an activity but have"
                         "otherwise not been filtered out")
+    parser.add_argument("--kw18-precision",
+                        type=int,
+                        help="Number of decimal places for KW18 output "
+                        "values (default is full precision)")
+    parser.add_argument("--compress",
+                        choices=sorted(EXTENSIONS),
+                        help="Compress the output files (adding a .gz, .xz "
+                        "or .zst extension); compressed inputs are read "
+                        "by their extension")
+
+
+def _build_target_arg_parser():
+    parser = argparse.ArgumentParser(prog="eo_to_ir --targets",
+                                     add_help=False)
+    _add_target_arguments(parser)
+    for action in parser._actions:
+        # Options not given by the target keep their command line values
+        action.default = argparse.SUPPRESS
+        if action.dest == 'ir_prefix':
+            action.required = True
+
+    return parser
+
+
+def check_args(parser, args):
+    # Checks across options, which argparse can't make itself
+    if args.targets is None:
+        if args.ir_prefix is None:
+            parser.error("the following arguments are required: "
+                         "-p/--ir-prefix (unless --targets is given)")
+    elif args.streaming:
+        parser.error("--targets can't be used with --streaming")
+
+    if args.view_lut is not None and args.camera_to_camera is None and \
+            args.targets is None:
+        parser.error("--view-lut requires --camera-to-camera")
+    if re.fullmatch(r"\d+x\d+x\d+x\d+", args.view_lut_grid) is None or \
+            min(map(int, args.view_lut_grid.split('x'))) < 2:
+        parser.error("--view-lut-grid must be four numbers (of at least 2) "
+                     "separated by 'x', e.g. "
+                     + "x".join(map(str, VIEW_LUT_GRID)))
+
+    if args.transfer_cache_tolerance is not None and \
+            not args.transfer_cache_tolerance > 0:
+        parser.error("--transfer-cache-tolerance must be positive")
+
+    if args.profile_stage is not None and args.profile is None:
+        parser.error("--profile-stage requires --profile")
+
+    if args.workers is not None and args.workers > 1 and (
+            args.streaming or args.targets is not None):
+        parser.error("--workers can't be used with --streaming or "
+                     "--targets (see --target-processes)")
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Given a homography, a time offset and a pair of geom and "
+        "activity YAML files, crop the activities")
+    parser.add_argument("-g", "--input-geom",
+                        type=str,
+                        required=True,
+                        help="Path to input geometry KPF YAML to warp and "
+                        "crop")
+    parser.add_argument("-a", "--input-activities",
+                        type=str,
+                        required=True,
+                        help="Path to input activity KPF YAML")
+    parser.add_argument("-t", "--input-types",
+                        type=str,
+                        required=True,
+                        help="Path to input types KPF YAML")
+    _add_target_arguments(parser)
+    parser.add_argument("--parse-cache",
+                        type=str,
+                        help="Directory in which to cache parsed inputs for "
+                        "later runs (not used for --streaming geoms)")
+    parser.add_argument("--parse-cache-size",
+                        type=float,
+                        default=1024,
+                        help="Maximum size of the parse cache in MB; least "
+                        "recently used entries are evicted (default is "
+                        "1024)")
+    parser.add_argument("--profile",
+                        type=str,
+                        help="Write a JSON report of the wall time, CPU "
+                        "time, record counts and peak RSS of each stage of "
+                        "the run to this path")
+    parser.add_argument("--profile-stage",
+                        type=str,
+                        help="Also run this stage (e.g. geom.crop or "
+                        "write.geom) under cProfile, writing its stats "
+                        "alongside the --profile report as "
+                        "<report>.<stage>.prof")
+    parser.add_argument("--targets",
+                        type=str,
+                        help="CSV (with a header row) or JSON (list of "
+                        "objects) manifest of IR targets to produce from "
+                        "the inputs, parsing them only once; keys are the "
+                        "per-target long option names (ir_prefix, which is "
+                        "required, output_dir, homography_file, "
+                        "crop_bounds, framerate, frame_offset, "
+                        "camera_to_camera, view_lut, "
+                        "min_spatial_overlap, "
+                        "include_orphans, kw18_precision and compress), "
+                        "with other options taken from the command line")
+    parser.add_argument("--target-processes",
+                        type=int,
+                        help="Number of processes to run --targets with "
+                        "(default is the number of CPUs)")
+    parser.add_argument("--workers",
+                        type=int,
+                        help="Number of processes to map, crop and format "
+                        "the geoms with, sharded by actor (output is the "
+                        "same as with one)")
+    parser.add_argument("--view-lut-grid",
+                        type=str,
+                        default="x".join(map(str, VIEW_LUT_GRID)),
+                        help="Number of samples of the --view-lut table "
+                        "along each of foot x, foot y, width and height "
+                        "of the source boxes (default is %(default)s)")
+    parser.add_argument("--view-lut-tolerance",
+                        type=float,
+                        default=VIEW_LUT_TOLERANCE,
+                        help="Largest error in pixels (from the exact "
+                        "transfer, checked at the middles of each cell of "
+                        "the --view-lut table and of its faces) of the "
+                        "cells to interpolate in; boxes in other cells are "
+                        "transferred exactly (default is %(default)s)")
+    parser.add_argument("--transfer-cache-tolerance",
+                        type=float,
+                        help="Memoize the homography and camera-to-camera "
+                        "transfers of boxes quantized to this many pixels "
+                        "(each box is transferred as the middle of its "
+                        "cell, within half this of it), for the many "
+                        "near-identical boxes of stationary actors; hit "
+                        "and miss counts are reported")
+    parser.add_argument("--transfer-cache-size",
+                        type=int,
+                        default=DEFAULT_MAX_ENTRIES,
+                        help="Number of quantized boxes each transfer "
+                        "cache keeps, evicting the least recently used "
+                        "(default is %(default)s)")
+    parser.add_argument("--compress-threads",
+                        type=int,
+                        default=1,
+                        help="Number of threads to compress each output "
+                        "file with (0 for one per CPU; default is 1)")
+    parser.add_argument("--incremental",
+                        action='store_true',
+                        help="Skip the run (or each --targets target) if "
+                        "its outputs are up to date with the inputs, "
+                        "options and eo_to_ir version recorded in the "
+                        "<ir_prefix>.manifest.json alongside them, and "
+                        "otherwise replace them, writing the manifest")
+    parser.add_argument("--streaming",
+                        action='store_true',
+                        help="Process geoms in chunks, spilling them to "
+                        "disk, to keep memory use bounded by the number of "
+                        "actors rather than the number of geoms (output is "
+                        "the same)")
 
-    main(parser.parse_args())
+    return parser
+
+
+if __name__ == "__main__":
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    check_args(parser, args)
+    main(args)
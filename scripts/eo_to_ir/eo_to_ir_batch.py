@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+import eo_to_ir
+from lib.homography import load_homography_file
+from lib.camera_io import load_camera_krtd_file
+from lib.manifest import (NAME_KEY,
+                          load_manifest,
+                          manifest_entry_to_argv as clip_to_argv,
+                          flag_dests)
+
+
+def clip_name(index, clip):
+    return str(clip.get(NAME_KEY) or
+               clip.get('ir_prefix') or
+               clip.get('ir-prefix') or
+               f"clip {index}")
+
+
+def parse_clip_args(parser, argv):
+    # Returns the parsed arguments, or the argparse error message
+    stderr = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(stderr):
+            args = parser.parse_args(argv)
+            eo_to_ir.check_args(parser, args)
+            return args, None
+    except SystemExit:
+        message = stderr.getvalue().strip().splitlines()[-1]
+        return None, message.split("error: ", 1)[-1]
+
+
+def preload_shared_files(clip_args):
+    # Load each distinct homography, camera and view LUT once, up front;
+    # these are handed to the worker processes rather than loaded (or
+    # built) for every clip
+    for args in clip_args:
+        if args is None:
+            continue
+
+        to_load = []
+        if args.homography_file is not None:
+            to_load.append((load_homography_file, args.homography_file))
+        if args.camera_to_camera is not None:
+            for cam_file in args.camera_to_camera.split(':'):
+                to_load.append((load_camera_krtd_file, cam_file.strip()))
+
+        for load_fn, path in to_load:
+            try:
+                eo_to_ir.load_shared(load_fn, path)
+            except Exception:
+                # Left to fail with the clip(s) using it
+                pass
+
+        if args.view_lut is not None and args.camera_to_camera is not None:
+            try:
+                eo_to_ir.load_shared_view_lut(args)
+            except Exception:
+                pass
+
+    return eo_to_ir._loaded_files
+
+
+def _init_worker(loaded_files):
+    eo_to_ir._loaded_files.update(loaded_files)
+
+
+def run_clip(job):
+    index, args = job
+    start = time.time()
+    output = io.StringIO()
+    error = None
+    try:
+        with contextlib.redirect_stdout(output):
+            eo_to_ir.main(args)
+    except SystemExit as e:
+        # eo_to_ir prints its reason before exiting
+        lines = output.getvalue().strip().splitlines()
+        error = lines[-1] if lines else f"exited with status {e.code}"
+    except Exception as e:
+        error = "".join(
+            traceback.format_exception_only(type(e), e)).strip()
+
+    try:
+        input_bytes = os.path.getsize(args.input_geom)
+    except OSError:
+        input_bytes = 0
+
+    return index, error, output.getvalue(), time.time() - start, input_bytes
+
+
+def main(args, common_argv=()):
+    clips = load_manifest(args.manifest)
+    parser = eo_to_ir.build_arg_parser()
+    clip_flag_dests = flag_dests(parser)
+
+    names = []
+    clip_args = []
+    errors = {}
+    for i, clip in enumerate(clips):
+        names.append(clip_name(i, clip))
+        clip_argv = list(common_argv) + clip_to_argv(clip, clip_flag_dests)
+        if args.output_dir is not None:
+            clip_argv = ["--output-dir", args.output_dir] + clip_argv
+        parsed, error = parse_clip_args(parser, clip_argv)
+        clip_args.append(parsed)
+        if error is not None:
+            errors[i] = error
+
+    loaded_files = preload_shared_files(clip_args)
+
+    jobs = [(i, a) for i, a in enumerate(clip_args) if a is not None]
+    processes = min(args.processes or os.cpu_count() or 1,
+                    max(len(jobs), 1))
+    total_bytes = 0
+    start = time.time()
+    with multiprocessing.Pool(processes=processes,
+                              initializer=_init_worker,
+                              initargs=(loaded_files,)) as pool:
+        for done, (i, error, output, elapsed, input_bytes) in enumerate(
+                pool.imap_unordered(run_clip, jobs), 1):
+            total_bytes += input_bytes
+            status = "OK" if error is None else "FAILED"
+            print(f"[{done}/{len(jobs)}] {names[i]}: {status} "
+                  f"({elapsed:.2f}s)")
+            if output:
+                print(output, end='' if output.endswith('\n') else '\n')
+            if error is not None:
+                errors[i] = error
+    elapsed = time.time() - start
+
+    n_ok = len(clips) - len(errors)
+    print(f"{len(clips)} clips: {n_ok} OK, {len(errors)} failed "
+          f"in {elapsed:.2f}s ({n_ok / max(elapsed, 1e-9):.2f} clips/s, "
+          f"{total_bytes / 1e6 / max(elapsed, 1e-9):.2f} MB/s of geom "
+          f"input, {processes} processes)")
+    for i in sorted(errors):
+        print(f"  {names[i]}: {errors[i]}")
+
+    return 1 if len(errors) > 0 else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run eo_to_ir over a manifest of clips with a pool of "
+        "processes.  Any arguments after '--' are passed to eo_to_ir for "
+        "every clip, before the clip's own options")
+    parser.add_argument("manifest",
+                        type=str,
+                        help="CSV (with a header row) or JSON (list of "
+                        "objects) manifest of clips; keys are eo_to_ir long "
+                        "option names (e.g. input_geom, ir_prefix, "
+                        "include_orphans), with an optional 'name' for "
+                        "each clip")
+    parser.add_argument("-j", "--processes",
+                        type=int,
+                        help="Number of worker processes (default is the "
+                        "number of CPUs)")
+    parser.add_argument("-o", "--output-dir",
+                        type=str,
+                        help="Default output directory for clips that "
+                        "don't specify one")
+
+    argv = sys.argv[1:]
+    if '--' in argv:
+        split = argv.index('--')
+        argv, common_argv = argv[:split], argv[split + 1:]
+    else:
+        common_argv = []
+
+    sys.exit(main(parser.parse_args(argv), common_argv))
@@ -0,0 +1,6 @@
+import os
+
+# compressed_io is shared with the cli_helpers (and kept with them, as
+# they're installed); it's found as lib.compressed_io through this path
+__path__.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, os.pardir, "cli_helpers"))
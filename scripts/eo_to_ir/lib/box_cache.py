@@ -0,0 +1,197 @@
+import collections
+
+import numpy as np
+
+
+DEFAULT_MAX_ENTRIES = 1 << 16
+
+# Number of times cells too coarse for the tolerance are halved
+DEFAULT_LEVELS = 3
+
+# Boxes with coordinates this far from the origin (or that aren't
+# finite) aren't quantized, just transferred
+_MAX_COORD = 1e12
+
+# Multipliers hashing a box's cell to an int64 (wrapping around)
+_CELL_HASH = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F,
+                       0x165667B19E3779F9, 0x27D4EB2F165667C5],
+                      dtype=np.uint64).astype(np.int64)
+
+
+# (Placeholder for cells not yet in the cache)
+_MISSING = object()
+
+
+def _unique_cells(cells):
+    # The distinct rows of an (N, 4) int64 array, and the index of each
+    # row's among them; rows are told apart by hash, falling back to
+    # comparing them if two hash the same
+    with np.errstate(over='ignore'):
+        hashes = np.matmul(cells, _CELL_HASH)
+    _, first, inverse = np.unique(hashes, return_index=True,
+                                  return_inverse=True)
+    unique_cells = cells[first]
+    if not np.array_equal(unique_cells[inverse], cells):
+        unique_cells, inverse = np.unique(cells, axis=0,
+                                          return_inverse=True)
+    return unique_cells, inverse.ravel()
+
+
+class BoxTransferCache(object):
+    """Bounded LRU memo of a box transfer, keyed on boxes quantized to
+    cells of 'tolerance' pixels (or finer, see below).
+
+    'transfer_fn' maps an (N, 4) array of x0, y0, x1, y1 boxes to an
+    (N, 4) array of boxes (NaN where they can't be transferred), as
+    apply_homography_batch and view_to_view_batch do.  Each box is
+    answered with the transfer of the middle of its cell, so results
+    don't depend on the order boxes are seen in (or on the size of the
+    cache).
+
+    A box is within half a cell of its cell's middle in each
+    coordinate, which the transfer may magnify; so when a cell is
+    first transferred, so are boxes half a cell along each coordinate
+    from its middle, bounding (to first order) the difference of the
+    transfers of boxes in the cell from its middle's.  Cells where the
+    bound exceeds 'tolerance' are split into cells halved in size
+    often enough to be within it, up to 'levels' times, past which
+    (or if the cell can't be transferred) boxes in them are transferred
+    exactly.  The cells of each size are kept in their own LRU of
+    'max_entries' cells.
+
+    'hits' counts the boxes answered from a cell already transferred,
+    and 'misses' the others (so they add up to the boxes looked up).
+    """
+
+    def __init__(self, transfer_fn, tolerance,
+                 max_entries=DEFAULT_MAX_ENTRIES, levels=DEFAULT_LEVELS):
+        if not tolerance > 0:
+            raise ValueError("Tolerance must be positive")
+        self.transfer_fn = transfer_fn
+        self.tolerance = float(tolerance)
+        self.max_entries = max_entries
+        self.levels = levels
+        self.hits = 0
+        self.misses = 0
+        # For each level, cell -> its transfer; level 0 cells instead
+        # map to the (int) level to look their boxes up at if finer, or
+        # None if they're transferred exactly
+        self._entries = [collections.OrderedDict()
+                         for _ in range(levels + 1)]
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries)
+
+    def _probe_cells(self, cells):
+        # The transfer of each (level 0) cell's middle, or the level to
+        # split it to (or None)
+        half = self.tolerance / 2
+        middles = (cells + 0.5) * self.tolerance
+        probes = np.concatenate([middles] + [middles + np.eye(4)[k] * half
+                                             for k in range(4)])
+        out = self.transfer_fn(probes).reshape(5, len(cells), 4)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bound = np.max(np.sum(np.abs(out[1:] - out[0]), axis=0),
+                           axis=1)
+            # (Halving the cells halves the bound)
+            levels = np.ceil(np.log2(bound / self.tolerance))
+
+        values = []
+        for level, value in zip(levels.tolist(), out[0].tolist()):
+            if not level <= self.levels:
+                # (Including NaN)
+                values.append(None)
+            elif level <= 0:
+                values.append(value)
+            else:
+                values.append(int(level))
+        return values
+
+    def _lookup(self, level, bounds):
+        # The values of the cells of 'bounds' at 'level' (transferring
+        # or probing those missing), the index of each box's cell and
+        # the number of cells missing
+        cell_size = self.tolerance / 2 ** level
+        cells, inverse = _unique_cells(
+            np.floor(bounds / cell_size).astype(np.int64))
+        keys = list(map(tuple, cells.tolist()))
+
+        entries = self._entries[level]
+        values = [entries.get(key, _MISSING) for key in keys]
+        missing = []
+        for i, value in enumerate(values):
+            if value is _MISSING:
+                missing.append(i)
+            else:
+                entries.move_to_end(keys[i])
+
+        if len(missing) > 0:
+            if level == 0:
+                new_values = self._probe_cells(cells[missing])
+            else:
+                new_values = self.transfer_fn(
+                    (cells[missing] + 0.5) * cell_size).tolist()
+            for i, value in zip(missing, new_values):
+                values[i] = entries[keys[i]] = value
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+        return values, inverse, missing
+
+    def __call__(self, bounds):
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        out = np.empty_like(bounds)
+        if len(bounds) == 0:
+            return out
+
+        quantizable = np.all(np.abs(bounds) < _MAX_COORD, axis=1)
+        if not np.all(quantizable):
+            out[~quantizable] = self.transfer_fn(bounds[~quantizable])
+            out[quantizable] = self(bounds[quantizable])
+            return out
+
+        # Each distinct cell in the batch is looked up once; every box
+        # in a cell that was missing is a miss (those in cells split or
+        # transferred exactly are counted below)
+        values, inverse, missing = self._lookup(0, bounds)
+        missed = np.zeros(len(values), dtype=bool)
+        missed[[i for i in missing
+                if not isinstance(values[i], (int, type(None)))]] = True
+        num_misses = int(np.count_nonzero(missed[inverse]))
+
+        box_levels = np.zeros(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            if value is None:
+                box_levels[i] = -1
+            elif isinstance(value, int):
+                box_levels[i] = value
+        box_levels = box_levels[inverse]
+
+        coarse = box_levels != 0
+        cell_values = np.array([v if isinstance(v, list) else [np.nan] * 4
+                                for v in values])
+        out[:] = cell_values[inverse]
+
+        for level in np.unique(box_levels[coarse]).tolist():
+            at_level = box_levels == level
+            if level < 0:
+                out[at_level] = self.transfer_fn(bounds[at_level])
+                num_misses += int(np.count_nonzero(at_level))
+                continue
+
+            level_values, level_inverse, level_missing = self._lookup(
+                level, bounds[at_level])
+            out[at_level] = np.array(level_values)[level_inverse]
+            num_misses += int(np.count_nonzero(
+                np.isin(level_inverse, level_missing)))
+
+        self.misses += num_misses
+        self.hits += len(bounds) - num_misses
+        return out
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self),
+                'hit_rate': self.hits / lookups if lookups else 0.0}
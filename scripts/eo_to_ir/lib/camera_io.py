@@ -31,45 +31,71 @@
 """
 
 import numpy as np
+import numpy.linalg as npl
 import glob
 import os
 
 
+class Camera(object):
+    """A KRTD camera, along with the matrices derived from it.
 
-def parse_camera_krtd(fin):
-    """Parse a single camera in KRT format from the file object.
-
-    Returns a (K,R,t,d) tuple using numpy.matrix types where:
+    All of the derived matrices are computed once, on construction:
 
         K is a 3x3 calibration matrix
         R is a 3x3 rotation matrix
-        t is a 1x3 translation vector (transposed).
-        d is a tuple of distortion parameters
+        t is a length 3 translation vector
+        d is a list of distortion parameters
+        K_inv is the inverse of K
+        R_T is the transpose (inverse) of R
+        center is the camera center in world coordinates (-R^T t)
+        P is the 3x4 projection matrix K [R | t]
+        ground_to_image is the homography from the world z = 0 plane
+            to the image
+        image_to_ground is the homography from the image to the world
+            z = 0 plane
+    """
+    __slots__ = ('K', 'R', 't', 'd', 'K_inv', 'R_T', 'center', 'P',
+                 'ground_to_image', 'image_to_ground')
+
+    def __init__(self, K, R, t, d):
+        self.K = np.array(K, dtype=np.float64).reshape(3, 3)
+        self.R = np.array(R, dtype=np.float64).reshape(3, 3)
+        self.t = np.array(t, dtype=np.float64).reshape(3)
+        self.d = list(d)
+
+        self.K_inv = npl.inv(self.K)
+        self.R_T = self.R.T.copy()
+        self.center = -np.matmul(self.R_T, self.t)
+        self.P = np.matmul(self.K, np.hstack((self.R, self.t[:, None])))
+        self.ground_to_image = self.P[:, [0, 1, 3]]
+        self.image_to_ground = npl.inv(self.ground_to_image)
+
+
+def parse_camera_krtd(fin):
+    """Parse a single camera in KRT format from the file object.
+
+    Returns a Camera (see above) with K, R, t and d from the file.
     """
     K1 = list(map(float, next(fin).split()))
     K2 = list(map(float, next(fin).split()))
     K3 = list(map(float, next(fin).split()))
-    K = np.matrix([K1, K2, K3])
+    K = np.array([K1, K2, K3])
     next(fin)
     R1 = list(map(float, next(fin).split()))
     R2 = list(map(float, next(fin).split()))
     R3 = list(map(float, next(fin).split()))
-    R = np.matrix([R1, R2, R3])
+    R = np.array([R1, R2, R3])
     next(fin)
-    t = np.matrix(list(map(float, next(fin).split())))
+    t = np.array(list(map(float, next(fin).split())))
     next(fin)
     d = list(map(float, next(fin).split()))
-    return [K, R, t.transpose(), d]
+    return Camera(K, R, t, d)
 
 
 def load_camera_krtd_file(filename):
     """Loads an ASCII camera file in KRTD format.
 
-    Returns a dictionary mapping file names to (K, R, t, d) tuples.
-        K is a 3x3 calibration matrix
-        R is a 3x3 rotation matrix
-        t is a 1x3 translation vector (transposed).
-        d is a tuple of distortion parameters
+    Returns a Camera with K, R, t and d from the file.
     """
     with open(filename, 'r') as f:
         return parse_camera_krtd(f)
@@ -78,7 +104,7 @@ def load_camera_krtd_file(filename):
 def load_camera_krtd_glob(fileglob):
     """Loads a set of KRTD camera files specified by a file glob
 
-    Returns a dictionary mapping file names to cameras (K, R, t, d)
+    Returns a dictionary mapping file names to Cameras
     """
     cameras = dict()
     files = sorted(glob.glob(fileglob))
@@ -90,8 +116,7 @@ def load_camera_krtd_glob(fileglob):
 def write_camera_krtd(camera, fout):
     """Write a single camera in ASCII KRTD format to the file object.
     """
-    K, R, t, d = camera
-    t = np.reshape(np.array(t), 3)
+    K, R, t, d = camera.K, camera.R, camera.t, camera.d
     fout.write('%.12g %.12g %.12g\n' % tuple(K.tolist()[0]))
     fout.write('%.12g %.12g %.12g\n' % tuple(K.tolist()[1]))
     fout.write('%.12g %.12g %.12g\n\n' % tuple(K.tolist()[2]))
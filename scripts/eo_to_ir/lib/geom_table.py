@@ -0,0 +1,447 @@
+import array
+
+import numpy as np
+
+
+# Keys stored as columns; everything else goes to the per-record side
+# table ('extras'), with the original key order kept in 'layouts'
+CORE_KEYS = ('id0', 'id1', 'ts0', 'ts1', 'g0')
+
+
+def dedup_ts0_rows(actor, ts0):
+    """Rows to keep for a single row per (actor, ts0).
+
+    The last row for a given (actor, ts0) is kept, at the position of
+    the first; returns the positions (sorted) and the rows kept there.
+    """
+    n = len(ts0)
+    order = np.lexsort((np.arange(n), ts0, actor))
+    s_actor = actor[order]
+    s_ts0 = ts0[order]
+    starts = np.flatnonzero(np.concatenate((
+        [n > 0],
+        (s_actor[1:] != s_actor[:-1]) | (s_ts0[1:] != s_ts0[:-1]))))
+
+    ends = np.concatenate((starts[1:], [n])) - 1
+    first = order[starts]
+    last = order[ends]
+    by_first = np.argsort(first)
+
+    return first[by_first], last[by_first]
+
+
+class GeomTable(object):
+    """Columnar storage for KPF geom records.
+
+    Records are grouped by actor (id1), in order of each actor's first
+    appearance, with the rows for 'actor_ids[i]' stored in
+    'actor_offsets[i]:actor_offsets[i + 1]'.  Within an actor rows keep
+    their input order.
+
+    Columns:
+        id0, id1, ts0   int64
+        ts1             float64 ('ts1_int' marks integer valued inputs)
+        bounds          (N, 4) float64 of x0, y0, x1, y1 (from 'g0')
+        layout          index into 'layouts', the key order of each record
+        extras          tuple of the non-core values of each record
+        overlap         post-crop to pre-crop area ratio (internal, may
+                        be None)
+        offscreen       rows flagged as "off-screen" (may be None)
+    """
+
+    def __init__(self, actor_ids, actor_offsets, id0, id1, ts0, ts1,
+                 ts1_int, bounds, layout, layouts, extras,
+                 overlap=None, offscreen=None):
+        self.actor_ids = actor_ids
+        self.actor_offsets = actor_offsets
+        self.id0 = id0
+        self.id1 = id1
+        self.ts0 = ts0
+        self.ts1 = ts1
+        self.ts1_int = ts1_int
+        self.bounds = bounds
+        self.layout = layout
+        self.layouts = layouts
+        self.extras = extras
+        self.overlap = overlap
+        self.offscreen = offscreen
+
+    def __len__(self):
+        return len(self.ts0)
+
+    def __getitem__(self, key):
+        # Row slices (e.g. chunks) or boolean row masks; either way the
+        # result keeps all of the actors, some possibly empty
+        if isinstance(key, slice):
+            start, end, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("GeomTable slices must be contiguous")
+            return self._slice(start, max(start, end))
+        else:
+            return self.compress(key)
+
+    @classmethod
+    def concatenate(cls, tables):
+        """Join tables sharing the same actors and layouts (e.g. chunks
+        of a single table) back into one table, in order"""
+        first = tables[0]
+
+        def _cat(column):
+            values = [getattr(t, column) for t in tables]
+            if any(v is None for v in values):
+                return None
+            return np.concatenate(values)
+
+        return cls(
+            first.actor_ids,
+            np.sum([t.actor_offsets for t in tables], axis=0),
+            _cat('id0'),
+            _cat('id1'),
+            _cat('ts0'),
+            _cat('ts1'),
+            _cat('ts1_int'),
+            np.concatenate([t.bounds for t in tables]),
+            _cat('layout'),
+            first.layouts,
+            [e for t in tables for e in t.extras],
+            _cat('overlap'),
+            _cat('offscreen'))
+
+    # Columns saved by 'to_arrays' (overlap and offscreen are only set
+    # once the table has been through the pipeline)
+    ARRAY_COLUMNS = ('actor_ids', 'actor_offsets', 'id0', 'id1', 'ts0',
+                     'ts1', 'ts1_int', 'bounds', 'layout')
+
+    def to_arrays(self):
+        """Split the table into a dict of its array columns and a tuple
+        of its other (Python object) columns, e.g. for saving"""
+        return ({k: getattr(self, k) for k in self.ARRAY_COLUMNS},
+                (self.layouts, self.extras))
+
+    @classmethod
+    def from_arrays(cls, arrays, objects):
+        layouts, extras = objects
+        return cls(*[arrays[k] for k in cls.ARRAY_COLUMNS], layouts, extras)
+
+    @property
+    def x0(self):
+        return self.bounds[:, 0]
+
+    @property
+    def y0(self):
+        return self.bounds[:, 1]
+
+    @property
+    def x1(self):
+        return self.bounds[:, 2]
+
+    @property
+    def y1(self):
+        return self.bounds[:, 3]
+
+    def actor_counts(self):
+        return np.diff(self.actor_offsets)
+
+    def has_key(self, key):
+        """Boolean mask of the rows whose record includes 'key'"""
+        in_layout = np.array([key in keys for keys in self.layouts],
+                             dtype=bool)
+        return in_layout[self.layout]
+
+    def ts1_values(self):
+        """ts1 as a list of Python values (int or float as in the input,
+        None where the record has no ts1)
+        """
+        has_ts1 = self.has_key('ts1').tolist()
+        return [(int(ts1) if is_int else ts1) if has else None
+                for ts1, is_int, has in zip(self.ts1.tolist(),
+                                            self.ts1_int.tolist(),
+                                            has_ts1)]
+
+    def _subset(self, rows, actor_offsets):
+        extras = self.extras
+        return GeomTable(
+            self.actor_ids,
+            actor_offsets,
+            self.id0[rows],
+            self.id1[rows],
+            self.ts0[rows],
+            self.ts1[rows],
+            self.ts1_int[rows],
+            self.bounds[rows],
+            self.layout[rows],
+            self.layouts,
+            [extras[i] for i in rows.tolist()],
+            None if self.overlap is None else self.overlap[rows],
+            None if self.offscreen is None else self.offscreen[rows])
+
+    def _slice(self, start, end):
+        def _s(column):
+            return None if column is None else column[start:end]
+
+        return GeomTable(
+            self.actor_ids,
+            np.clip(self.actor_offsets - start, 0, end - start),
+            self.id0[start:end],
+            self.id1[start:end],
+            self.ts0[start:end],
+            self.ts1[start:end],
+            self.ts1_int[start:end],
+            self.bounds[start:end],
+            self.layout[start:end],
+            self.layouts,
+            self.extras[start:end],
+            _s(self.overlap),
+            _s(self.offscreen))
+
+    def compress(self, mask):
+        """Return a new table with only the rows where 'mask' is set"""
+        cumulative = np.concatenate(([0], np.cumsum(mask)))
+        return self._subset(np.flatnonzero(mask),
+                            cumulative[self.actor_offsets])
+
+    def select_actors(self, actor_mask):
+        """Return a new table with only the actors where 'actor_mask' is
+        set (actor_ids is preserved, unselected actors are left empty)
+        """
+        return self.compress(np.repeat(actor_mask, self.actor_counts()))
+
+    def dedup_ts0(self):
+        """Keep a single row per (actor, ts0).
+
+        Mirrors building a {ts0: geom} dict per actor: the last record
+        for a given ts0 wins, but appears at the position of the first.
+        """
+        n = len(self)
+        if n == 0:
+            return self
+
+        actor = np.repeat(np.arange(len(self.actor_ids)),
+                          self.actor_counts())
+        first, rows = dedup_ts0_rows(actor, self.ts0)
+        if len(rows) == n:
+            return self
+
+        return self._subset(rows,
+                            np.searchsorted(first, self.actor_offsets))
+
+    def iter_actor_slices(self):
+        """Yield (actor_id, start, end) for each actor"""
+        offsets = self.actor_offsets.tolist()
+        for i, actor_id in enumerate(self.actor_ids.tolist()):
+            yield actor_id, offsets[i], offsets[i + 1]
+
+    def iter_records(self, start=0, end=None):
+        """Yield rows as KPF geom dicts with their original key order.
+
+        Rows flagged 'offscreen' get an "occlusion: off-screen" value.
+        """
+        if end is None:
+            end = len(self)
+
+        layouts = self.layouts
+        extras = self.extras
+        id0s = self.id0[start:end].tolist()
+        id1s = self.id1[start:end].tolist()
+        ts0s = self.ts0[start:end].tolist()
+        ts1s = self.ts1[start:end].tolist()
+        ts1_ints = self.ts1_int[start:end].tolist()
+        bounds = self.bounds[start:end].tolist()
+        layout = self.layout[start:end].tolist()
+        if self.offscreen is None:
+            offscreen = [False] * (end - start)
+        else:
+            offscreen = self.offscreen[start:end].tolist()
+
+        for i in range(end - start):
+            rec_extras = iter(extras[start + i])
+            rec = {}
+            for k in layouts[layout[i]]:
+                if k == 'id0':
+                    rec[k] = id0s[i]
+                elif k == 'id1':
+                    rec[k] = id1s[i]
+                elif k == 'ts0':
+                    rec[k] = ts0s[i]
+                elif k == 'ts1':
+                    rec[k] = int(ts1s[i]) if ts1_ints[i] else ts1s[i]
+                elif k == 'g0':
+                    rec[k] = ' '.join(map(str, bounds[i]))
+                else:
+                    rec[k] = next(rec_extras)
+
+            if offscreen[i]:
+                rec['occlusion'] = "off-screen"
+
+            yield rec
+
+
+class ActorFrameIndex(object):
+    """Per-actor sorted frame (ts0) index over a GeomTable.
+
+    Answers how many of an actor's frames within a ts0 range qualify
+    (as per a row mask, e.g. not "off-screen"), and the first and last
+    of those, with a pair of binary searches.  Frames with several rows
+    qualify if any of their rows do.
+    """
+
+    def __init__(self, geom_table, qualifying=None):
+        self._index(geom_table.actor_ids,
+                    geom_table.actor_counts(),
+                    geom_table.ts0,
+                    qualifying)
+
+    @classmethod
+    def from_actor_frames(cls, actor_ids, actor_counts, ts0,
+                          qualifying=None):
+        """Index from the columns alone: 'ts0' holds each actor's frames
+        in turn, 'actor_counts' of them for each of 'actor_ids'"""
+        frame_index = cls.__new__(cls)
+        frame_index._index(np.asarray(actor_ids),
+                           np.asarray(actor_counts),
+                           np.asarray(ts0),
+                           qualifying)
+        return frame_index
+
+    def _index(self, actor_ids, actor_counts, ts0, qualifying):
+        n = len(ts0)
+        if qualifying is None:
+            qualifying = np.ones(n, dtype=bool)
+        qualifying = np.asarray(qualifying, dtype=bool)
+
+        n_actors = len(actor_ids)
+        actor = np.repeat(np.arange(n_actors), actor_counts)
+        order = np.lexsort((ts0, actor))
+        s_actor = actor[order]
+        s_ts0 = ts0[order]
+        starts = np.flatnonzero(np.concatenate((
+            [n > 0],
+            (s_actor[1:] != s_actor[:-1]) | (s_ts0[1:] != s_ts0[:-1]))))
+
+        self.ts0 = s_ts0[starts]
+        if n > 0:
+            frame_qualifying = np.logical_or.reduceat(qualifying[order],
+                                                      starts)
+        else:
+            frame_qualifying = np.zeros(0, dtype=bool)
+        # Number of qualifying frames before each frame, and the
+        # positions of the qualifying frames
+        self.qualifying_before = np.concatenate(
+            ([0], np.cumsum(frame_qualifying)))
+        self.qualifying_pos = np.flatnonzero(frame_qualifying)
+
+        offsets = np.searchsorted(s_actor[starts],
+                                  np.arange(n_actors + 1)).tolist()
+        self.actor_spans = {actor_id: (offsets[i], offsets[i + 1])
+                            for i, actor_id in
+                            enumerate(actor_ids.tolist())}
+
+    def qualifying_range(self, actor_id, ts0_s, ts0_e):
+        """Return (count, first ts0, last ts0) of the actor's qualifying
+        frames within [ts0_s, ts0_e]; the ts0s are None if count is 0
+        """
+        span = self.actor_spans.get(actor_id)
+        if span is None:
+            return 0, None, None
+
+        start, end = span
+        ts0 = self.ts0[start:end]
+        lo = start + int(np.searchsorted(ts0, ts0_s, side='left'))
+        hi = start + int(np.searchsorted(ts0, ts0_e, side='right'))
+        if hi <= lo:
+            return 0, None, None
+
+        first = int(self.qualifying_before[lo])
+        last = int(self.qualifying_before[hi])
+        if last == first:
+            return 0, None, None
+
+        return (last - first,
+                int(self.ts0[self.qualifying_pos[first]]),
+                int(self.ts0[self.qualifying_pos[last - 1]]))
+
+
+class GeomTableBuilder(object):
+    """Accumulates geom records into compact arrays for a GeomTable"""
+
+    def __init__(self):
+        self._id0 = array.array('q')
+        self._id1 = array.array('q')
+        self._ts0 = array.array('q')
+        self._ts1 = array.array('d')
+        self._ts1_int = array.array('b')
+        self._bounds = array.array('d')
+        self._layout = array.array('q')
+        self._layout_index = {}
+        self._extras = []
+
+    def __len__(self):
+        return len(self._ts0)
+
+    def append(self, geom_rec):
+        keys = tuple(geom_rec.keys())
+        layout = self._layout_index.get(keys)
+        if layout is None:
+            layout = self._layout_index[keys] = len(self._layout_index)
+
+        for k in ('id1', 'ts0', 'g0'):
+            if k not in geom_rec:
+                raise ValueError(f"Geom record missing '{k}': {geom_rec}")
+
+        id0 = geom_rec.get('id0', 0)
+        id1 = geom_rec['id1']
+        ts0 = geom_rec['ts0']
+        ts1 = geom_rec.get('ts1', float('nan'))
+        if not all(isinstance(v, int) for v in (id0, id1, ts0)):
+            raise ValueError(
+                f"Geom record with non-integer id0/id1/ts0: {geom_rec}")
+        if not isinstance(ts1, (int, float)):
+            raise ValueError(f"Geom record with non-numeric ts1: {geom_rec}")
+
+        g0 = str(geom_rec['g0']).split()
+        if len(g0) != 4:
+            raise ValueError(f"Geom record with malformed g0: {geom_rec}")
+
+        self._id0.append(id0)
+        self._id1.append(id1)
+        self._ts0.append(ts0)
+        self._ts1.append(ts1)
+        self._ts1_int.append(isinstance(ts1, int))
+        self._bounds.extend(map(float, g0))
+        self._layout.append(layout)
+        self._extras.append(tuple(v for k, v in geom_rec.items()
+                                  if k not in CORE_KEYS))
+
+    def build(self):
+        id1 = np.frombuffer(self._id1, dtype=np.int64)
+        n = len(id1)
+
+        # Group rows by actor in order of first appearance
+        uniq, first_idx, inverse = np.unique(
+            id1, return_index=True, return_inverse=True)
+        by_appearance = np.argsort(first_idx)
+        rank = np.empty_like(by_appearance)
+        rank[by_appearance] = np.arange(len(uniq))
+        actor = rank[inverse.reshape(-1)]
+        order = np.argsort(actor, kind='stable')
+        actor_offsets = np.searchsorted(actor[order],
+                                        np.arange(len(uniq) + 1))
+
+        extras = self._extras
+        layouts = [None] * len(self._layout_index)
+        for keys, i in self._layout_index.items():
+            layouts[i] = keys
+
+        return GeomTable(
+            uniq[by_appearance],
+            actor_offsets,
+            np.frombuffer(self._id0, dtype=np.int64)[order],
+            id1[order],
+            np.frombuffer(self._ts0, dtype=np.int64)[order],
+            np.frombuffer(self._ts1, dtype=np.float64)[order],
+            np.frombuffer(self._ts1_int, dtype=np.int8)[order].astype(bool),
+            np.frombuffer(self._bounds,
+                          dtype=np.float64).reshape(n, 4)[order],
+            np.frombuffer(self._layout, dtype=np.int64)[order],
+            layouts,
+            [extras[i] for i in order.tolist()])
@@ -22,3 +22,31 @@ def apply_homography(homography, bounds):
             np.min(homographied[:, 1]),
             np.max(homographied[:, 0]),
             np.max(homographied[:, 1]))
+
+
+def apply_homography_batch(homography, bounds, min_w=1e-12):
+    # Bounds are expected as an (N, 4) array of x0, y0, x1, y1; returns
+    # the (N, 4) boxes around each of the warped boxes.  Boxes with a
+    # corner mapped to (or near) infinity, i.e. |w| <= min_w, come back
+    # as NaN
+    bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+
+    # Corners in the same order (and with the same arithmetic) as
+    # apply_homography, so results are identical
+    bound_points = np.ones((len(bounds), 4, 3))
+    bound_points[:, :, 0] = bounds[:, [0, 0, 2, 2]]
+    bound_points[:, :, 1] = bounds[:, [1, 3, 1, 3]]
+
+    homographied = np.matmul(bound_points, np.transpose(homography))
+
+    w = homographied[:, :, 2]
+    degenerate = np.any(np.abs(w) <= min_w, axis=1)
+    w[degenerate] = 1.0
+
+    homographied = homographied[:, :, 0:2] / w[:, :, None]
+
+    out = np.concatenate((np.min(homographied, axis=1),
+                          np.max(homographied, axis=1)), axis=1)
+    out[degenerate] = np.nan
+
+    return out
@@ -0,0 +1,248 @@
+import re
+
+import yaml
+
+from .compressed_io import open_file
+
+
+# KPF files are written one record per line as a YAML flow sequence
+# entry (e.g. "- { geom: { id0: 1, id1: 1, ts0: 2098, g0: ... } }").
+# Constructing a PyYAML parser for every line dominates the runtime on
+# large files, so the common subset of flow YAML used by KPF is parsed
+# here directly.  Anything outside of that subset is left to PyYAML,
+# and scalar resolution mirrors PyYAML's (YAML 1.1) implicit resolvers
+# for the values we accept.
+
+class _Unhandled(Exception):
+    pass
+
+
+_TOKEN_RE = re.compile(r'''[ ]*(?:
+    (?P<ind>[{}\[\],])
+   |(?P<colon>:)(?=[ \r\n{}\[\],]|$)
+   |"(?P<dq>[^"\\\r\n]*)"
+   |'(?P<sq>[^'\r\n]*)'
+   |(?P<plain>(?:-(?=[^ \r\n{}\[\],])|[^ \r\n{}\[\],:\#"'&*!|>%@`?\-])
+              [^\r\n{}\[\],:\#]*)
+)''', re.VERBOSE)
+
+_TRAILER_RE = re.compile(r'(?: +\#.*)?[ \r\n]*\Z')
+_BLANK_RE = re.compile(r' *(?:\#.*)?[\r\n]*\Z')
+
+_INT_RE = re.compile(r'[-+]?(?:0|[1-9][0-9]*)\Z')
+_FLOAT_RE = re.compile(r'[-+]?[0-9]+\.[0-9]*(?:[eE][-+][0-9]+)?\Z')
+# Whitespace separated numbers (e.g. a "g0" bounding box) are plain
+# strings to YAML
+_NUMBER_LIST_RE = re.compile(
+    r'[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?'
+    r'(?: +[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?)+\Z')
+_STR_START_RE = re.compile(r'[A-Za-z_]')
+
+_CONSTANTS = {'~': None, 'null': None, 'Null': None, 'NULL': None}
+for _word, _value in (('yes', True), ('no', False),
+                      ('true', True), ('false', False),
+                      ('on', True), ('off', False)):
+    for _variant in (_word, _word.capitalize(), _word.upper()):
+        _CONSTANTS[_variant] = _value
+
+# Fast path for flat records such as "- { geom: { k: v, ... } }"
+_FLAT_RE = re.compile(
+    r' *- +\{ *([A-Za-z_][A-Za-z0-9_]*) *: *'
+    r'\{([^{}\[\]"\'\#]*)\} *,? *\} *[\r\n]*\Z')
+
+
+def _resolve_plain(s):
+    if s in _CONSTANTS:
+        return _CONSTANTS[s]
+    elif _STR_START_RE.match(s):
+        return s
+    elif _INT_RE.match(s):
+        return int(s)
+    elif _FLOAT_RE.match(s):
+        return float(s)
+    elif _NUMBER_LIST_RE.match(s):
+        return s
+    else:
+        # Octal/hex ints, sexagesimals, timestamps, etc.
+        raise _Unhandled()
+
+
+def _tokenize(line, pos, end):
+    tokens = []
+    while pos < end:
+        m = _TOKEN_RE.match(line, pos)
+        if m is None:
+            trailer = _TRAILER_RE.match(line, pos)
+            if trailer is None:
+                raise _Unhandled()
+            break
+
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == 'ind':
+            tokens.append(m.group('ind'))
+        elif kind == 'colon':
+            tokens.append(':')
+        elif kind == 'plain':
+            tokens.append((m.group('plain').rstrip(' '), True))
+        else:
+            tokens.append((m.group(kind), False))
+
+    return tokens
+
+
+def _parse_node(tokens, i):
+    tok = tokens[i]
+    if tok == '{':
+        return _parse_mapping(tokens, i + 1)
+    elif tok == '[':
+        return _parse_sequence(tokens, i + 1)
+    elif isinstance(tok, tuple):
+        value, plain = tok
+        return (_resolve_plain(value) if plain else value), i + 1
+    else:
+        raise _Unhandled()
+
+
+def _parse_mapping(tokens, i):
+    out = {}
+    while True:
+        tok = tokens[i]
+        if tok == '}':
+            return out, i + 1
+        elif not isinstance(tok, tuple):
+            raise _Unhandled()
+
+        key, i = _parse_node(tokens, i)
+        if tokens[i] != ':':
+            raise _Unhandled()
+        i += 1
+
+        if tokens[i] in (',', '}'):
+            value = None
+        else:
+            value, i = _parse_node(tokens, i)
+        out[key] = value
+
+        tok = tokens[i]
+        if tok == ',':
+            i += 1
+        elif tok != '}':
+            raise _Unhandled()
+
+
+def _parse_sequence(tokens, i):
+    out = []
+    while True:
+        tok = tokens[i]
+        if tok == ']':
+            return out, i + 1
+
+        value, i = _parse_node(tokens, i)
+        out.append(value)
+
+        tok = tokens[i]
+        if tok == ',':
+            i += 1
+        elif tok != ']':
+            raise _Unhandled()
+
+
+def _parse_flat(line):
+    m = _FLAT_RE.match(line)
+    if m is None:
+        return None
+
+    rec = {}
+    items = m.group(2).split(',')
+    for n, item in enumerate(items):
+        kv = item.split(': ')
+        if len(kv) != 2:
+            # Only a trailing comma may leave an empty item
+            if n + 1 < len(items) or item.strip(' '):
+                return None
+            continue
+
+        key = kv[0].strip(' ')
+        value = kv[1].strip(' ')
+        if not key or ':' in key or ':' in value:
+            return None
+        rec[_resolve_plain(key)] = _resolve_plain(value) if value else None
+
+    return [{_resolve_plain(m.group(1)): rec}]
+
+
+def parse_kpf_line(line):
+    """Parse a single line of a KPF YAML file.
+
+    Returns the list of records on the line (as yaml.safe_load would),
+    an empty list for blank or comment lines, or None if the line uses
+    YAML beyond the subset understood here.
+    """
+    if '\t' in line:
+        # PyYAML rejects tabs in most places within flow collections
+        return None
+
+    try:
+        out = _parse_flat(line)
+        if out is not None:
+            return out
+
+        start = len(line) - len(line.lstrip(' '))
+        if line.startswith('- ', start):
+            tokens = _tokenize(line, start + 2, len(line))
+            tokens.append(None)
+            value, i = _parse_node(tokens, 0)
+            if tokens[i] is not None:
+                return None
+            return [value]
+        elif _BLANK_RE.match(line, start):
+            return []
+        else:
+            return None
+    except (_Unhandled, IndexError):
+        return None
+
+
+def iter_kpf_yaml_list(path):
+    """Iterate over the records of a one-record-per-line KPF file,
+    falling back to PyYAML for lines which can't be parsed directly.
+    """
+    with open_file(path, 'r', encoding='utf-8-sig') as inf:
+        for line in inf:
+            recs = parse_kpf_line(line)
+            if recs is None:
+                try:
+                    recs = yaml.safe_load(line)
+                except yaml.YAMLError as exc:
+                    print(exc)
+                    exit(1)
+
+            yield from recs
+
+
+def load_kpf_yaml(path):
+    """Load a KPF YAML document, parsing line by line when every line
+    is a top-level record we understand and falling back to PyYAML for
+    the whole document otherwise (e.g. for multi-line records).
+    """
+    out_recs = []
+    with open_file(path, 'r', encoding='utf-8-sig') as inf:
+        for line in inf:
+            # Indented content belongs to a multi-line block structure
+            if line[:1] == ' ' and line.strip():
+                break
+            recs = parse_kpf_line(line)
+            if recs is None:
+                break
+            out_recs.extend(recs)
+        else:
+            if len(out_recs) > 0:
+                return out_recs
+
+    with open_file(path, 'r') as inf:
+        try:
+            return yaml.safe_load(inf)
+        except yaml.YAMLError as exc:
+            print(exc)
+            exit(1)
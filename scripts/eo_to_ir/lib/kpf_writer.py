@@ -0,0 +1,178 @@
+# Writing KPF YAML one record per line (as flow YAML), in the same form
+# as utils.kpf_yaml_dump.  Geoms are formatted straight from the columns
+# of a GeomTable with a line template per record layout, and lines are
+# written out in large batches
+
+from .compressed_io import open_file
+
+
+# Buffer size for output files, and the number of lines to batch up
+# for each writelines call
+WRITE_BUFFER_SIZE = 1 << 20
+LINES_PER_WRITE = 16384
+
+# Values which are formatted with str()
+_PLAIN_TYPES = frozenset((str, int, float, bool, type(None)))
+
+# Template fields for the geom columns; rows are formatted with
+# (id0, id1, ts0, ts1, x0, y0, x1, y1, *extras)
+_GEOM_CORE_FIELDS = {'id0': '{0}',
+                     'id1': '{1}',
+                     'ts0': '{2}',
+                     'ts1': '{3}',
+                     'g0': '{4} {5} {6} {7}'}
+_GEOM_NUM_CORE_FIELDS = 8
+
+
+def dump_kpf_value(obj):
+    if type(obj) is str:
+        return obj
+    elif isinstance(obj, dict):
+        return "{{ {} }}".format(
+            ", ".join([_dump_kpf_item(k, v) for k, v in obj.items()]))
+    elif isinstance(obj, list):
+        return "[{}]".format(', '.join(map(dump_kpf_value, obj)))
+    else:
+        return str(obj)
+
+
+def _dump_kpf_item(key, value):
+    k_str = dump_kpf_value(key)
+    v_str = dump_kpf_value(value)
+    if k_str == "meta" and isinstance(value, str):
+        return f"{k_str}: \"{v_str}\""
+    else:
+        return f"{k_str}: {v_str}"
+
+
+def format_kpf_record(rec):
+    return f"- {dump_kpf_value(rec)}\n"
+
+
+def _escape(s):
+    return s.replace('{', '{{').replace('}', '}}')
+
+
+def _geom_templates(keys):
+    # Line templates for geom rows with the given key order, as is and
+    # when flagged "off-screen"; None where the generic dump is needed
+    key_strs = [dump_kpf_value(k) for k in keys]
+    if "meta" in key_strs:
+        return None, None
+
+    fields = []
+    num_extras = 0
+    for k, k_str in zip(keys, key_strs):
+        if k in _GEOM_CORE_FIELDS:
+            fields.append([_escape(k_str), _GEOM_CORE_FIELDS[k]])
+        else:
+            fields.append([_escape(k_str),
+                           "{%d}" % (_GEOM_NUM_CORE_FIELDS + num_extras)])
+            num_extras += 1
+
+    def _template(fields):
+        return ("- {{ geom: {{ " +
+                ", ".join(f"{k}: {v}" for k, v in fields) +
+                " }} }}\n")
+
+    offscreen_fields = [list(f) for f in fields]
+    if 'occlusion' in keys:
+        offscreen_fields[keys.index('occlusion')][1] = "off-screen"
+    else:
+        offscreen_fields.append(["occlusion", "off-screen"])
+
+    return _template(fields), _template(offscreen_fields)
+
+
+def format_geom_lines(geom_table, start=0, end=None):
+    """KPF lines for the geom rows in [start, end) of a GeomTable, the
+    same as dumping the records from 'iter_records'"""
+    if end is None:
+        end = len(geom_table)
+    n = end - start
+
+    templates = [_geom_templates(keys) for keys in geom_table.layouts]
+    id0s = geom_table.id0[start:end].tolist()
+    id1s = geom_table.id1[start:end].tolist()
+    ts0s = geom_table.ts0[start:end].tolist()
+    ts1s = geom_table.ts1[start:end].tolist()
+    ts1_ints = geom_table.ts1_int[start:end]
+    if ts1_ints.any():
+        ts1s = [int(ts1) if is_int else ts1
+                for ts1, is_int in zip(ts1s, ts1_ints.tolist())]
+    bounds = geom_table.bounds[start:end].tolist()
+    layout = geom_table.layout[start:end].tolist()
+    if geom_table.offscreen is None:
+        offscreen = [0] * n
+    else:
+        offscreen = geom_table.offscreen[start:end].astype(int).tolist()
+    extras = geom_table.extras[start:end]
+
+    lines = []
+    for i in range(n):
+        template = templates[layout[i]][offscreen[i]]
+        if template is None:
+            rec, = geom_table.iter_records(start + i, start + i + 1)
+            lines.append(format_kpf_record({'geom': rec}))
+            continue
+
+        rec_extras = extras[i]
+        for v in rec_extras:
+            if type(v) not in _PLAIN_TYPES:
+                rec_extras = [dump_kpf_value(v) for v in rec_extras]
+                break
+
+        x0, y0, x1, y1 = bounds[i]
+        lines.append(template.format(id0s[i], id1s[i], ts0s[i], ts1s[i],
+                                     x0, y0, x1, y1, *rec_extras))
+
+    return lines
+
+
+class KPFWriter(object):
+    """Buffered writer of KPF YAML records (one per line), compressed
+    by the extension of 'path' (see compressed_io.open_file)"""
+
+    def __init__(self, path, threads=None):
+        self._file = open_file(path, 'w', buffering=WRITE_BUFFER_SIZE,
+                               threads=threads)
+        self._lines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_lines(self, lines):
+        self._lines.extend(lines)
+        if len(self._lines) >= LINES_PER_WRITE:
+            self.flush()
+
+    def write_record(self, rec):
+        self._lines.append(format_kpf_record(rec))
+        if len(self._lines) >= LINES_PER_WRITE:
+            self.flush()
+
+    def write_meta(self, meta_value):
+        self.write_record({'meta': meta_value})
+
+    def write_activity(self, activity_rec):
+        self.write_record({'act': activity_rec})
+
+    def write_types(self, types_rec):
+        self.write_record({'types': types_rec})
+
+    def write_geom(self, geom_rec):
+        self.write_record({'geom': geom_rec})
+
+    def write_geom_table(self, geom_table, start=0, end=None):
+        self.write_lines(format_geom_lines(geom_table, start, end))
+
+    def flush(self):
+        self._file.writelines(self._lines)
+        self._lines = []
+
+    def close(self):
+        self.flush()
+        self._file.close()
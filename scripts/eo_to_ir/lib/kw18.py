@@ -0,0 +1,95 @@
+import numpy as np
+
+from .compressed_io import open_file
+
+
+# KW18 columns: track ID, number of frames in the track, frame number,
+# tracking-plane location (x, y), velocity (x, y), image location
+# (x, y), bounding box (x0, y0, x1, y1), area, world location (x, y,
+# z) and timestamp.  We only have boxes, so the locations are the box
+# centres and the velocity and world location are left as 0
+
+# Number of lines to format at a time
+KW18_BLOCK_SIZE = 65536
+
+# With full precision, values are written as str() would
+_KW18_REPR_TEMPLATE = ("{0} {1} {2} {3} {4} 0.0 0.0 {3} {4} "
+                       "{5} {6} {7} {8} {9} 0.0 0.0 0.0 {10}\n")
+
+
+def _kw18_fixed_template(precision):
+    f = "%.{}f".format(int(precision))
+    zero = f % 0.0
+    return " ".join(["%d", "%d", "%d", f, f, zero, zero, f, f,
+                     f, f, f, f, f, zero, zero, zero, f]) + "\n"
+
+
+def format_kw18(track_ids,
+                track_frames,
+                frame_numbers,
+                bounds,
+                timestamps,
+                precision=None):
+    """Format KW18 lines from columns of per-box values, returning the
+    text of all of the lines.
+
+    'bounds' is an (N, 4) array of x0, y0, x1, y1 boxes; the other
+    columns are length N sequences.  With 'precision' None, values are
+    written in full (as with str(), and timestamps may be None);
+    otherwise floats are written with 'precision' decimal places (and
+    missing timestamps as nan).
+    """
+    bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+    x0, y0, x1, y1 = bounds.T
+    cx = (x0 + x1) / 2
+    cy = (y0 + y1) / 2
+    area = (x1 - x0) * (y1 - y0)
+
+    if precision is None:
+        return "".join([_KW18_REPR_TEMPLATE.format(*rec) for rec in zip(
+            np.asarray(track_ids).tolist(),
+            list(track_frames),
+            np.asarray(frame_numbers).tolist(),
+            cx.tolist(),
+            cy.tolist(),
+            x0.tolist(),
+            y0.tolist(),
+            x1.tolist(),
+            y1.tolist(),
+            area.tolist(),
+            list(timestamps))])
+
+    values = np.column_stack((
+        np.asarray(track_ids, dtype=np.float64),
+        np.asarray(track_frames, dtype=np.float64),
+        np.asarray(frame_numbers, dtype=np.float64),
+        cx, cy, x0, y0, x1, y1, area,
+        np.array([np.nan if t is None else t for t in timestamps],
+                 dtype=np.float64)))
+    # Image location repeats the tracking-plane location
+    values = values[:, [0, 1, 2, 3, 4, 3, 4, 5, 6, 7, 8, 9, 10]]
+
+    return ((_kw18_fixed_template(precision) * len(values)) %
+            tuple(values.ravel().tolist()))
+
+
+def write_kw18(outpath,
+               track_ids,
+               track_frames,
+               frame_numbers,
+               bounds,
+               timestamps,
+               precision=None,
+               threads=None):
+    """Write a KW18 file from columns of per-box values (as for
+    'format_kw18'), a block of lines at a time (compressed by the
+    extension of 'outpath', with 'threads' compression threads)"""
+    with open_file(outpath, 'w', buffering=1 << 20, threads=threads) as of:
+        for start in range(0, len(track_ids), KW18_BLOCK_SIZE):
+            end = start + KW18_BLOCK_SIZE
+            of.write(format_kw18(track_ids[start:end],
+                                 track_frames[start:end],
+                                 frame_numbers[start:end],
+                                 bounds[start:end],
+                                 timestamps[start:end],
+                                 precision))
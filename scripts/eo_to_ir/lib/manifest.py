@@ -0,0 +1,50 @@
+import csv
+import json
+import os
+
+from .compressed_io import open_file, strip_compression
+
+
+# Manifest keys that aren't eo_to_ir options
+NAME_KEY = 'name'
+
+TRUE_STRINGS = {'1', 'true', 'yes', 'on'}
+
+
+def load_manifest(path):
+    # A JSON list of objects or a CSV file with a header row; keys are
+    # eo_to_ir long option names (with '-' or '_'), plus an optional
+    # 'name' for the entry (either may be compressed)
+    with open_file(path, 'r', newline='') as inf:
+        if os.path.splitext(strip_compression(path))[1].lower() == '.json':
+            entries = json.load(inf)
+            if not (isinstance(entries, list) and
+                    all(isinstance(e, dict) for e in entries)):
+                raise ValueError(
+                    f"Manifest '{path}' isn't a JSON list of objects")
+            return entries
+        else:
+            return list(csv.DictReader(inf))
+
+
+def manifest_entry_to_argv(entry, flag_dests):
+    argv = []
+    for key, value in entry.items():
+        if key is None or key.strip() == NAME_KEY:
+            continue
+
+        dest = key.strip().lstrip('-').replace('-', '_')
+        if dest in flag_dests:
+            # Flags are set by JSON true or CSV values such as "1"
+            if value is True or str(value).strip().lower() in TRUE_STRINGS:
+                argv.append("--" + dest.replace('_', '-'))
+        elif value is not None and str(value).strip() != '':
+            argv.extend(("--" + dest.replace('_', '-'), str(value).strip()))
+
+    return argv
+
+
+def flag_dests(parser):
+    # Destinations of the parser's options that take no value
+    return {a.dest for a in parser._actions
+            if a.nargs == 0 and a.dest != 'help'}
@@ -0,0 +1,181 @@
+import glob
+import hashlib
+import io
+import json
+import os
+import pickle
+import tempfile
+import zipfile
+
+import numpy as np
+
+
+# Bump when the layout of cached entries changes
+CACHE_FORMAT_VERSION = 1
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+
+def hash_file(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as inf:
+        for block in iter(lambda: inf.read(block_size), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def _pickle_value(value):
+    return {}, value
+
+
+def _unpickle_value(arrays, objects):
+    return objects
+
+
+class ParseCache(object):
+    """On-disk cache of parsed input files.
+
+    Each entry is an .npz of arrays (with any other Python objects
+    pickled into it) and a JSON sidecar recording the source file's
+    path, size, mtime and content hash.  Entries are reused while the
+    size and mtime match, or otherwise if the content hash does.  The
+    sidecar's mtime is the last use, and the least recently used
+    entries are evicted to keep the cache within 'max_bytes'.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_paths(self, kind, path):
+        key = hashlib.sha1("{}\0{}\0{}".format(
+            CACHE_FORMAT_VERSION, kind, os.path.abspath(path)).encode(
+                'utf-8', 'surrogateescape')).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + ".npz", base + ".json"
+
+    def get(self, kind, path, parse_fn,
+            encode=_pickle_value, decode=_unpickle_value):
+        """Return parse_fn(path), from the cache where possible.
+
+        'encode' splits the parsed value into a dict of arrays and the
+        remaining (picklable) objects; 'decode' reverses that.  By
+        default the whole value is pickled.
+        """
+        entry_path, sidecar_path = self._entry_paths(kind, path)
+        st = os.stat(path)
+
+        try:
+            with open(sidecar_path, 'r') as inf:
+                sidecar = json.load(inf)
+        except (OSError, ValueError):
+            sidecar = None
+
+        content_hash = None
+        if sidecar is not None and sidecar.get('size') == st.st_size:
+            if sidecar.get('mtime_ns') == st.st_mtime_ns:
+                valid = True
+            else:
+                content_hash = hash_file(path)
+                valid = sidecar.get('sha256') == content_hash
+                if valid:
+                    sidecar['mtime_ns'] = st.st_mtime_ns
+                    self._write_sidecar(sidecar_path, sidecar)
+
+            if valid:
+                value = self._load(entry_path, decode)
+                if value is not None:
+                    # Mark as recently used
+                    try:
+                        os.utime(sidecar_path)
+                    except OSError:
+                        pass
+                    return value
+
+        if content_hash is None:
+            content_hash = hash_file(path)
+        value = parse_fn(path)
+        self._store(entry_path, sidecar_path, path, st, content_hash,
+                    *encode(value))
+
+        return value
+
+    def _load(self, entry_path, decode):
+        try:
+            with np.load(entry_path, allow_pickle=False) as entry:
+                arrays = {k: entry[k] for k in entry.files
+                          if k != '__objects__'}
+                objects = pickle.loads(entry['__objects__'].tobytes())
+        except (OSError, ValueError, KeyError, EOFError,
+                pickle.UnpicklingError, zipfile.BadZipFile):
+            return None
+
+        return decode(arrays, objects)
+
+    def _store(self, entry_path, sidecar_path, path, st, content_hash,
+               arrays, objects):
+        buf = io.BytesIO()
+        np.savez(buf,
+                 __objects__=np.frombuffer(
+                     pickle.dumps(objects, protocol=pickle.HIGHEST_PROTOCOL),
+                     dtype=np.uint8),
+                 **arrays)
+        self._write_atomic(entry_path, buf.getvalue())
+        self._write_sidecar(sidecar_path, {
+            'version': CACHE_FORMAT_VERSION,
+            'path': os.path.abspath(path),
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'sha256': content_hash,
+            'nbytes': buf.tell()})
+
+        self.evict(keep=(entry_path, sidecar_path))
+
+    def _write_sidecar(self, sidecar_path, sidecar):
+        self._write_atomic(sidecar_path,
+                           json.dumps(sidecar, indent=1).encode('utf-8'))
+
+    def _write_atomic(self, out_path, data):
+        # Concurrent runs may share the cache, so entries are only ever
+        # replaced whole
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as of:
+                of.write(data)
+            os.replace(tmp_path, out_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def evict(self, keep=()):
+        """Remove the least recently used entries until the cache fits
+        within 'max_bytes' (other than the 'keep' entry paths)"""
+        entries = []
+        total = 0
+        for sidecar_path in glob.glob(os.path.join(self.cache_dir,
+                                                   "*.json")):
+            entry_path = os.path.splitext(sidecar_path)[0] + ".npz"
+            try:
+                size = (os.path.getsize(sidecar_path) +
+                        os.path.getsize(entry_path))
+                last_used = os.path.getmtime(sidecar_path)
+            except OSError:
+                continue
+            total += size
+            entries.append((last_used, size, entry_path, sidecar_path))
+
+        entries.sort()
+        for last_used, size, entry_path, sidecar_path in entries:
+            if total <= self.max_bytes:
+                break
+            if entry_path in keep:
+                continue
+
+            for p in (sidecar_path, entry_path):
+                try:
+                    os.unlink(p)
+                except OSError:
+                    pass
+            total -= size
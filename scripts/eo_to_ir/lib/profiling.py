@@ -0,0 +1,195 @@
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # (Not available on Windows)
+    resource = None
+
+from .compressed_io import open_file
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far, or None"""
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _Stage(object):
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.records_in = None
+        self.records_out = None
+        self.peak_rss_before = None
+        self.peak_rss = None
+        # Other named counts (e.g. cache hits), summed
+        self.counts = {}
+
+    def add_records(self, records_in=None, records_out=None):
+        if records_in is not None:
+            self.records_in = (self.records_in or 0) + records_in
+        if records_out is not None:
+            self.records_out = (self.records_out or 0) + records_out
+
+    def add_counts(self, **counts):
+        for name, count in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + count
+
+    def as_dict(self):
+        d = {'name': self.name,
+             'calls': self.calls,
+             'wall_time': self.wall_time,
+             'cpu_time': self.cpu_time}
+        if self.records_in is not None:
+            d['records_in'] = self.records_in
+        if self.records_out is not None:
+            d['records_out'] = self.records_out
+        if self.counts:
+            d['counts'] = dict(self.counts)
+        if self.peak_rss is not None:
+            d['peak_rss'] = self.peak_rss
+            # How far the stage raised the process's peak RSS
+            d['peak_rss_increase'] = self.peak_rss - self.peak_rss_before
+        return d
+
+
+class StageProfiler(object):
+    """Accumulates wall time, CPU time, record counts and peak RSS for
+    named stages of a run.
+
+    A stage may be entered any number of times (e.g. once per chunk),
+    and its totals accumulate.  If 'cprofile_stage' is given, that
+    stage is also run under cProfile (across all of its calls).
+    """
+
+    def __init__(self, cprofile_stage=None):
+        self.cprofile_stage = cprofile_stage
+        self._stages = {}
+        self._cprofile = None
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+
+    def _get_stage(self, name):
+        if name not in self._stages:
+            self._stages[name] = _Stage(name)
+        return self._stages[name]
+
+    @contextlib.contextmanager
+    def stage(self, name, records_in=None, records_out=None):
+        """Time the body as (a call of) stage 'name'; the yielded stage's
+        'add_records' can be used to count records from within"""
+        stage = self._get_stage(name)
+        stage.add_records(records_in, records_out)
+        if stage.peak_rss_before is None:
+            stage.peak_rss_before = peak_rss_bytes()
+
+        profile = None
+        if name == self.cprofile_stage:
+            if self._cprofile is None:
+                self._cprofile = cProfile.Profile()
+            profile = self._cprofile
+
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield stage
+        finally:
+            if profile is not None:
+                profile.disable()
+            stage.calls += 1
+            stage.wall_time += time.perf_counter() - start_wall
+            stage.cpu_time += time.process_time() - start_cpu
+            stage.peak_rss = peak_rss_bytes()
+
+    def add_counts(self, name, **counts):
+        """Add to named counts (e.g. cache_hits=...) of stage 'name'"""
+        self._get_stage(name).add_counts(**counts)
+
+    def wrap_batch(self, name, batch_fn):
+        """Wrap a chunk mapping function (for xd_map) to be
+        profiled as stage 'name', counting rows in and out"""
+        def _f(chunk):
+            with self.stage(name, records_in=len(chunk)) as stage:
+                out = batch_fn(chunk)
+                stage.add_records(records_out=len(out))
+            return out
+
+        return _f
+
+    def wrap_mask(self, name, mask_fn):
+        """Wrap a chunk mask function (for xd_filter_mask) to be profiled
+        as stage 'name', counting rows in and rows kept"""
+        def _f(chunk):
+            with self.stage(name, records_in=len(chunk)) as stage:
+                mask = mask_fn(chunk)
+                stage.add_records(records_out=int(mask.sum()))
+            return mask
+
+        return _f
+
+    def iterate(self, name, iterable, count_fn=len):
+        """Iterate over 'iterable', profiling the production of each item
+        as stage 'name' (with count_fn(item) records out)"""
+        it = iter(iterable)
+        while True:
+            with self.stage(name) as stage:
+                try:
+                    item = next(it)
+                except StopIteration:
+                    # (Not counted as a call)
+                    stage.calls -= 1
+                    return
+                stage.add_records(records_out=count_fn(item))
+            yield item
+
+    def add_report(self, report):
+        """Accumulate the stages of another profiler's report (e.g. from
+        a worker process) into ours; times are summed across processes"""
+        for d in report['stages']:
+            stage = self._get_stage(d['name'])
+            stage.calls += d['calls']
+            stage.wall_time += d['wall_time']
+            stage.cpu_time += d['cpu_time']
+            stage.add_records(d.get('records_in'), d.get('records_out'))
+            stage.add_counts(**d.get('counts', {}))
+
+    def report(self):
+        return {'stages': [s.as_dict() for s in self._stages.values()],
+                'total': {'wall_time': time.perf_counter() - self._start_wall,
+                          'cpu_time': time.process_time() - self._start_cpu,
+                          'peak_rss': peak_rss_bytes()}}
+
+    def write(self, path, **extra):
+        """Write the report (with any 'extra' keys) as JSON to 'path', and
+        any cProfile stats for the profiled stage alongside it (see
+        'cprofile_path')"""
+        report = self.report()
+        report.update(extra)
+        with open_file(path, 'w') as of:
+            json.dump(report, of, indent=2)
+            of.write('\n')
+
+        self.dump_cprofile(self.cprofile_path(path))
+
+    def dump_cprofile(self, path):
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(path)
+
+    def cprofile_path(self, path):
+        # e.g. profile.json -> profile.geom.crop.prof
+        return "%s.%s.prof" % (os.path.splitext(path)[0],
+                               self.cprofile_stage)
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from .parse_cache import hash_file
+
+
+# Bump when the layout of run manifests changes
+RUN_MANIFEST_VERSION = 1
+
+
+def fingerprint(path, known=None):
+    """The size, mtime and content hash of the file at 'path'.  The hash
+    of 'known' (an earlier fingerprint of the file) is reused while the
+    size and mtime match, so unchanged files aren't read again."""
+    st = os.stat(path)
+    if (known is not None and
+            known.get('size') == st.st_size and
+            known.get('mtime_ns') == st.st_mtime_ns and
+            'sha256' in known):
+        content_hash = known['sha256']
+    else:
+        content_hash = hash_file(path)
+
+    return {'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'sha256': content_hash}
+
+
+def source_version(paths):
+    """A hash of the given source files, standing in for a tool version"""
+    h = hashlib.sha256()
+    for path in sorted(paths):
+        h.update(os.path.basename(path).encode('utf-8') + b'\0')
+        with open(path, 'rb') as inf:
+            h.update(inf.read())
+
+    return h.hexdigest()
+
+
+def run_key(tool_version, options, input_hashes):
+    """Content address of a run's outputs: a hash of the tool version,
+    the options and the content hashes of the inputs"""
+    return hashlib.sha256(json.dumps(
+        {'version': RUN_MANIFEST_VERSION,
+         'tool_version': tool_version,
+         'options': options,
+         'inputs': input_hashes},
+        sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def load_run_manifest(path):
+    # None if there's no (readable) manifest at 'path'
+    try:
+        with open(path, 'r') as inf:
+            manifest = json.load(inf)
+    except (OSError, ValueError):
+        return None
+
+    if (not isinstance(manifest, dict) or
+            manifest.get('version') != RUN_MANIFEST_VERSION):
+        return None
+    return manifest
+
+
+def outputs_match(manifest, output_paths):
+    """Whether each of 'output_paths' exists with the content recorded
+    for it in 'manifest'"""
+    recorded = manifest.get('outputs', {})
+    for path in output_paths:
+        known = recorded.get(os.path.basename(path))
+        if known is None:
+            return False
+        try:
+            content_hash = fingerprint(path, known)['sha256']
+        except OSError:
+            return False
+        if content_hash != known.get('sha256'):
+            return False
+
+    return True
+
+
+def write_run_manifest(path, key, tool_version, options, inputs,
+                       output_paths):
+    """Write (or atomically replace) the manifest at 'path' recording
+    the run 'key', what it was computed from, and the fingerprints of
+    the run's outputs"""
+    manifest = {'version': RUN_MANIFEST_VERSION,
+                'key': key,
+                'tool_version': tool_version,
+                'options': options,
+                'inputs': inputs,
+                'outputs': {os.path.basename(p): fingerprint(p)
+                            for p in output_paths}}
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                    prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as of:
+            json.dump(manifest, of, indent=2)
+            of.write('\n')
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
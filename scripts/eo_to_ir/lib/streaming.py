@@ -0,0 +1,214 @@
+import os
+import pickle
+
+import numpy as np
+
+from .geom_table import dedup_ts0_rows
+
+
+class ActorFrameSummary(object):
+    """Per-actor summary of surviving geom frames, for streaming.
+
+    Actors are ranked in order of first appearance (as they're added),
+    and for each we keep the min/max surviving ts0 and a bitmap of the
+    surviving frames over that range, so memory grows with the number
+    of actors (and their lifetimes) rather than the number of geoms.
+
+    Provides the same 'qualifying_range' lookup as ActorFrameIndex
+    (with every surviving frame qualifying).
+    """
+
+    def __init__(self):
+        self.actor_ids = []
+        self.actor_rank = {}
+        self._base = []
+        self._frames = []
+        self._min_ts0 = []
+        self._max_ts0 = []
+
+    def __len__(self):
+        return len(self.actor_ids)
+
+    def add_actors(self, actor_ids):
+        for actor_id in actor_ids:
+            if actor_id not in self.actor_rank:
+                self.actor_rank[actor_id] = len(self.actor_ids)
+                self.actor_ids.append(actor_id)
+                self._base.append(0)
+                self._frames.append(np.zeros(0, dtype=np.uint8))
+                self._min_ts0.append(None)
+                self._max_ts0.append(None)
+
+    def ranks(self, actor_ids):
+        return np.array([self.actor_rank[a] for a in actor_ids],
+                        dtype=np.int64)
+
+    def add_frames(self, actor_id, ts0s):
+        """Mark an (int64) array of frames as surviving for an actor"""
+        if len(ts0s) == 0:
+            return
+
+        self.add_actors([actor_id])
+        rank = self.actor_rank[actor_id]
+        lo, hi = int(ts0s.min()), int(ts0s.max())
+        if self._min_ts0[rank] is None:
+            self._min_ts0[rank], self._max_ts0[rank] = lo, hi
+            self._base[rank] = lo
+            self._frames[rank] = np.zeros((hi - lo) // 8 + 1, dtype=np.uint8)
+        else:
+            self._min_ts0[rank] = min(lo, self._min_ts0[rank])
+            self._max_ts0[rank] = max(hi, self._max_ts0[rank])
+            self._grow(rank)
+
+        bits = ts0s - self._base[rank]
+        np.bitwise_or.at(self._frames[rank],
+                         bits >> 3,
+                         (1 << (bits & 7)).astype(np.uint8))
+
+    def _grow(self, rank):
+        # Extend the bitmap (by whole bytes, so the existing bits keep
+        # their place) to cover the actor's current frame range
+        base = self._base[rank]
+        frames = self._frames[rank]
+        grow_down = max(0, (base - self._min_ts0[rank] + 7) // 8)
+        grow_up = max(0, (self._max_ts0[rank] - base) // 8 + 1 - len(frames))
+        if grow_down == 0 and grow_up == 0:
+            return
+
+        # Over-allocate so that actors growing a few frames at a time
+        # don't copy their bitmap for every chunk
+        if grow_down > 0:
+            grow_down = max(grow_down, len(frames) // 2)
+        if grow_up > 0:
+            grow_up = max(grow_up, len(frames) // 2)
+
+        grown = np.zeros(grow_down + len(frames) + grow_up, dtype=np.uint8)
+        grown[grow_down:grow_down + len(frames)] = frames
+        self._base[rank] = base - grow_down * 8
+        self._frames[rank] = grown
+
+    def frame_range(self, actor_id):
+        """(min, max) surviving ts0 for an actor, or None"""
+        rank = self.actor_rank.get(actor_id)
+        if rank is None or self._min_ts0[rank] is None:
+            return None
+        return self._min_ts0[rank], self._max_ts0[rank]
+
+    def qualifying_range(self, actor_id, ts0_s, ts0_e):
+        """Return (count, first ts0, last ts0) of the actor's surviving
+        frames within [ts0_s, ts0_e]; the ts0s are None if count is 0
+        """
+        frame_range = self.frame_range(actor_id)
+        if frame_range is None:
+            return 0, None, None
+
+        min_ts0, max_ts0 = frame_range
+        lo = max(int(np.ceil(ts0_s)), min_ts0)
+        hi = min(int(np.floor(ts0_e)), max_ts0)
+        if hi < lo:
+            return 0, None, None
+
+        rank = self.actor_rank[actor_id]
+        base = self._base[rank]
+        byte_lo, byte_hi = (lo - base) // 8, (hi - base) // 8
+        bits = np.unpackbits(self._frames[rank][byte_lo:byte_hi + 1],
+                             bitorder='little')
+        offset = base + byte_lo * 8
+        set_frames = np.flatnonzero(
+            bits[lo - offset:hi - offset + 1]) + lo
+        if len(set_frames) == 0:
+            return 0, None, None
+
+        return (len(set_frames),
+                int(set_frames[0]),
+                int(set_frames[-1]))
+
+
+class GeomSpill(object):
+    """Spills rows to disk a piece per actor (and write), recording the
+    offset of each piece, so that they can be read back an actor at a
+    time without holding more than a piece of rows in memory.
+
+    Each row is an actor rank, a ts0 and a (picklable) value.
+    """
+
+    def __init__(self, spill_dir):
+        self.path = os.path.join(spill_dir, "geoms.pkl")
+        self._offsets = {}
+
+    def write(self, ranks, ts0s, values):
+        """Spill rows, grouped into a piece per actor (rows keep their
+        order within each actor)
+        """
+        rows = np.argsort(ranks, kind='stable')
+        sorted_ranks = ranks[rows]
+        bounds = np.flatnonzero(np.concatenate((
+            [True], sorted_ranks[1:] != sorted_ranks[:-1], [True])))
+        with open(self.path, 'ab') as of:
+            for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+                if start == end:
+                    continue
+                piece_rows = rows[start:end]
+                self._offsets.setdefault(int(sorted_ranks[start]), []).append(
+                    of.tell())
+                # (ts0s apart from the values, to be read alone)
+                pickle.dump(ts0s[piece_rows], of,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump([values[i] for i in piece_rows.tolist()], of,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+
+    def iter_actors(self):
+        """Yield (rank, pieces) for each actor in rank order, with pieces
+        an iterator of the actor's (ts0s, values) in the order they were
+        written, to be consumed before the next actor.
+
+        A single row is kept per ts0; as with dedup_ts0_rows, the last
+        row written for it, at the position of the first.
+        """
+        if not self._offsets:
+            return
+        with open(self.path, 'rb') as inf:
+            for rank in sorted(self._offsets):
+                yield rank, self._iter_pieces(inf, self._offsets[rank])
+
+    def _read(self, inf, offset, values=False):
+        inf.seek(offset)
+        ts0s = pickle.load(inf)
+        if not values:
+            return ts0s
+        return ts0s, pickle.load(inf)
+
+    def _iter_pieces(self, inf, offsets):
+        piece_ts0s = [self._read(inf, offset) for offset in offsets]
+        ts0s = np.concatenate(piece_ts0s)
+        first, last = dedup_ts0_rows(np.zeros(len(ts0s), dtype=np.int64),
+                                     ts0s)
+        if len(first) == len(ts0s):
+            for offset in offsets:
+                yield self._read(inf, offset, values=True)
+            return
+
+        # The row to write at each kept position (or -1)
+        source = np.full(len(ts0s), -1, dtype=np.int64)
+        source[first] = last
+        piece_starts = np.cumsum([0] + [len(t) for t in piece_ts0s])
+
+        # Values of the rows written at an earlier position than their
+        # own are read ahead (only these are held for the whole actor)
+        moved = last[last != first]
+        moved_values = {}
+        moved_pieces = np.searchsorted(piece_starts, moved, 'right') - 1
+        for piece in np.unique(moved_pieces).tolist():
+            _, values = self._read(inf, offsets[piece], values=True)
+            for row in moved[moved_pieces == piece].tolist():
+                moved_values[row] = values[row - piece_starts[piece]]
+
+        for piece, offset in enumerate(offsets):
+            start = piece_starts[piece]
+            piece_ts0s, values = self._read(inf, offset, values=True)
+            piece_source = source[start:piece_starts[piece + 1]]
+            keep = np.flatnonzero(piece_source >= 0)
+            yield (piece_ts0s[keep],
+                   [values[i] if row == start + i else moved_values[row]
+                    for i, row in zip(keep.tolist(),
+                                      piece_source[keep].tolist())])
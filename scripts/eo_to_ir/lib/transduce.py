@@ -38,3 +38,46 @@ def xd(*components):
         return lambda x: x
     else:
         return reduce(compose, components)
+
+
+# Batch transducers work on whole chunks (e.g. lists, arrays or column
+# tables) rather than records, so that each stage costs one call per
+# chunk.  Chunks are passed along as a single item, so these compose
+# with xd_map/xd_filter stages that are written against chunks (xd_map
+# of a chunk mapping function is the batch map), and xd_cat can hand
+# the records of each chunk to per-record stages.
+
+def _select(chunk, mask):
+    if isinstance(chunk, (list, tuple)):
+        return [x for x, keep in zip(chunk, mask) if keep]
+    else:
+        return chunk[mask]
+
+
+def xd_filter_mask(mask_func):
+    # 'mask_func' returns a boolean mask of the items in the chunk to
+    # keep; empty chunks aren't passed on
+    def _filter_mask_xd(reducer):
+        def _apply(init, chunk):
+            selected = _select(chunk, mask_func(chunk))
+            if len(selected) > 0:
+                return reducer(init, selected)
+            else:
+                return init
+
+        return _apply
+    return _filter_mask_xd
+
+
+def xd_cat(reducer):
+    # Pass each item of a chunk on to the (per-record) reducer
+    def _apply(init, chunk):
+        return reduce(reducer, chunk, init)
+
+    return _apply
+
+
+def chunks(items, chunk_size):
+    # Split anything that supports len() and slicing into chunks
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
@@ -1,10 +1,17 @@
 import os
 
+import numpy as np
 import yaml
 
+from .compressed_io import open_file
+from .kpf import iter_kpf_yaml_list, load_kpf_yaml
+from .geom_table import GeomTable, GeomTableBuilder
+from .kpf_writer import dump_kpf_value
+from .kw18 import write_kw18
+
 
 def load_yaml(path):
-    with open(path, 'r') as inf:
+    with open_file(path, 'r') as inf:
         try:
             return yaml.safe_load(inf)
         except yaml.YAMLError as exc:
@@ -13,20 +20,22 @@ def load_yaml(path):
 
 
 def load_yaml_list(path):
-    out_recs = []
-    with open(path, 'rb') as inf:
-        for line in inf:
-            try:
-                out_recs.extend(yaml.safe_load(line))
-            except yaml.YAMLError as exc:
-                print(exc)
-                exit(1)
+    return list(iter_kpf_yaml_list(path))
+
+
+# The parse_* functions take an optional parsed input cache (a
+# parse_cache.ParseCache) to parse through
+
 
-    return out_recs
+def parse_activities_yaml(path, parse_cache=None):
+    if parse_cache is not None:
+        return parse_cache.get('activities', path, _parse_activities_yaml)
 
+    return _parse_activities_yaml(path)
 
-def parse_activities_yaml(path):
-    yaml_activities = load_yaml(path)
+
+def _parse_activities_yaml(path):
+    yaml_activities = load_kpf_yaml(path)
     activity_records = []
     non_activity_records = []
     for item in yaml_activities:
@@ -38,23 +47,67 @@ def parse_activities_yaml(path):
     return yaml_activities, activity_records, non_activity_records
 
 
-def parse_geom_yaml(path):
-    yaml_geom = load_yaml_list(path)
-    geoms_by_actor = {}
+def parse_geom_yaml(path, parse_cache=None):
+    if parse_cache is not None:
+        return parse_cache.get('geom', path, _parse_geom_yaml,
+                               _encode_geoms, _decode_geoms)
+
+    return _parse_geom_yaml(path)
+
+
+def _encode_geoms(parsed):
+    non_geom_records, geom_table = parsed
+    arrays, objects = geom_table.to_arrays()
+    return arrays, (non_geom_records, objects)
+
+
+def _decode_geoms(arrays, objects):
+    non_geom_records, table_objects = objects
+    return non_geom_records, GeomTable.from_arrays(arrays, table_objects)
+
+
+def _parse_geom_yaml(path):
+    geom_builder = GeomTableBuilder()
+    non_geom_records = []
+    for item in iter_kpf_yaml_list(path):
+        if 'geom' not in item:
+            non_geom_records.append(item)
+            continue
+
+        geom_builder.append(item.get('geom'))
+
+    return non_geom_records, geom_builder.build()
+
+
+def iter_geom_yaml_chunks(path, chunk_size):
+    """Parse a geom KPF file 'chunk_size' geoms at a time, yielding the
+    non-geom records and a GeomTable of the geoms for each chunk"""
+    geom_builder = GeomTableBuilder()
     non_geom_records = []
-    for item in yaml_geom:
+    for item in iter_kpf_yaml_list(path):
         if 'geom' not in item:
             non_geom_records.append(item)
             continue
 
-        geom_rec = item.get('geom')
-        geoms_by_actor.setdefault(geom_rec.get('id1'), []).append(geom_rec)
+        geom_builder.append(item.get('geom'))
+        if len(geom_builder) >= chunk_size:
+            yield non_geom_records, geom_builder.build()
+            geom_builder = GeomTableBuilder()
+            non_geom_records = []
+
+    if len(geom_builder) > 0 or len(non_geom_records) > 0:
+        yield non_geom_records, geom_builder.build()
 
-    return yaml_geom, non_geom_records, geoms_by_actor
 
+def parse_type_yaml(path, parse_cache=None):
+    if parse_cache is not None:
+        return parse_cache.get('types', path, _parse_type_yaml)
 
-def parse_type_yaml(path):
-    yaml_types = load_yaml(path)
+    return _parse_type_yaml(path)
+
+
+def _parse_type_yaml(path):
+    yaml_types = load_kpf_yaml(path)
     record_by_actor = {}
     for item in yaml_types:
         if 'types' in item:
@@ -72,56 +125,47 @@ def abort_if_file_exists(path):
 
 
 def kpf_yaml_dump(obj):
-    if isinstance(obj, dict):
-        kv_strs = []
-        for k, v in obj.items():
-            k_str = kpf_yaml_dump(k)
-            bare_v_str = kpf_yaml_dump(v)
-            if k_str == "meta" and isinstance(v, str):
-                v_str = f"\"{bare_v_str}\""
-            else:
-                v_str = bare_v_str
-
-            kv_strs.append(f"{k_str}: {v_str}")
-
-        return "{{ {} }}".format(
-            ", ".join(kv_strs))
-    elif isinstance(obj, list):
-        return "[{}]".format(', '.join(map(kpf_yaml_dump, obj)))
-    else:
-        return str(obj)
-
-
-def dump_geoms_as_kw18(geoms, num_track_frames_lookup, outpath):
-    with open(outpath, 'w') as of:
-        for geom in geoms:
-            track_id = geom.get('id1')
-            x0, y0, x1, y1 = map(float, geom.get('g0').split())
-            cx = (x0 + x1) / 2
-            cy = (y0 + y1) / 2
-            kw18_rec = (track_id,
-                        num_track_frames_lookup.get(track_id, 0),
-                        geom.get('ts0'),
-                        cx,
-                        cy,
-                        0.0,
-                        0.0,
-                        cx,
-                        cy,
-                        x0,
-                        y0,
-                        x1,
-                        y1,
-                        (x1 - x0) * (y1 - y0),
-                        0.0,
-                        0.0,
-                        0.0,
-                        geom.get('ts1'))
-
-            print(" ".join(map(str, kw18_rec)), file=of)
+    return dump_kpf_value(obj)
+
+
+def dump_geoms_as_kw18(geom_table, num_track_frames_lookup, outpath,
+                       precision=None, threads=None):
+    track_frames = []
+    for actor_id, start, end in geom_table.iter_actor_slices():
+        track_frames.extend(
+            [num_track_frames_lookup.get(actor_id, 0)] * (end - start))
+
+    write_kw18(outpath,
+               geom_table.id1,
+               track_frames,
+               geom_table.ts0,
+               geom_table.bounds,
+               geom_table.ts1_values(),
+               precision,
+               threads)
 
 
 def area_of_bounds(bounds):
     x0, y0, x1, y1 = bounds
 
     return abs(x1 - x0) * abs(y1 - y0)
+
+
+def round_as_formatted(values, places):
+    """Elementwise float("%0.<places>f" % v) for an array of values.
+
+    Rounding the scaled values matches the formatted result except
+    within rounding error of a half way point, where we fall back on
+    formatting the value.
+    """
+    scaled = values * 10.0 ** places
+    rounded = np.rint(scaled) / 10.0 ** places
+    with np.errstate(invalid='ignore'):
+        ambiguous = np.flatnonzero(
+            np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) <=
+            2 * np.abs(np.spacing(scaled)))
+    fmt = "%0.{}f".format(places)
+    for i in ambiguous.tolist():
+        rounded[i] = float(fmt % values[i])
+
+    return rounded
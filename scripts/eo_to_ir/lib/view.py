@@ -1,83 +1,457 @@
+import hashlib
+import itertools
+import os
+import tempfile
+
 import numpy as np
 import numpy.linalg as npl
 
 
+# Cameras are camera_io.Camera objects, with their inverses, projection
+# matrix and ground plane homographies already computed
+
+
+def _homogeneous(img_pts):
+    img_pts = np.asarray(img_pts, dtype=np.float64).reshape(-1, 2)
+    return np.hstack((img_pts, np.ones((len(img_pts), 1))))
+
+
+def backproject_to_height_batch(cam, img_pts, height=0):
+    """Back project an (N, 2) array of image points to a world height"""
+    pts = _homogeneous(img_pts)
+    if height == 0:
+        wpts = np.matmul(pts, cam.image_to_ground.T)
+    else:
+        M = cam.R.copy()
+        M[:, 2] = height * M[:, 2] + cam.t
+        wpts = np.matmul(pts, npl.inv(np.matmul(cam.K, M)).T)
+    return np.stack((wpts[:, 0] / wpts[:, 2],
+                     wpts[:, 1] / wpts[:, 2],
+                     np.full(len(pts), float(height))), axis=1)
+
+
+def backproject_to_plane_batch(cam, img_pts, planes):
+    """Back project an (N, 2) array of image points, each to its own
+    world plane from an (N, 4) array of planes"""
+    # map to normalized image coordinates, then rotate into the world
+    Mp = np.matmul(_homogeneous(img_pts), np.matmul(cam.R_T, cam.K_inv).T)
+    n = planes[:, :3]
+    d = planes[:, 3]
+    scale = (-np.matmul(n, cam.center) - d) / np.einsum('ij,ij->i', n, Mp)
+    return Mp * scale[:, None] + cam.center
+
+
+def backproject_bbox_batch(cam, boxes):
+    """Back project an (N, 4) array of image boxes to (N, 8, 3) world
+    boxes standing on the ground plane.
+
+    Returns the world boxes and a mask of the boxes which could be back
+    projected (the others are left with non-finite values).
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    x0, y0, x1, y1 = boxes.T
+    n = len(boxes)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # project base of the boxes to the ground
+        base = backproject_to_height_batch(
+            cam,
+            np.concatenate((np.stack(((x0 + x1) / 2, y1), axis=1),
+                            np.stack((x0, y1), axis=1),
+                            np.stack((x1, y1), axis=1))),
+            0)
+        pc, p1, p2 = base[:n], base[n:2 * n], base[2 * n:]
+
+        ray = pc - cam.center
+        ray[:, 2] = 0.0
+        ray /= npl.norm(ray, axis=1)[:, None]
+
+        vd = ray * npl.norm(p2 - p1, axis=1)[:, None]
+        vh = np.stack((-vd[:, 1], vd[:, 0], np.zeros(n)), axis=1)
+        p1 = pc - vh / 2
+        p2 = pc + vh / 2
+        p3 = p2 + vd
+        p4 = p1 + vd
+
+        vd_norm = npl.norm(vd, axis=1)
+        valid = vd_norm != 0.0
+        normal = vd / vd_norm[:, None]
+        d = -np.einsum('ij,ij->i', normal, p3)
+        p5 = backproject_to_plane_batch(
+            cam,
+            np.stack((x0, y0), axis=1),
+            np.concatenate((normal, d[:, None]), axis=1))
+
+    box3d = np.empty((n, 8, 3))
+    box3d[:, 0, :] = p1
+    box3d[:, 1, :] = p2
+    box3d[:, 2, :] = p3
+    box3d[:, 3, :] = p4
+    box3d[:, 4:, :] = box3d[:, :4, :]
+    box3d[:, 4:, 2] = p5[:, 2][:, None]
+
+    valid &= np.all(np.isfinite(box3d), axis=(1, 2))
+    return box3d, valid
+
+
+def project_batch(cam, wld_pts):
+    """Project an (N, 3) array of world points into an image"""
+    img_pts = np.matmul(wld_pts, cam.P[:, :3].T) + cam.P[:, 3]
+    return img_pts[:, :2] / img_pts[:, 2:]
+
+
+def box_around_box3d_batch(cam, box3ds):
+    """Image boxes, (N, 4), around an (N, 8, 3) array of world boxes"""
+    n = len(box3ds)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pts = project_batch(cam, box3ds.reshape(-1, 3)).reshape(n, 8, 2)
+    return np.concatenate((np.min(pts, axis=1), np.max(pts, axis=1)),
+                          axis=1)
+
+
+def view_to_view_batch(src_cam, dest_cam, bounds):
+    """Transfer an (N, 4) array of boxes from one camera to another.
+
+    Returns the (N, 4) transferred boxes, and a mask of the boxes that
+    could be transferred; the others are returned as NaN.
+    """
+    box3ds, valid = backproject_bbox_batch(src_cam, bounds)
+    tgt_boxes = box_around_box3d_batch(dest_cam, box3ds)
+
+    valid &= np.all(np.isfinite(tgt_boxes), axis=1)
+    tgt_boxes[~valid] = np.nan
+
+    return tgt_boxes, valid
+
+
 def backproject_to_height(cam, img_pt, height=0):
     """Back an image point to a specified world height"""
-    # map to normalized image coordinates
-    npt = npl.solve(cam[0], np.array(list(img_pt)+[1.0]))
-    M = cam[1].copy()
-    M[:, 2] = height * M[:, 2] + cam[2]
-    wpt = npl.solve(M, npt)
-    return np.matrix([wpt[0]/wpt[2], wpt[1]/wpt[2], height]).transpose()
+    return backproject_to_height_batch(cam, [img_pt], height)[0]
 
 
 def backproject_to_plane(cam, img_pt, plane):
     """Back an image point to a specified world plane"""
-    # map to normalized image coordinates
-    npt = np.matrix(npl.solve(cam[0], np.array(list(img_pt)+[1.0])))
-    M = cam[1].transpose()
-    n = np.matrix(plane[:3]).flatten()
-    d = plane.flat[3]
-    Mt = M * cam[2]
-    Mp = M * npt.transpose()
-    return Mp * (np.dot(n, Mt) - d) / np.dot(n, Mp) - Mt
+    return backproject_to_plane_batch(
+        cam, [img_pt], np.asarray(plane, dtype=np.float64).reshape(1, 4))[0]
 
 
 def backproject_bbox(cam, box):
-    # project base of the box to the ground
-    pc = backproject_to_height(cam, ((box[0]+box[2])/2, box[3]), 0)
-    ray = pc - (-cam[1].transpose() * cam[2])
-    ray[2] = 0.0
-    ray = ray / npl.norm(ray)
-
-    p1 = backproject_to_height(cam, (box[0], box[3]), 0)
-    p2 = backproject_to_height(cam, (box[2], box[3]), 0)
-    vh = p2 - p1
-    vd = np.matrix([-vh.item(1), vh.item(0), 0]).transpose()
-    vd = ray * npl.norm(vh)
-    vh = np.matrix([-vd.item(1), vd.item(0), 0]).transpose()
-    p1 = pc - vh/2
-    p2 = pc + vh/2
-    p3 = p2 + vd
-    p4 = p1 + vd
-    if npl.norm(vd) == 0.0:
+    box3d, valid = backproject_bbox_batch(cam, [box])
+    if not valid[0]:
         return None
-    n = vd / npl.norm(vd)
-    d = - (n.transpose() * p3).item()
-    back_plane = np.vstack((n, d))
-    p5 = backproject_to_plane(cam, (box[0], box[1]), back_plane)
-    height = p5.flat[2]
-    box3d = np.zeros((8, 3))
-    box3d[0, :] = p1.flatten()
-    box3d[1, :] = p2.flatten()
-    box3d[2, :] = p3.flatten()
-    box3d[3, :] = p4.flatten()
-    box3d[4:, :] = box3d[:4, :]
-    box3d[4:, 2] = height
-    return box3d
+    return box3d[0]
 
 
 def project(cam, wld_pt):
     """Project a world point into an image with a camera"""
-    # map to normalized image coordinates
-    img_pt = cam[0] * (cam[1] * np.matrix(wld_pt.flat).transpose() + cam[2])
-    return img_pt[:2] / img_pt[2]
+    return project_batch(
+        cam, np.asarray(wld_pt, dtype=np.float64).reshape(1, 3))[0]
 
 
 def box_around_box3d(cam, box3d):
-    pts = np.zeros((8, 2))
-    for c, p in enumerate(box3d):
-        pts[c, :] = project(cam, p).flat
-    return np.min(pts, 0).tolist() + np.max(pts, 0).tolist()
+    return box_around_box3d_batch(cam, np.asarray(box3d)[None])[0].tolist()
 
 
 def view_to_view(src_cam, dest_cam, bounds):
-    box3d = backproject_bbox(src_cam, bounds)
-    if box3d is None:
+    tgt_boxes, valid = view_to_view_batch(src_cam, dest_cam, [bounds])
+    if not valid[0]:
         print("Warning, bad projection!  Skipping.")
         return None
 
-    tgt_box = box_around_box3d(dest_cam, box3d)
+    return tgt_boxes[0].tolist()
+
+
+# Default number of samples of a ViewLUT along each of its axes: foot
+# x, foot y, width and height
+VIEW_LUT_GRID = (33, 19, 17, 33)
+
+# Default largest error (in pixels) from the exact transfer of
+# interpolating in a ViewLUT cell for it to be interpolated in
+VIEW_LUT_TOLERANCE = 1.0
+
+# Bump when the layout of saved ViewLUTs (or how they're built) changes
+VIEW_LUT_VERSION = 2
+
+
+def camera_pair_key(src_cam, dest_cam):
+    """A hash of the parameters of a pair of cameras"""
+    h = hashlib.sha256()
+    for cam in (src_cam, dest_cam):
+        for values in (cam.K, cam.R, cam.t, cam.d):
+            h.update(np.asarray(values, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def _box_params(bounds):
+    # Foot x, foot y (the middle of the bottom edge), width and height
+    x0, y0, x1, y1 = np.asarray(bounds, dtype=np.float64).reshape(-1, 4).T
+    return ((x0 + x1) / 2, y1, x1 - x0, y1 - y0)
+
+
+def _params_box(foot_x, foot_y, width, height):
+    return np.stack((foot_x - width / 2, foot_y - height,
+                     foot_x + width / 2, foot_y), axis=1)
+
+
+class ViewLUT(object):
+    """A lookup table approximating view_to_view_batch for a fixed pair
+    of cameras.
+
+    The transfer is sampled once over a grid of source boxes, by foot x
+    and y, width and height (the sizes spaced geometrically, from 1
+    pixel), and later boxes are transferred by multilinear interpolation
+    between the samples.  Boxes outside of the grid, or in cells of it
+    that aren't 'accurate' (those next to samples that couldn't be
+    transferred, or whose interpolation is too far from the exact
+    transfer, as happens as box tops near the horizon), fall back to the
+    exact transfer.
+
+    'max_error' and 'mean_error' are the largest and mean absolute
+    differences (in pixels, over the box coordinates) from the exact
+    transfer over 'num_checked' random boxes within the grid (see
+    'check').
+    """
+
+    def __init__(self, axes, table, key, accurate=None,
+                 tolerance=float('inf'), max_error=float('nan'),
+                 mean_error=float('nan'), num_checked=0):
+        self.axes = tuple(np.asarray(a, dtype=np.float64) for a in axes)
+        self.table = np.asarray(table, dtype=np.float64)
+        self.key = key
+        if accurate is None:
+            accurate = np.ones(tuple(len(a) - 1 for a in self.axes),
+                               dtype=bool)
+        self.accurate = np.asarray(accurate, dtype=bool)
+        self.tolerance = tolerance
+        self.max_error = max_error
+        self.mean_error = mean_error
+        self.num_checked = num_checked
+
+        # (The table is looked up by flat index)
+        self._flat_table = self.table.reshape(-1, 4)
+        self._strides = [int(np.prod(self.table.shape[k + 1:4]))
+                         for k in range(4)]
+        self._flat_accurate = self.accurate.ravel()
+        self._cell_strides = [int(np.prod(self.accurate.shape[k + 1:]))
+                              for k in range(4)]
+
+    @property
+    def grid(self):
+        return tuple(len(a) for a in self.axes)
+
+    @classmethod
+    def build(cls, src_cam, dest_cam, grid=VIEW_LUT_GRID,
+              tolerance=VIEW_LUT_TOLERANCE, image_size=None,
+              max_box_size=None):
+        """Sample the transfer between the cameras on a grid of 'grid'
+        (foot x, foot y, width, height) samples, with feet across the
+        source image of 'image_size' (width, height; by default twice
+        the principal point) and boxes up to 'max_box_size' (by default
+        the image size), keeping the cells within 'tolerance' pixels of
+        the exact transfer (see '_cell_errors'), and check it (see
+        'check')"""
+        if any(n < 2 for n in grid):
+            raise ValueError("A ViewLUT grid needs at least 2 samples "
+                             "along each axis")
+        if image_size is None:
+            image_size = (2 * src_cam.K[0, 2], 2 * src_cam.K[1, 2])
+        if max_box_size is None:
+            max_box_size = image_size
+
+        axes = (np.linspace(0, image_size[0], grid[0]),
+                np.linspace(0, image_size[1], grid[1]),
+                np.geomspace(1, max_box_size[0], grid[2]),
+                np.geomspace(1, max_box_size[1], grid[3]))
+        params = [m.ravel() for m in np.meshgrid(*axes, indexing='ij')]
+        table, _ = view_to_view_batch(src_cam, dest_cam,
+                                      _params_box(*params))
+
+        lut = cls(axes, table.reshape(tuple(grid) + (4,)),
+                  camera_pair_key(src_cam, dest_cam))
+
+        # The interpolation is exact at the samples, but the transfer
+        # has kinks (where another corner of a box's 3D box becomes its
+        # extreme), so cells are checked at their middles and at the
+        # middles of their faces, to within half the tolerance for the
+        # error between those
+        errors = np.zeros(lut.accurate.shape)
+        for mid_axes in [(0, 1, 2, 3)] + list(
+                itertools.combinations(range(4), 3)):
+            errors = np.maximum(
+                errors, lut._cell_errors(src_cam, dest_cam, mid_axes))
+        lut.accurate = errors <= tolerance / 2
+        lut._flat_accurate = lut.accurate.ravel()
+        lut.tolerance = tolerance
+
+        lut.check(src_cam, dest_cam)
+        return lut
+
+    def _cell_errors(self, src_cam, dest_cam, mid_axes):
+        """The largest error of each cell over the points at its middle
+        along 'mid_axes' and at its samples along the other axes (inf
+        where it can't be interpolated or transferred)"""
+        points = [(a[:-1] + a[1:]) / 2 if k in mid_axes else a
+                  for k, a in enumerate(self.axes)]
+        bounds = _params_box(*[m.ravel() for m in np.meshgrid(
+            *points, indexing='ij')])
+        tgt_boxes, valid = self.lookup(bounds)
+        exact_boxes, exact_valid = view_to_view_batch(src_cam, dest_cam,
+                                                      bounds)
+        with np.errstate(invalid='ignore'):
+            errors = np.max(np.abs(tgt_boxes - exact_boxes), axis=1)
+        errors[~(valid & exact_valid)] = np.inf
+        errors = errors.reshape([len(p) for p in points])
+
+        # (Points on the faces between cells count for both)
+        for k in range(4):
+            if k not in mid_axes:
+                lower = (slice(None),) * k + (slice(None, -1),)
+                upper = (slice(None),) * k + (slice(1, None),)
+                errors = np.maximum(errors[lower], errors[upper])
+        return errors
+
+    def lookup(self, bounds):
+        """Interpolate the transfer of an (N, 4) array of boxes.
+
+        Returns the (N, 4) boxes and a mask of the boxes that could be
+        interpolated; the others are returned as NaN.
+        """
+        params = _box_params(bounds)
+        n = len(params[0])
+
+        inside = np.ones(n, dtype=bool)
+        for axis, values in zip(self.axes, params):
+            inside &= (values >= axis[0]) & (values <= axis[-1])
+
+        # Index of the lower sample and the fraction of the way to the
+        # next along each axis
+        base = np.zeros(n, dtype=np.intp)
+        cell = np.zeros(n, dtype=np.intp)
+        fracs = []
+        for axis, values, stride, cell_stride in zip(
+                self.axes, params, self._strides, self._cell_strides):
+            coords = np.interp(np.where(inside, values, axis[0]), axis,
+                               np.arange(len(axis), dtype=np.float64))
+            lower = np.minimum(coords.astype(np.intp), len(axis) - 2)
+            base += lower * stride
+            cell += lower * cell_stride
+            frac = coords - lower
+            fracs.append((1 - frac, frac))
+
+        tgt_boxes = np.zeros((n, 4))
+        for corner in itertools.product((0, 1), repeat=4):
+            weights = (fracs[0][corner[0]] * fracs[1][corner[1]] *
+                       fracs[2][corner[2]] * fracs[3][corner[3]])
+            offset = sum(s for s, c in zip(self._strides, corner) if c)
+            tgt_boxes += (weights[:, None] *
+                          self._flat_table.take(base + offset, axis=0))
+
+        valid = (inside & self._flat_accurate[cell] &
+                 np.all(np.isfinite(tgt_boxes), axis=1))
+        tgt_boxes[~valid] = np.nan
+        return tgt_boxes, valid
+
+    def transfer(self, src_cam, dest_cam, bounds):
+        """As view_to_view_batch, interpolating the boxes that can be,
+        and transferring the rest exactly"""
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        tgt_boxes, valid = self.lookup(bounds)
+        if not np.all(valid):
+            exact = ~valid
+            tgt_boxes[exact], valid[exact] = view_to_view_batch(
+                src_cam, dest_cam, bounds[exact])
+        return tgt_boxes, valid
+
+    def measure_error(self, src_cam, dest_cam, bounds):
+        """The absolute differences from the exact transfer, (N, 4), of
+        the boxes that can be interpolated (and transferred exactly)"""
+        tgt_boxes, valid = self.lookup(bounds)
+        exact_boxes, exact_valid = view_to_view_batch(src_cam, dest_cam,
+                                                      bounds)
+        valid &= exact_valid
+        return np.abs(tgt_boxes[valid] - exact_boxes[valid])
+
+    def check(self, src_cam, dest_cam, num_samples=20000, seed=0):
+        """Measure (and record) the error of the table over
+        'num_samples' random boxes within its grid, their sizes
+        distributed geometrically"""
+        rng = np.random.RandomState(seed)
+        params = [rng.uniform(a[0], a[-1], num_samples)
+                  for a in self.axes[:2]]
+        params += [np.exp(rng.uniform(np.log(a[0]), np.log(a[-1]),
+                                      num_samples))
+                   for a in self.axes[2:]]
+        errors = self.measure_error(src_cam, dest_cam,
+                                    _params_box(*params))
+
+        self.num_checked = len(errors)
+        if len(errors) > 0:
+            self.max_error = float(np.max(errors))
+            self.mean_error = float(np.mean(errors))
+        return self.max_error
+
+    def save(self, path):
+        # Written to a temporary file and renamed, so concurrent readers
+        # never see a partial table
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                        prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as of:
+                np.savez(of,
+                         version=VIEW_LUT_VERSION,
+                         key=self.key,
+                         table=self.table,
+                         accurate=self.accurate,
+                         tolerance=self.tolerance,
+                         max_error=self.max_error,
+                         mean_error=self.mean_error,
+                         num_checked=self.num_checked,
+                         **{"axis%d" % k: a for k, a in enumerate(self.axes)})
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data['version']) != VIEW_LUT_VERSION:
+                raise ValueError("Unsupported ViewLUT version in "
+                                 "'{}'".format(path))
+            return cls([data["axis%d" % k] for k in range(4)],
+                       data['table'],
+                       str(data['key']),
+                       data['accurate'],
+                       float(data['tolerance']),
+                       float(data['max_error']),
+                       float(data['mean_error']),
+                       int(data['num_checked']))
+
+    def describe(self):
+        return ("{} samples, {:.1%} of cells interpolated, max error "
+                "{:.3f} px (mean {:.3f} px) over {} random boxes".format(
+                    "x".join(map(str, self.grid)),
+                    float(np.mean(self.accurate)),
+                    self.max_error, self.mean_error, self.num_checked))
+
+
+def load_view_lut(path, src_cam, dest_cam, grid=VIEW_LUT_GRID,
+                  tolerance=VIEW_LUT_TOLERANCE):
+    """Load the ViewLUT for the cameras saved at 'path', or, if there's
+    none (or it's for other cameras, grid or tolerance, or of an older
+    version), build and save one.  Returns the ViewLUT and whether it was
+    built."""
+    if os.path.exists(path):
+        try:
+            lut = ViewLUT.load(path)
+        except ValueError:
+            lut = None
+        if (lut is not None and
+                lut.key == camera_pair_key(src_cam, dest_cam) and
+                lut.grid == tuple(grid) and
+                lut.tolerance == tolerance):
+            return lut, False
 
-    return tgt_box
+    lut = ViewLUT.build(src_cam, dest_cam, grid, tolerance)
+    lut.save(path)
+    return lut, True
@@ -41,7 +41,7 @@ run_test() {
 }
 
 test_1_0() {
-    python ../eo_to_ir.py \
+    python ../eo_to_ir.py $EO_TO_IR_ARGS \
 	   -g "test_1.geom.yml" \
 	   -a "test_1.act.yml" \
 	   -t "test_1.types.yml" \
@@ -51,7 +51,7 @@ test_1_0() {
 }
 
 test_2_0() {
-    python ../eo_to_ir.py \
+    python ../eo_to_ir.py $EO_TO_IR_ARGS \
 	   -g "test_2.geom.yml" \
 	   -a "test_2.act.yml" \
 	   -t "test_2.types.yml" \
@@ -61,7 +61,7 @@ test_2_0() {
 }
 
 test_3_0() {
-    python ../eo_to_ir.py \
+    python ../eo_to_ir.py $EO_TO_IR_ARGS \
 	   -g "test_3.geom.yml" \
 	   -a "test_3.act.yml" \
 	   -t "test_3.types.yml" \
@@ -71,7 +71,7 @@ test_3_0() {
 }
 
 test_4_0() {
-    python ../eo_to_ir.py \
+    python ../eo_to_ir.py $EO_TO_IR_ARGS \
 	   -g "test_1.geom.yml" \
 	   -a "test_1.act.yml" \
 	   -t "test_1.types.yml" \
@@ -82,7 +82,7 @@ test_4_0() {
 }
 
 test_5_0() {
-    python ../eo_to_ir.py \
+    python ../eo_to_ir.py $EO_TO_IR_ARGS \
 	   -g "test_2.geom.yml" \
 	   -a "test_2.act.yml" \
 	   -t "test_2.types.yml" \
@@ -93,7 +93,7 @@ test_5_0() {
 }
 
 test_6_0() {
-    python ../eo_to_ir.py \
+    python ../eo_to_ir.py $EO_TO_IR_ARGS \
 	   -g "test_2.geom.yml" \
 	   -a "test_2.act.yml" \
 	   -t "test_2.types.yml" \
@@ -104,7 +104,7 @@ test_6_0() {
 }
 
 test_7_0() {
-    python ../eo_to_ir.py \
+    python ../eo_to_ir.py $EO_TO_IR_ARGS \
 	   -g "test_2.geom.yml" \
 	   -a "test_2.act.yml" \
 	   -t "test_2.types.yml" \
@@ -116,7 +116,7 @@ test_7_0() {
 }
 
 test_8_0() {
-    python ../eo_to_ir.py \
+    python ../eo_to_ir.py $EO_TO_IR_ARGS \
 	   -g "test_4.geom.yml" \
 	   -a "test_2.act.yml" \
 	   -t "test_2.types.yml" \
@@ -128,7 +128,7 @@ test_8_0() {
 }
 
 test_9_0() {
-    python ../eo_to_ir.py \
+    python ../eo_to_ir.py $EO_TO_IR_ARGS \
 	   -g "test_5.geom.yml" \
 	   -a "test_5.act.yml" \
 	   -t "test_2.types.yml" \
@@ -140,7 +140,7 @@ test_9_0() {
 
 test_10_0() {
     # Test negative frame number filtering
-    python ../eo_to_ir.py \
+    python ../eo_to_ir.py $EO_TO_IR_ARGS \
 	   -g "test_2.geom.yml" \
 	   -a "test_2.act.yml" \
 	   -t "test_2.types.yml" \
@@ -152,7 +152,7 @@ test_10_0() {
 
 test_11_0() {
     # Test multi-actor activities
-    python ../eo_to_ir.py \
+    python ../eo_to_ir.py $EO_TO_IR_ARGS \
 	   -g "test_2.geom.yml" \
 	   -a "test_11.act.yml" \
 	   -t "test_2.types.yml" \
@@ -164,7 +164,7 @@ test_11_0() {
 test_11_1() {
     # Test multi-actor activities, drop activity if any constituent
     # actor is filtered out
-    python ../eo_to_ir.py \
+    python ../eo_to_ir.py $EO_TO_IR_ARGS \
 	   -g "test_2.geom.yml" \
 	   -a "test_11.act.yml" \
 	   -t "test_2.types.yml" \
@@ -177,7 +177,7 @@ test_11_2() {
     # Test multi-actor activities, drop activity if any constituent
     # actor is filtered out; With --include-orphans don't remove geom
     # or type records for actors no longer belonging to an activty
-    python ../eo_to_ir.py \
+    python ../eo_to_ir.py $EO_TO_IR_ARGS \
 	   -g "test_2.geom.yml" \
 	   -a "test_11.act.yml" \
 	   -t "test_2.types.yml" \
@@ -5,3 +5,9 @@ source integration_tests.sh
 for tst in test_{1..10}_0 test_11_{0,1,2}; do
     run_test "$tst" "$checkfiles_dir/$tst"
 done
+
+# Streaming mode output should be identical
+export EO_TO_IR_ARGS="--streaming"
+for tst in test_{1..10}_0 test_11_{0,1,2}; do
+    run_test "$tst" "$checkfiles_dir/$tst" compcheckfiles/streaming
+done
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import sys
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+from lib.box_cache import BoxTransferCache  # noqa
+from lib.homography import apply_homography_batch  # noqa
+from lib.camera_io import Camera  # noqa
+from lib.view import view_to_view_batch  # noqa
+
+
+def _make_camera(pitch_deg, yaw_deg, center):
+    K = np.array([[1000.0, 0.0, 960.0],
+                  [0.0, 1000.0, 540.0],
+                  [0.0, 0.0, 1.0]])
+    pitch, yaw = np.radians(pitch_deg), np.radians(yaw_deg)
+    Rx = np.array([[1.0, 0.0, 0.0],
+                   [0.0, np.cos(pitch), -np.sin(pitch)],
+                   [0.0, np.sin(pitch), np.cos(pitch)]])
+    Rz = np.array([[np.cos(yaw), -np.sin(yaw), 0.0],
+                   [np.sin(yaw), np.cos(yaw), 0.0],
+                   [0.0, 0.0, 1.0]])
+    R = np.matmul(Rx, Rz)
+    t = -np.matmul(R, center)
+    return Camera(K, R, t, [0.0, 0.0, 0.0, 0.0, 0.0])
+
+
+class TestBoxTransferCache(unittest.TestCase):
+    def setUp(self):
+        super(TestBoxTransferCache, self).setUp()
+
+        self.homography = np.array([[1.1, -0.08, -40.0],
+                                    [-0.06, 0.5, -30.0],
+                                    [-8e-5, -9e-5, 1.0]])
+        src_cam = _make_camera(120.0, 5.0, [0.0, -30.0, 15.0])
+        # (Magnifying boxes, so cells need splitting)
+        dest_cam = _make_camera(125.0, -10.0, [4.0, -20.0, 6.0])
+        self.transfers = {
+            'homography':
+                lambda b: apply_homography_batch(self.homography, b),
+            'view':
+                lambda b: view_to_view_batch(src_cam, dest_cam, b)[0]}
+
+        # Stationary actors: jittered copies of a few boxes
+        rng = np.random.RandomState(0)
+        boxes = np.array([[900.0, 500.0, 950.0, 620.0],
+                          [100.0, 800.0, 180.0, 900.0],
+                          [1500.0, 300.0, 1600.0, 340.0]])
+        self.bounds = (boxes[rng.randint(0, 3, 3000)] +
+                       rng.uniform(-0.4, 0.4, (3000, 4)))
+
+    def test_within_tolerance(self):
+        for name, transfer_fn in self.transfers.items():
+            for tolerance in (0.25, 1.0, 4.0):
+                with self.subTest(transfer=name, tolerance=tolerance):
+                    cache = BoxTransferCache(transfer_fn, tolerance)
+                    out = cache(self.bounds)
+                    exact = transfer_fn(self.bounds)
+                    self.assertLessEqual(np.max(np.abs(out - exact)),
+                                         tolerance)
+                    # (Every box of the first batch is a miss)
+                    self.assertEqual((cache.hits, cache.misses),
+                                     (0, len(self.bounds)))
+                    if tolerance >= 1.0:
+                        # Most boxes of the next frames fall in cells
+                        # already seen
+                        cache(self.bounds[::-1] + 0.1)
+                        self.assertGreater(cache.hits,
+                                           cache.misses - len(self.bounds))
+
+    def test_split_cells(self):
+        # Cells of magnified boxes are split until they're within the
+        # tolerance
+        cache = BoxTransferCache(self.transfers['view'], 1.0)
+        cache(self.bounds)
+        self.assertGreater(len(cache._entries[2]), 0)
+
+        cache = BoxTransferCache(self.transfers['view'], 1.0, levels=0)
+        cache(self.bounds)
+        self.assertEqual(cache.hits, 0)
+
+    def test_stats(self):
+        cache = BoxTransferCache(self.transfers['homography'], 2.0)
+        cache(self.bounds[:10])
+        self.assertEqual(cache.misses, 10)
+        entries = len(cache)
+        cache(self.bounds[:10])
+        self.assertEqual(cache.stats(),
+                         {'hits': 10,
+                          'misses': 10,
+                          'entries': entries,
+                          'hit_rate': 0.5})
+
+    def test_misses_count_boxes(self):
+        # Boxes in a cell first seen in the batch are all misses, at
+        # the first level and at finer ones
+        rng = np.random.RandomState(1)
+        for name, box, level in (('homography',
+                                  [901.0, 501.0, 951.0, 621.0], 0),
+                                 ('view', [101.0, 801.0, 181.0, 901.0], 3)):
+            with self.subTest(transfer=name):
+                cache = BoxTransferCache(self.transfers[name], 2.0)
+                cell_size = 2.0 / 2 ** level
+                # (Jittered about the middle of the box's cell)
+                bounds = (np.floor(np.array(box) / cell_size) + 0.5 +
+                          rng.uniform(-0.4, 0.4, (10, 4))) * cell_size
+                cache(bounds)
+                self.assertEqual((cache.hits, cache.misses), (0, 10))
+                self.assertEqual(len(cache._entries[level]), 1)
+
+                # With 3 boxes in another cell
+                cache(np.concatenate((bounds[:5], bounds[:3] + 10.0)))
+                self.assertEqual((cache.hits, cache.misses), (5, 13))
+
+    def test_order_independent(self):
+        transfer_fn = self.transfers['view']
+        out = BoxTransferCache(transfer_fn, 1.0)(self.bounds)
+
+        # In reverse, in batches, with a tiny LRU
+        cache = BoxTransferCache(transfer_fn, 1.0, max_entries=2)
+        reversed_out = np.concatenate(
+            [cache(self.bounds[::-1][i:i + 100])
+             for i in range(0, len(self.bounds), 100)])
+        assert_array_equal(reversed_out[::-1], out)
+        self.assertLessEqual(len(cache), 2 * (cache.levels + 1))
+
+    def test_untransferable(self):
+        # Non-finite boxes (and those that can't be transferred) are
+        # passed through to the transfer
+        bounds = np.array([[np.nan, 0.0, 10.0, 10.0],
+                           [700.0, 700.0, 700.0, 760.0],
+                           [900.0, 500.0, 950.0, 620.0]])
+        transfer_fn = self.transfers['view']
+        out = BoxTransferCache(transfer_fn, 1.0)(bounds)
+        exact = transfer_fn(bounds)
+        assert_array_equal(np.isnan(out), np.isnan(exact))
+        self.assertLessEqual(np.max(np.abs(out[2] - exact[2])), 1.0)
+
+    def test_empty(self):
+        cache = BoxTransferCache(self.transfers['homography'], 1.0)
+        self.assertEqual(cache(np.zeros((0, 4))).shape, (0, 4))
+        with self.assertRaises(ValueError):
+            BoxTransferCache(self.transfers['homography'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+import unittest
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+import eo_to_ir_batch  # noqa
+from eo_to_ir_batch import load_manifest, clip_to_argv  # noqa
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _clip(name, test_id, **options):
+    clip = {'name': name,
+            'input_geom': os.path.join(TEST_DIR, f"test_{test_id}.geom.yml"),
+            'input_activities': os.path.join(TEST_DIR,
+                                             f"test_{test_id}.act.yml"),
+            'input_types': os.path.join(TEST_DIR,
+                                        f"test_{test_id}.types.yml"),
+            'ir_prefix': name,
+            'crop_bounds': "800x600"}
+    clip.update(options)
+    return clip
+
+
+class TestEOToIRBatch(unittest.TestCase):
+    def setUp(self):
+        super(TestEOToIRBatch, self).setUp()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.out_dir = os.path.join(self.tmp_dir.name, "out")
+
+    def _run_batch(self, clips, processes=1):
+        # Returns the exit status and output of the batch
+        manifest_path = os.path.join(self.tmp_dir.name, "clips.json")
+        with open(manifest_path, 'w') as of:
+            json.dump(clips, of)
+        args = argparse.Namespace(manifest=manifest_path,
+                                  processes=processes,
+                                  output_dir=self.out_dir)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status = eo_to_ir_batch.main(args)
+        return status, output.getvalue()
+
+    def test_parse_cache_per_clip(self):
+        # Clips run in the same worker process, only the first of which
+        # uses a parse cache
+        cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        status, output = self._run_batch(
+            [_clip("a", 1, parse_cache=cache_dir), _clip("b", 2)])
+        self.assertEqual(status, 0, output)
+
+        cached_paths = set()
+        for name in os.listdir(cache_dir):
+            if name.endswith(".json"):
+                with open(os.path.join(cache_dir, name)) as inf:
+                    cached_paths.add(os.path.basename(json.load(inf)['path']))
+        self.assertEqual(cached_paths, {"test_1.geom.yml", "test_1.act.yml",
+                                        "test_1.types.yml"})
+
+    def _outputs(self, prefix):
+        outputs = {}
+        for ext in ("geom.yml", "activities.yml", "types.yml", "kw18"):
+            with open(os.path.join(self.out_dir, f"{prefix}.{ext}")) as inf:
+                outputs[ext] = inf.read()
+        return outputs
+
+    def test_clip_workers(self):
+        # Clips are run in daemonic pool workers, which can't start pools
+        # of their own
+        status, output = self._run_batch(
+            [_clip("serial", 1), _clip("workers", 1, workers=2)])
+        self.assertEqual(status, 0, output)
+        self.assertEqual(self._outputs("workers"), self._outputs("serial"))
+
+    def test_clip_targets(self):
+        targets_path = os.path.join(self.tmp_dir.name, "targets.json")
+        with open(targets_path, 'w') as of:
+            json.dump([{"ir_prefix": "t1"},
+                       {"ir_prefix": "t2", "frame_offset": 5}], of)
+        status, output = self._run_batch(
+            [_clip("serial", 1, frame_offset=5),
+             _clip("targets", 1, targets=targets_path,
+                   target_processes=2)])
+        self.assertEqual(status, 0, output)
+        self.assertEqual(self._outputs("t2"), self._outputs("serial"))
+        self.assertTrue(os.path.exists(os.path.join(self.out_dir,
+                                                    "t1.kw18")))
+
+    def test_failing_clips(self):
+        # A failing clip doesn't stop the others, which share the
+        # homography loaded up front
+        homography_path = os.path.join(TEST_DIR, "test_homography_1.txt")
+        self.addCleanup(eo_to_ir_batch.eo_to_ir._loaded_files.clear)
+        status, output = self._run_batch(
+            [_clip("a", 1, homography_file=homography_path),
+             _clip("missing", 1,
+                   input_geom=os.path.join(TEST_DIR, "missing.geom.yml")),
+             _clip("invalid", 1, crop_bounds="800"),
+             _clip("b", 2, homography_file=homography_path)],
+            processes=2)
+
+        self.assertEqual(status, 1)
+        self.assertIn("4 clips: 2 OK, 2 failed", output)
+        self.assertRegex(output, r"\n  missing: .*missing\.geom\.yml")
+        self.assertIn("\n  invalid: ", output)
+        self.assertEqual(sorted(os.listdir(self.out_dir)),
+                         sorted(f"{prefix}.{ext}" for prefix in ("a", "b")
+                                for ext in ("geom.yml", "activities.yml",
+                                            "types.yml", "kw18")))
+        self.assertIn(('load_homography_file',
+                       os.path.abspath(homography_path)),
+                      eo_to_ir_batch.eo_to_ir._loaded_files)
+
+    def test_load_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, "clips.csv")
+            with open(csv_path, 'w') as of:
+                print("name,input_geom,include_orphans", file=of)
+                print("a,a.geom.yml,", file=of)
+                print("b,b.geom.yml,true", file=of)
+
+            json_path = os.path.join(tmp_dir, "clips.json")
+            with open(json_path, 'w') as of:
+                print('[{"name": "a", "input_geom": "a.geom.yml"}, '
+                      '{"name": "b", "input_geom": "b.geom.yml", '
+                      '"include_orphans": true}]', file=of)
+
+            csv_clips = load_manifest(csv_path)
+            json_clips = load_manifest(json_path)
+
+        self.assertEqual([c['input_geom'] for c in csv_clips],
+                         ['a.geom.yml', 'b.geom.yml'])
+        self.assertEqual([c['input_geom'] for c in json_clips],
+                         ['a.geom.yml', 'b.geom.yml'])
+
+    def test_clip_to_argv(self):
+        flag_dests = {'include_orphans', 'streaming'}
+        self.assertEqual(
+            clip_to_argv({'name': 'a',
+                          'input_geom': 'a.geom.yml',
+                          'frame-offset': 10,
+                          'homography_file': '',
+                          'include_orphans': 'yes',
+                          'streaming': False},
+                         flag_dests),
+            ['--input-geom', 'a.geom.yml',
+             '--frame-offset', '10',
+             '--include-orphans'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import unittest
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+import eo_to_ir  # noqa
+from lib.run_manifest import fingerprint, load_run_manifest  # noqa
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestEOToIRIncremental(unittest.TestCase):
+    def setUp(self):
+        super(TestEOToIRIncremental, self).setUp()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        # Inputs are copied, to be modified
+        self.input_argv = []
+        for flag, name in (("-g", "test_1.geom.yml"),
+                           ("-a", "test_1.act.yml"),
+                           ("-t", "test_1.types.yml")):
+            path = os.path.join(self.tmp_dir.name, name)
+            shutil.copy(os.path.join(TEST_DIR, name), path)
+            self.input_argv += [flag, path]
+        self.out_dir = os.path.join(self.tmp_dir.name, "out")
+
+    def _run(self, argv):
+        # Returns the output of the run
+        parser = eo_to_ir.build_arg_parser()
+        args = parser.parse_args(self.input_argv +
+                                 ["-o", self.out_dir, "-b", "800x600"] +
+                                 argv)
+        eo_to_ir.check_args(parser, args)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            eo_to_ir.main(args)
+        return output.getvalue()
+
+    def _output_hashes(self):
+        # (Manifests record output mtimes, so differ from run to run)
+        return {name: fingerprint(os.path.join(self.out_dir, name))['sha256']
+                for name in sorted(os.listdir(self.out_dir))
+                if not name.endswith(".manifest.json")}
+
+    def _run_key(self, prefix):
+        return load_run_manifest(os.path.join(
+            self.out_dir, prefix + ".manifest.json"))['key']
+
+    def test_rerun_skipped(self):
+        self._run(["-p", "x", "--incremental"])
+        self.assertEqual(sorted(os.listdir(self.out_dir)),
+                         ["x.activities.yml", "x.geom.yml", "x.kw18",
+                          "x.manifest.json", "x.types.yml"])
+        manifest = load_run_manifest(
+            os.path.join(self.out_dir, "x.manifest.json"))
+        self.assertEqual(sorted(manifest['inputs']),
+                         ["input_activities", "input_geom", "input_types"])
+        self.assertEqual(manifest['options']['crop_bounds'], "800x600")
+        self.assertNotIn('workers', manifest['options'])
+
+        hashes = self._output_hashes()
+        self.assertIn("up to date", self._run(["-p", "x", "--incremental"]))
+        # (Options that don't change the outputs don't matter)
+        self.assertIn("up to date", self._run(["-p", "x", "--incremental",
+                                               "--streaming"]))
+        self.assertEqual(self._output_hashes(), hashes)
+
+        # Without --incremental, existing outputs aren't replaced
+        with self.assertRaises(SystemExit), \
+                contextlib.redirect_stdout(io.StringIO()):
+            self._run(["-p", "x"])
+        self.assertEqual(self._output_hashes(), hashes)
+
+    def test_stale_outputs_regenerated(self):
+        self._run(["-p", "x", "--incremental"])
+        expected = self._output_hashes()
+        key = self._run_key("x")
+        geom_path = os.path.join(self.out_dir, "x.geom.yml")
+
+        # A changed output
+        with open(geom_path, 'a') as of:
+            of.write("\n")
+        self.assertNotIn("up to date", self._run(["-p", "x",
+                                                  "--incremental"]))
+        self.assertEqual(self._output_hashes(), expected)
+
+        # A missing output
+        os.unlink(geom_path)
+        self.assertNotIn("up to date", self._run(["-p", "x",
+                                                  "--incremental"]))
+        self.assertEqual(self._output_hashes(), expected)
+
+        # Changed options
+        self._run(["-p", "x", "--incremental", "-f", "5"])
+        hashes = self._output_hashes()
+        self.assertNotEqual(hashes['x.geom.yml'], expected['x.geom.yml'])
+        self.assertNotEqual(self._run_key("x"), key)
+
+        # A changed input
+        with open(self.input_argv[1], 'a') as of:
+            of.write("- { meta: extra }\n")
+        self._run(["-p", "x", "--incremental", "-f", "5"])
+        self.assertNotEqual(self._output_hashes()['x.geom.yml'],
+                            hashes['x.geom.yml'])
+
+        # No temporary files are left behind
+        self.assertEqual(sorted(os.listdir(self.out_dir)),
+                         sorted(list(expected) + ["x.manifest.json"]))
+
+    def test_targets(self):
+        targets_path = os.path.join(self.tmp_dir.name, "targets.json")
+        with open(targets_path, 'w') as of:
+            json.dump([{"ir_prefix": "a"},
+                       {"ir_prefix": "b", "frame_offset": 5},
+                       {"ir_prefix": "c", "crop_bounds": "1920x1080"}],
+                      of)
+        argv = ["--targets", targets_path, "--incremental",
+                "--target-processes", "1"]
+
+        self.assertIn("0 of 3 targets are up to date", self._run(argv))
+        hashes = self._output_hashes()
+        self.assertIn("3 of 3 targets are up to date", self._run(argv))
+
+        os.unlink(os.path.join(self.out_dir, "b.kw18"))
+        output = self._run(argv)
+        self.assertIn("2 of 3 targets are up to date", output)
+        self.assertIn("b: OK", output)
+        self.assertNotIn("a: OK", output)
+        self.assertEqual(self._output_hashes(), hashes)
+
+
+if __name__ == '__main__':
+    unittest.main()
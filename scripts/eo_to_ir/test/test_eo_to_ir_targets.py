@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import unittest
+import contextlib
+import filecmp
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+import eo_to_ir  # noqa
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+INPUT_ARGV = ["-g", os.path.join(TEST_DIR, "test_1.geom.yml"),
+              "-a", os.path.join(TEST_DIR, "test_1.act.yml"),
+              "-t", os.path.join(TEST_DIR, "test_1.types.yml")]
+
+
+def _run(argv):
+    parser = eo_to_ir.build_arg_parser()
+    args = parser.parse_args(INPUT_ARGV + argv)
+    eo_to_ir.check_args(parser, args)
+    with contextlib.redirect_stdout(io.StringIO()):
+        eo_to_ir.main(args)
+
+
+class TestEOToIRTargets(unittest.TestCase):
+    def setUp(self):
+        super(TestEOToIRTargets, self).setUp()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.targets_path = os.path.join(self.tmp_dir.name, "targets.json")
+        with open(self.targets_path, 'w') as of:
+            json.dump([{"ir_prefix": "a"},
+                       {"ir_prefix": "b",
+                        "frame_offset": 5,
+                        "homography_file": os.path.join(
+                            TEST_DIR, "test_homography_1.txt"),
+                        "include_orphans": True},
+                       {"ir_prefix": "c",
+                        "crop_bounds": "1920x1080",
+                        "output_dir": os.path.join(self.tmp_dir.name,
+                                                   "other")}],
+                      of)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_targets(self):
+        args = eo_to_ir.build_arg_parser().parse_args(
+            INPUT_ARGV + ["-o", "out",
+                          "-b", "800x600",
+                          "--targets", self.targets_path])
+        targets = eo_to_ir.load_targets(args)
+
+        self.assertEqual([t.ir_prefix for t in targets], ["a", "b", "c"])
+        self.assertEqual([t.crop_bounds for t in targets],
+                         ["800x600", "800x600", "1920x1080"])
+        self.assertEqual([t.frame_offset for t in targets], [None, 5, None])
+        self.assertEqual([t.include_orphans for t in targets],
+                         [False, True, False])
+        self.assertEqual(targets[0].output_dir, "out")
+
+    def test_targets_match_separate_runs(self):
+        out_dir = os.path.join(self.tmp_dir.name, "targets")
+        sep_dir = os.path.join(self.tmp_dir.name, "separate")
+        other_dir = os.path.join(self.tmp_dir.name, "other")
+        for processes in ("1", "2"):
+            _run(["-o", os.path.join(out_dir, processes),
+                  "-b", "800x600",
+                  "--targets", self.targets_path,
+                  "--target-processes", processes])
+            # Target c has its own output directory
+            self.assertEqual(len(os.listdir(other_dir)), 4)
+            shutil.rmtree(other_dir)
+        _run(["-o", sep_dir, "-p", "a", "-b", "800x600"])
+        _run(["-o", sep_dir, "-p", "b", "-b", "800x600", "-f", "5",
+              "-H", os.path.join(TEST_DIR, "test_homography_1.txt"),
+              "--include-orphans"])
+
+        names = sorted(os.listdir(sep_dir))
+        self.assertEqual(len(names), 8)
+        for processes in ("1", "2"):
+            self.assertEqual(sorted(os.listdir(os.path.join(out_dir,
+                                                            processes))),
+                             names)
+            _, mismatch, errors = filecmp.cmpfiles(
+                sep_dir, os.path.join(out_dir, processes), names,
+                shallow=False)
+            self.assertEqual(mismatch + errors, [])
+
+    def test_workers_match_serial_run(self):
+        for i, argv in enumerate((["-b", "352x240"],
+                                  ["-b", "800x600", "-f", "-5",
+                                   "--include-orphans"],
+                                  ["-b", "640x480", "-H",
+                                   os.path.join(TEST_DIR,
+                                                "test_homography_2.txt"),
+                                   "--min-spatial-overlap", "0.5"])):
+            with self.subTest(argv=argv):
+                out_dir = os.path.join(self.tmp_dir.name, str(i))
+                _run(argv + ["-o", out_dir, "-p", "serial"])
+                _run(argv + ["-o", out_dir, "-p", "workers",
+                             "--workers", "3"])
+
+                for ext in ("activities.yml", "geom.yml", "kw18",
+                            "types.yml"):
+                    self.assertTrue(filecmp.cmp(
+                        os.path.join(out_dir, "serial." + ext),
+                        os.path.join(out_dir, "workers." + ext),
+                        shallow=False))
+
+    def test_shard_actors(self):
+        # Two actors, of 521 and 42 geoms
+        _, geom_table = eo_to_ir.parse_geom_yaml(INPUT_ARGV[1])
+        self.assertEqual(eo_to_ir._shard_actors(geom_table, 1), [(0, 2)])
+        self.assertEqual(eo_to_ir._shard_actors(geom_table, 8), [(0, 1),
+                                                                 (1, 2)])
+        self.assertEqual(eo_to_ir._shard_actors(geom_table[0:0], 4),
+                         [(0, 2)])
+
+    def test_check_args(self):
+        parser = eo_to_ir.build_arg_parser()
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                eo_to_ir.check_args(parser, parser.parse_args(INPUT_ARGV))
+            with self.assertRaises(SystemExit):
+                eo_to_ir.check_args(parser, parser.parse_args(
+                    INPUT_ARGV + ["--targets", self.targets_path,
+                                  "--streaming"]))
+            with self.assertRaises(SystemExit):
+                eo_to_ir.check_args(parser, parser.parse_args(
+                    INPUT_ARGV + ["-p", "x", "--profile-stage", "geom.crop"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import sys
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib")
+sys.path.append(lib_path)
+
+from geom_table import GeomTableBuilder, ActorFrameIndex  # noqa
+
+
+class TestGeomTable(unittest.TestCase):
+    def setUp(self):
+        super(TestGeomTable, self).setUp()
+
+        self.records = [
+            {'id0': 1, 'id1': 2, 'ts0': 10, 'ts1': 0.33,
+             'g0': '0.0 0.0 10.0 10.0', 'keyframe': True},
+            {'id0': 2, 'id1': 1, 'ts0': 10, 'ts1': 1,
+             'g0': '1 2 3 4'},
+            {'id0': 3, 'id1': 2, 'ts0': 11, 'ts1': 0.37,
+             'g0': '1.0 1.0 11.0 11.0'},
+            {'id1': 2, 'id0': 4, 'ts0': 10, 'ts1': 0.34,
+             'g0': '2.0 2.0 12.0 12.0', 'occlusion': 'heavy'},
+        ]
+
+        builder = GeomTableBuilder()
+        for rec in self.records:
+            builder.append(dict(rec))
+
+        self.table = builder.build()
+
+    def test_grouping(self):
+        assert_array_equal(self.table.actor_ids, [2, 1])
+        assert_array_equal(self.table.actor_offsets, [0, 3, 4])
+        assert_array_equal(self.table.id0, [1, 3, 4, 2])
+        assert_array_equal(self.table.y1, [10.0, 11.0, 12.0, 4.0])
+
+    def test_iter_records(self):
+        recs = list(self.table.iter_records())
+        self.assertEqual(list(recs[2].keys()),
+                         ['id1', 'id0', 'ts0', 'ts1', 'g0', 'occlusion'])
+        self.assertEqual(recs[0]['keyframe'], True)
+        self.assertEqual(recs[3]['g0'], '1.0 2.0 3.0 4.0')
+        self.assertEqual(repr(recs[3]['ts1']), '1')
+
+    def test_compress(self):
+        table = self.table.compress(np.array([False, True, True, False]))
+        assert_array_equal(table.actor_offsets, [0, 2, 2])
+        self.assertEqual([r['id0'] for r in table.iter_records()], [3, 4])
+
+    def test_dedup_ts0(self):
+        # Same as building a {ts0: geom} dict for each actor
+        table = self.table.dedup_ts0()
+        expected = {}
+        for rec in self.records:
+            expected.setdefault(rec['id1'], {})[rec['ts0']] = rec['id0']
+
+        assert_array_equal(table.actor_offsets, [0, 2, 3])
+        self.assertEqual([r['id0'] for r in table.iter_records()],
+                         [v for by_ts0 in expected.values()
+                          for v in by_ts0.values()])
+
+    def test_actor_frame_index(self):
+        # Same as scanning each frame of the range against the set of
+        # qualifying frames
+        rng = np.random.RandomState(0)
+        builder = GeomTableBuilder()
+        for i in range(200):
+            builder.append({'id1': int(rng.randint(3)),
+                            'ts0': int(rng.randint(50)),
+                            'g0': '0 0 1 1'})
+        table = builder.build()
+        qualifying = rng.rand(len(table)) < 0.7
+        index = ActorFrameIndex(table, qualifying)
+        # (As built from the columns alone)
+        column_index = ActorFrameIndex.from_actor_frames(
+            table.actor_ids, table.actor_counts(), table.ts0, qualifying)
+
+        for actor_id in (0, 1, 2, 3):
+            in_actor = table.id1 == actor_id
+            frames = set(table.ts0[in_actor & qualifying].tolist())
+            for ts0_s, ts0_e in rng.randint(-5, 55, size=(50, 2)).tolist():
+                with self.subTest(actor=actor_id, span=(ts0_s, ts0_e)):
+                    in_span = [ts0 for ts0 in range(ts0_s, ts0_e + 1)
+                               if ts0 in frames]
+                    if in_span:
+                        expected = (len(in_span), in_span[0], in_span[-1])
+                    else:
+                        expected = (0, None, None)
+                    self.assertEqual(
+                        index.qualifying_range(actor_id, ts0_s, ts0_e),
+                        expected)
+                    self.assertEqual(
+                        column_index.qualifying_range(actor_id, ts0_s,
+                                                      ts0_e),
+                        expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
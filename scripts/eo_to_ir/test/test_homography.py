@@ -10,7 +10,7 @@ from numpy.testing import assert_array_equal
 lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib")
 sys.path.append(lib_path)
 
-from homography import apply_homography  # noqa
+from homography import apply_homography, apply_homography_batch  # noqa
 
 
 class TestHomography(unittest.TestCase):
@@ -59,6 +59,30 @@ class TestHomography(unittest.TestCase):
                              self.bounds_1),
             self.result_bounds_2)
 
+    def test_apply_homography_batch(self):
+        bounds = np.array([self.bounds_1, (-5.0, 2.0, 7.5, 30.0)])
+        for homography in (self.homography_i,
+                           self.homography_i2,
+                           self.homography_1,
+                           self.homography_2):
+            with self.subTest(homography=homography):
+                assert_array_equal(
+                    apply_homography_batch(homography, bounds),
+                    [apply_homography(homography, b) for b in bounds])
+
+    def test_apply_homography_batch_degenerate(self):
+        # Maps x == 0 to infinity
+        homography = np.array([[1.0, 0.0, 0.0],
+                               [0.0, 1.0, 0.0],
+                               [1.0, 0.0, 0.0]])
+
+        result = apply_homography_batch(homography,
+                                        [(0.0, 0.0, 1.0, 1.0),
+                                         (1.0, 1.0, 2.0, 2.0)])
+
+        self.assertTrue(np.all(np.isnan(result[0])))
+        assert_array_equal(result[1], (1.0, 0.5, 1.0, 2.0))
+
 
 if __name__ == '__main__':
     unittest.main()
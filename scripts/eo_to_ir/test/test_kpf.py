@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import unittest
+import gzip
+import os
+import sys
+import tempfile
+
+import yaml
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+from lib.kpf import parse_kpf_line, load_kpf_yaml  # noqa
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestKPF(unittest.TestCase):
+    def setUp(self):
+        super(TestKPF, self).setUp()
+
+        self.lines = [
+            "- { meta: { team: Kitware,  } }",
+            "- { meta: Casing_Facility 1 instances }",
+            '- { meta: "Casing_Facility 1 instances" }',
+            "- { geom: { id0: 1, id1: 1, ts0: 2098, ts1: 64.3, "
+            "g0: 0.0 0.0 10.0 10.0, keyframe: true,  } }",
+            "- { geom: { id1: 0, id0: 25, ts0: 25, ts1: 65, "
+            "g0: 1198 307 1248 343 , src: truth, occlusion: partially, } }",
+            "- { act: { act2: { Casing_Facility: 1, }, id2: 1, "
+            "timespan: [{ tsr0: [2098 , 2768],  }], "
+            "src_status: refiner_agreement, actors: [ { id1: 1, "
+            "timespan: [{ tsr0: [2098 , 2618],  }, ],  } ],  } }",
+            "- { types: { cset3: { Person: 1.0 }, id1: 1 } }",
+            "- { a: -1, b: +2.5, c: -0.0, d: 1.0e+5, e: Off, f: ~, g: , }",
+            "- { a: 'x y', b: it's, c: [] } # comment",
+        ]
+
+        # Lines that need PyYAML's full scalar resolution or syntax
+        self.unhandled_lines = [
+            "- { a: 017 }",
+            "- { a: 0x1f }",
+            "- { a: 1_000 }",
+            "- { a: 1:30 }",
+            "- { a: 2019-01-01 }",
+            "- { a: .inf }",
+            "- { a: &x 1 }",
+            "- { a: x:y }",
+            '- { a: "x\\"y" }',
+            "- a: b",
+        ]
+
+    def test_parse_kpf_line(self):
+        for line in self.lines:
+            with self.subTest(line=line):
+                self.assertEqual(repr(parse_kpf_line(line)),
+                                 repr(yaml.safe_load(line)))
+
+    def test_parse_kpf_line_unhandled(self):
+        for line in self.unhandled_lines:
+            with self.subTest(line=line):
+                self.assertIsNone(parse_kpf_line(line))
+
+    def test_parse_kpf_line_blank(self):
+        self.assertEqual(parse_kpf_line("\n"), [])
+        self.assertEqual(parse_kpf_line("# comment\n"), [])
+
+    def test_load_kpf_yaml(self):
+        for fn in ("test_1.geom.yml", "test_11.act.yml", "test_2.types.yml"):
+            with self.subTest(fn=fn):
+                path = os.path.join(test_dir, fn)
+                with open(path, 'r') as f:
+                    expected = yaml.safe_load(f)
+
+                self.assertEqual(repr(load_kpf_yaml(path)), repr(expected))
+
+    def test_load_compressed_kpf(self):
+        path = os.path.join(test_dir, "test_1.act.yml")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            gz_path = os.path.join(tmp_dir, "test_1.act.yml.gz")
+            with open(path, 'rb') as inf, gzip.open(gz_path, 'wb') as of:
+                of.write(inf.read())
+
+            self.assertEqual(load_kpf_yaml(gz_path), load_kpf_yaml(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+from lib.geom_table import GeomTableBuilder  # noqa
+from lib.kpf_writer import KPFWriter, dump_kpf_value, format_geom_lines  # noqa
+
+
+class TestKPFWriter(unittest.TestCase):
+    def setUp(self):
+        super(TestKPFWriter, self).setUp()
+
+        self.records = [
+            {'id0': 1, 'id1': 2, 'ts0': 10, 'ts1': 0.33,
+             'g0': '0.0 0.0 10.0 10.0', 'keyframe': True},
+            {'id1': 1, 'id0': 2, 'ts0': 10, 'ts1': 1,
+             'g0': '1 2 3 4', 'occlusion': 'heavy'},
+            {'id0': 3, 'id1': 2, 'ts0': 11, 'g0': '1e20 -0.0 11.5 11',
+             'cset3': {'Person': 1.0}, 'tags': ['a', 'b{}']},
+            {'id0': 4, 'id1': 2, 'ts0': 12, 'ts1': 0.4,
+             'g0': '2 2 12 12', 'meta': 'x'},
+        ]
+
+        builder = GeomTableBuilder()
+        for rec in self.records:
+            builder.append(dict(rec))
+        self.table = builder.build()
+
+    def test_dump_kpf_value(self):
+        self.assertEqual(
+            dump_kpf_value({'meta': 'a b', 'act': {'act2': {'X': 1},
+                                                   'tsr0': [1, 2],
+                                                   'none': None,
+                                                   'empty': {}}}),
+            '{ meta: "a b", act: { act2: { X: 1 }, tsr0: [1, 2], '
+            'none: None, empty: {  } } }')
+
+    def test_format_geom_lines(self):
+        # Same as dumping each of the table's records
+        for offscreen in (None, np.array([True, False, True, True])):
+            with self.subTest(offscreen=offscreen):
+                self.table.offscreen = offscreen
+                expected = ["- {}\n".format(dump_kpf_value({'geom': rec}))
+                            for rec in self.table.iter_records()]
+                self.assertEqual(format_geom_lines(self.table), expected)
+                self.assertEqual(format_geom_lines(self.table, 1, 3),
+                                 expected[1:3])
+
+        self.assertEqual(
+            format_geom_lines(self.table, 3, 4),
+            ["- { geom: { id1: 1, id0: 2, ts0: 10, ts1: 1, "
+             "g0: 1.0 2.0 3.0 4.0, occlusion: off-screen } }\n"])
+
+    def test_kpf_writer(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "out.yml")
+            with KPFWriter(path) as writer:
+                writer.write_meta("Casing 1 instances")
+                writer.write_geom_table(self.table, 0, 1)
+                writer.write_types({'cset3': {'Person': 1.0}, 'id1': 2})
+
+            with open(path, 'r') as inf:
+                lines = inf.readlines()
+
+        self.assertEqual(lines, [
+            '- { meta: "Casing 1 instances" }\n',
+            '- { geom: { id0: 1, id1: 2, ts0: 10, ts1: 0.33, '
+            'g0: 0.0 0.0 10.0 10.0, keyframe: True } }\n',
+            '- { types: { cset3: { Person: 1.0 }, id1: 2 } }\n'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+from lib.kw18 import format_kw18, write_kw18  # noqa
+
+
+class TestKW18(unittest.TestCase):
+    def setUp(self):
+        super(TestKW18, self).setUp()
+
+        self.track_ids = np.array([1, 1, 7])
+        self.track_frames = [2, 2, 1.0]
+        self.frame_numbers = np.array([10, 11, 0])
+        self.bounds = np.array([[0.0, 0.0, 10.0, 10.0],
+                                [1.5, 2.25, 11.0, 12.35],
+                                [-3.0, 4.0, 5.0, 6.0]])
+        self.timestamps = [0.333, 1, None]
+
+    def test_format_kw18(self):
+        # Same as writing out str() of each value
+        expected = []
+        for track_id, frames, frame, (x0, y0, x1, y1), ts in zip(
+                self.track_ids.tolist(), self.track_frames,
+                self.frame_numbers.tolist(), self.bounds.tolist(),
+                self.timestamps):
+            cx = (x0 + x1) / 2
+            cy = (y0 + y1) / 2
+            rec = (track_id, frames, frame, cx, cy, 0.0, 0.0, cx, cy,
+                   x0, y0, x1, y1, (x1 - x0) * (y1 - y0), 0.0, 0.0, 0.0, ts)
+            expected.append(" ".join(map(str, rec)) + "\n")
+
+        self.assertEqual(format_kw18(self.track_ids,
+                                     self.track_frames,
+                                     self.frame_numbers,
+                                     self.bounds,
+                                     self.timestamps),
+                         "".join(expected))
+
+    def test_format_kw18_precision(self):
+        lines = format_kw18(self.track_ids,
+                            self.track_frames,
+                            self.frame_numbers,
+                            self.bounds,
+                            self.timestamps,
+                            precision=2).splitlines()
+
+        self.assertEqual(lines[1],
+                         "1 2 11 6.25 7.30 0.00 0.00 6.25 7.30 1.50 2.25 "
+                         "11.00 12.35 95.95 0.00 0.00 0.00 1.00")
+        self.assertEqual(lines[2].split()[-1], "nan")
+
+    def test_write_kw18(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "out.kw18")
+            write_kw18(path,
+                       self.track_ids,
+                       self.track_frames,
+                       self.frame_numbers,
+                       self.bounds,
+                       self.timestamps,
+                       precision=3)
+            with open(path, 'r') as inf:
+                text = inf.read()
+
+        self.assertEqual(text, format_kw18(self.track_ids,
+                                           self.track_frames,
+                                           self.frame_numbers,
+                                           self.bounds,
+                                           self.timestamps,
+                                           precision=3))
+
+
+if __name__ == '__main__':
+    unittest.main()
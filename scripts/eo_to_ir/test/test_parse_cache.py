@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import sys
+import tempfile
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib")
+sys.path.append(lib_path)
+
+from parse_cache import ParseCache  # noqa
+
+
+def _encode(value):
+    return {'values': np.array(value[0])}, value[1]
+
+
+def _decode(arrays, objects):
+    return arrays['values'].tolist(), objects
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        super(TestParseCache, self).setUp()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        self.path = os.path.join(self.tmp_dir.name, "input.txt")
+        self._write_input("1 2 3")
+        self.parses = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write_input(self, content, mtime_ns=None):
+        with open(self.path, 'w') as of:
+            of.write(content)
+        if mtime_ns is not None:
+            os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def _parse(self, path):
+        self.parses += 1
+        with open(path, 'r') as inf:
+            values = [int(v) for v in inf.read().split()]
+        return values, {'count': len(values)}
+
+    def test_get(self):
+        cache = ParseCache(self.cache_dir)
+        for i in range(2):
+            value = cache.get('test', self.path, self._parse,
+                              _encode, _decode)
+            self.assertEqual(value, ([1, 2, 3], {'count': 3}))
+        self.assertEqual(self.parses, 1)
+
+        # Default encoding pickles the whole value
+        cache.get('pickled', self.path, self._parse)
+        self.assertEqual(cache.get('pickled', self.path, self._parse),
+                         ([1, 2, 3], {'count': 3}))
+        self.assertEqual(self.parses, 2)
+
+    def test_invalidation(self):
+        cache = ParseCache(self.cache_dir)
+        cache.get('test', self.path, self._parse, _encode, _decode)
+
+        # Same content with a new mtime still hits (on the hash)
+        self._write_input("1 2 3", mtime_ns=10 ** 18)
+        cache.get('test', self.path, self._parse, _encode, _decode)
+        self.assertEqual(self.parses, 1)
+
+        # Changed content with the same size and mtime doesn't
+        self._write_input("4 5 6", mtime_ns=10 ** 18 + 1)
+        value = cache.get('test', self.path, self._parse, _encode, _decode)
+        self.assertEqual(value[0], [4, 5, 6])
+        self.assertEqual(self.parses, 2)
+
+    def test_damaged_entry(self):
+        # A damaged entry is a miss, and is replaced
+        cache = ParseCache(self.cache_dir)
+        cache.get('test', self.path, self._parse, _encode, _decode)
+        entry_path = [os.path.join(self.cache_dir, f)
+                      for f in os.listdir(self.cache_dir)
+                      if f.endswith(".npz")][0]
+        with open(entry_path, 'rb') as inf:
+            entry = inf.read()
+
+        for i, damaged in enumerate((entry[:len(entry) // 2],
+                                     entry[:-10],
+                                     entry[:100] + b"x" * (len(entry) - 100),
+                                     b"")):
+            with self.subTest(i=i):
+                with open(entry_path, 'wb') as of:
+                    of.write(damaged)
+                parses = self.parses
+                value = cache.get('test', self.path, self._parse,
+                                  _encode, _decode)
+                self.assertEqual(value, ([1, 2, 3], {'count': 3}))
+                self.assertEqual(self.parses, parses + 1)
+
+                cache.get('test', self.path, self._parse, _encode, _decode)
+                self.assertEqual(self.parses, parses + 1)
+
+    def test_eviction(self):
+        cache = ParseCache(self.cache_dir, max_bytes=1)
+        cache.get('a', self.path, self._parse)
+        cache.get('b', self.path, self._parse)
+
+        # Only the most recent entry is kept
+        assert_array_equal(sorted(os.path.splitext(f)[1]
+                                  for f in os.listdir(self.cache_dir)),
+                           ['.json', '.npz'])
+        cache.get('b', self.path, self._parse)
+        self.assertEqual(self.parses, 2)
+        cache.get('a', self.path, self._parse)
+        self.assertEqual(self.parses, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import unittest
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+from lib.profiling import StageProfiler  # noqa
+
+
+class TestStageProfiler(unittest.TestCase):
+    def _stages(self, profiler):
+        return {s['name']: s for s in profiler.report()['stages']}
+
+    def test_stage(self):
+        profiler = StageProfiler()
+        for i in range(3):
+            with profiler.stage("a", records_in=2) as stage:
+                stage.add_records(records_out=1)
+        with profiler.stage("b"):
+            pass
+
+        stages = self._stages(profiler)
+        self.assertEqual(list(stages), ["a", "b"])
+        self.assertEqual(stages["a"]['calls'], 3)
+        self.assertEqual(stages["a"]['records_in'], 6)
+        self.assertEqual(stages["a"]['records_out'], 3)
+        self.assertGreaterEqual(stages["a"]['wall_time'], 0.0)
+        self.assertGreaterEqual(stages["a"]['cpu_time'], 0.0)
+        self.assertNotIn('records_in', stages["b"])
+
+    def test_wrappers(self):
+        profiler = StageProfiler()
+        double = profiler.wrap_batch("double", lambda c: np.tile(c, 2))
+        positive = profiler.wrap_mask("positive", lambda c: c > 0)
+        chunks = list(profiler.iterate("read",
+                                       [np.arange(-2, 3), np.arange(4)]))
+
+        self.assertEqual(len(double(chunks[0])), 10)
+        self.assertEqual(positive(chunks[1]).tolist(),
+                         [False, True, True, True])
+
+        stages = self._stages(profiler)
+        self.assertEqual(stages["read"]['calls'], 2)
+        self.assertEqual(stages["read"]['records_out'], 9)
+        self.assertEqual((stages["double"]['records_in'],
+                          stages["double"]['records_out']), (5, 10))
+        self.assertEqual((stages["positive"]['records_in'],
+                          stages["positive"]['records_out']), (4, 3))
+
+    def test_counts(self):
+        profiler = StageProfiler()
+        profiler.add_counts("a", cache_hits=3, cache_misses=1)
+        profiler.add_counts("a", cache_hits=2)
+
+        worker = StageProfiler()
+        with worker.stage("a"):
+            pass
+        worker.add_counts("a", cache_misses=4)
+        profiler.add_report(worker.report())
+
+        self.assertEqual(self._stages(profiler)["a"]['counts'],
+                         {'cache_hits': 5, 'cache_misses': 5})
+
+    def test_write(self):
+        profiler = StageProfiler(cprofile_stage="b")
+        with profiler.stage("a"):
+            pass
+        with profiler.stage("b"):
+            sorted(range(100))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "profile.json")
+            profiler.write(path)
+            with open(path, 'r') as inf:
+                report = json.load(inf)
+
+            self.assertEqual([s['name'] for s in report['stages']],
+                             ["a", "b"])
+            self.assertIn('wall_time', report['total'])
+            self.assertTrue(os.path.exists(
+                os.path.join(tmp_dir, "profile.b.prof")))
+
+
+if __name__ == '__main__':
+    unittest.main()
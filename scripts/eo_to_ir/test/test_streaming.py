@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import unittest
+import contextlib
+import filecmp
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+import eo_to_ir  # noqa
+from lib.streaming import ActorFrameSummary, GeomSpill  # noqa
+
+
+def _write_inputs(input_dir):
+    # Four interleaved actors over 100 frames, with some frames of
+    # actors 1 and 3 given twice (far apart and adjacent)
+    geoms = []
+    for ts0 in range(100):
+        for actor_id, active in ((1, True),
+                                 (2, ts0 < 60),
+                                 (3, ts0 >= 30),
+                                 (4, ts0 % 10 == 0)):
+            if active:
+                geoms.append((actor_id, ts0, ts0 * 7 % 50 + actor_id * 40))
+        if ts0 == 40:
+            geoms.append((3, 40, 5))
+    geoms += [(1, 5, 100), (1, 70, 110)]
+
+    paths = [os.path.join(input_dir, "test." + ext)
+             for ext in ("geom.yml", "act.yml", "types.yml")]
+    with open(paths[0], 'w') as of:
+        of.write("- { meta: { team: Kitware,  } }\n")
+        for id0, (actor_id, ts0, x) in enumerate(geoms):
+            of.write("- { geom: { id0: %d, id1: %d, ts0: %d, ts1: %.2f, "
+                     "g0: %d 10 %d 50,  } }\n"
+                     % (id0, actor_id, ts0, ts0 / 30.0, x, x + 30))
+    with open(paths[1], 'w') as of:
+        for id2, (actor_id, tsr0) in enumerate(((1, (0, 90)),
+                                                (3, (20, 45)),
+                                                (2, (50, 99)))):
+            of.write("- { act: { act2: { Talking: 1, }, id2: %d, "
+                     "timespan: [{ tsr0: [%d , %d],  }], actors: [ "
+                     "{ id1: %d, timespan: [{ tsr0: [%d , %d],  }],  }, ],"
+                     "  } }\n" % ((id2, ) + tsr0 + (actor_id, ) + tsr0))
+    with open(paths[2], 'w') as of:
+        for actor_id in range(1, 5):
+            of.write("- { types: { cset3: { Person: 1.0 }, id1: %d } }\n"
+                     % actor_id)
+    return paths
+
+
+class TestStreaming(unittest.TestCase):
+    def test_actor_frame_summary(self):
+        # Frames added a chunk at a time (growing the range both ways)
+        # give the same lookups as scanning a set of the frames
+        rng = np.random.RandomState(0)
+        summary = ActorFrameSummary()
+        summary.add_actors([3, 1])
+        frames = {1: set(), 3: set()}
+        for lo in (40, 60, 10, -30, 45, 200):
+            for actor_id in (1, 3):
+                ts0s = rng.randint(lo, lo + 25, size=10)
+                summary.add_frames(actor_id, ts0s)
+                frames[actor_id].update(ts0s.tolist())
+
+        self.assertEqual(summary.actor_ids, [3, 1])
+        self.assertIsNone(summary.frame_range(2))
+        for actor_id in (1, 2, 3):
+            actor_frames = frames.get(actor_id, set())
+            if actor_frames:
+                self.assertEqual(summary.frame_range(actor_id),
+                                 (min(actor_frames), max(actor_frames)))
+            for ts0_s, ts0_e in rng.randint(-40, 240, size=(50, 2)).tolist():
+                with self.subTest(actor=actor_id, span=(ts0_s, ts0_e)):
+                    in_span = [ts0 for ts0 in range(ts0_s, ts0_e + 1)
+                               if ts0 in actor_frames]
+                    if in_span:
+                        expected = (len(in_span), in_span[0], in_span[-1])
+                    else:
+                        expected = (0, None, None)
+                    self.assertEqual(
+                        summary.qualifying_range(actor_id, ts0_s, ts0_e),
+                        expected)
+
+    def test_geom_spill(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            spill = GeomSpill(spill_dir)
+            self.assertEqual(list(spill.iter_actors()), [])
+            spill.write(np.array([0, 3, 1, 2, 0]),
+                        np.array([10, 11, 12, 13, 11]),
+                        ['a', 'b', 'c', 'd', 'e'])
+            # Frame 11 of actor 0 and 13 of actor 2 again, replacing
+            # the rows written first
+            spill.write(np.array([2, 0, 2, 0]),
+                        np.array([14, 15, 13, 11]),
+                        ['f', 'g', 'h', 'i'])
+
+            actors = [(rank, [(ts0s.tolist(), values)
+                              for ts0s, values in pieces])
+                      for rank, pieces in spill.iter_actors()]
+
+        self.assertEqual(actors,
+                         [(0, [([10, 11], ['a', 'i']), ([15], ['g'])]),
+                          (1, [([12], ['c'])]),
+                          (2, [([13], ['h']), ([14], ['f'])]),
+                          (3, [([11], ['b'])])])
+
+    def test_streaming_matches_in_memory(self):
+        # Over many chunks of geoms, so that actors are spilled in
+        # several pieces
+        chunk_size = eo_to_ir.GEOM_CHUNK_SIZE
+        eo_to_ir.GEOM_CHUNK_SIZE = 16
+        self.addCleanup(setattr, eo_to_ir, 'GEOM_CHUNK_SIZE', chunk_size)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            geom_path, act_path, types_path = _write_inputs(tmp_dir)
+            for i, argv in enumerate((["-b", "160x200"],
+                                      ["-b", "200x200",
+                                       "--include-orphans"])):
+                with self.subTest(argv=argv):
+                    out_dir = os.path.join(tmp_dir, str(i))
+                    for prefix, mode_argv in (("memory", []),
+                                              ("streaming",
+                                               ["--streaming"])):
+                        parser = eo_to_ir.build_arg_parser()
+                        args = parser.parse_args(
+                            ["-g", geom_path, "-a", act_path,
+                             "-t", types_path, "-o", out_dir,
+                             "-p", prefix] + argv + mode_argv)
+                        eo_to_ir.check_args(parser, args)
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            eo_to_ir.main(args)
+
+                    for ext in ("activities.yml", "geom.yml", "kw18",
+                                "types.yml"):
+                        self.assertTrue(filecmp.cmp(
+                            os.path.join(out_dir, "memory." + ext),
+                            os.path.join(out_dir, "streaming." + ext),
+                            shallow=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import sys
+import tempfile
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+sys.path.append(os.path.join(script_path, "benchmark"))
+
+from synthetic_kpf import generate_synthetic_kpf  # noqa
+from lib.utils import (parse_activities_yaml,  # noqa
+                       parse_geom_yaml,
+                       parse_type_yaml)
+
+
+class TestSyntheticKPF(unittest.TestCase):
+    def test_generate(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            clip = generate_synthetic_kpf(tmp_dir,
+                                          5000,
+                                          track_length=100,
+                                          activity_density=1.0)
+            self.assertEqual(clip['num_actors'], 50)
+            self.assertEqual(clip['num_activities'], 50)
+
+            _, geom_table = parse_geom_yaml(clip['geom'])
+            self.assertEqual(len(geom_table), 5000)
+            self.assertEqual(len(geom_table.actor_ids), 50)
+            # One geom per actor and frame
+            self.assertEqual(sorted(geom_table.id0.tolist()),
+                             list(range(1, 5001)))
+            self.assertEqual(len(geom_table.dedup_ts0()), 5000)
+
+            _, activity_records, meta_records = parse_activities_yaml(
+                clip['activities'])
+            self.assertEqual(len(activity_records), 50)
+            for activity_rec in activity_records:
+                for actor_rec in activity_rec['actors']:
+                    self.assertIn(actor_rec['id1'], range(1, 51))
+
+            _, type_by_actor = parse_type_yaml(clip['types'])
+            self.assertEqual(sorted(type_by_actor), list(range(1, 51)))
+
+            # Generation is deterministic for a seed
+            with open(clip['geom'], 'r') as inf:
+                geoms = inf.read()
+            clip = generate_synthetic_kpf(tmp_dir, 5000, track_length=100)
+            with open(clip['geom'], 'r') as inf:
+                self.assertEqual(inf.read(), geoms)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,12 +5,18 @@ import os
 import sys
 from functools import reduce
 
+import numpy as np
+from numpy.testing import assert_array_equal
+
 lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib")
 sys.path.append(lib_path)
 
 from transduce import (xd_map,
                        xd_filter,
+                       xd_filter_mask,
+                       xd_cat,
                        appender,
+                       chunks,
                        xd)  # noqa
 
 
@@ -56,6 +62,29 @@ class TestTransduce(unittest.TestCase):
                     reduce(self.pipelines[i](appender), self.inputs, []),
                     self.expecteds[i])
 
+    def test_transduce_batch(self):
+        sqr_plus1 = xd_map(lambda c: c ** 2 + 1)
+        ne3 = xd_filter_mask(lambda c: c != 3)
+        pipeline = xd(ne3, sqr_plus1)
+
+        inputs = np.array(self.inputs)
+        for chunk_size in (1, 2, 5, 10):
+            with self.subTest(chunk_size=chunk_size):
+                out = reduce(pipeline(appender),
+                             chunks(inputs, chunk_size),
+                             [])
+                assert_array_equal(np.concatenate(out), [2, 5, 17, 26])
+
+    def test_transduce_batch_to_records(self):
+        # Batch stages can hand each record on to per-record stages
+        pipeline = xd(xd_filter_mask(lambda c: [x != 3 for x in c]),
+                      xd_cat,
+                      self.pipelines[1])
+
+        self.assertEqual(
+            reduce(pipeline(appender), chunks(self.inputs, 2), []),
+            [2, 5, 17, 26])
+
 
 if __name__ == '__main__':
     unittest.main()
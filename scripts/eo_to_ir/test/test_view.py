@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import sys
+import tempfile
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib")
+sys.path.append(lib_path)
+
+from camera_io import Camera  # noqa
+from view import view_to_view, view_to_view_batch  # noqa
+from view import VIEW_LUT_VERSION, ViewLUT, load_view_lut  # noqa
+
+
+def _make_camera(pitch_deg, yaw_deg, center):
+    K = np.array([[1000.0, 0.0, 960.0],
+                  [0.0, 1000.0, 540.0],
+                  [0.0, 0.0, 1.0]])
+    pitch, yaw = np.radians(pitch_deg), np.radians(yaw_deg)
+    Rx = np.array([[1.0, 0.0, 0.0],
+                   [0.0, np.cos(pitch), -np.sin(pitch)],
+                   [0.0, np.sin(pitch), np.cos(pitch)]])
+    Rz = np.array([[np.cos(yaw), -np.sin(yaw), 0.0],
+                   [np.sin(yaw), np.cos(yaw), 0.0],
+                   [0.0, 0.0, 1.0]])
+    R = np.matmul(Rx, Rz)
+    t = -np.matmul(R, center)
+    return Camera(K, R, t, [0.0, 0.0, 0.0, 0.0, 0.0])
+
+
+class TestView(unittest.TestCase):
+    def setUp(self):
+        super(TestView, self).setUp()
+
+        self.src_cam = _make_camera(120.0, 5.0, [0.0, -30.0, 15.0])
+        self.dest_cam = _make_camera(125.0, -10.0, [4.0, -32.0, 12.0])
+
+        self.bounds = np.array([[900.0, 500.0, 950.0, 620.0],
+                                [100.0, 800.0, 180.0, 900.0],
+                                [1500.0, 300.0, 1600.0, 340.0],
+                                [700.0, 700.0, 700.0, 760.0]])
+
+        self.expected_bounds = np.array(
+            [[979.0802264406323, 267.60150544968906,
+              1040.751854265356, 395.43414217471354],
+             [219.533460022026, 406.40705980008806,
+              326.96449178262884, 506.88597794934014],
+             [1776.2095798380146, 178.61444504708692,
+              1946.7434623466909, 235.2243622643126]])
+
+    def test_camera(self):
+        assert_allclose(self.src_cam.center, [0.0, -30.0, 15.0], atol=1e-12)
+        assert_allclose(np.matmul(self.src_cam.image_to_ground,
+                                  self.src_cam.ground_to_image),
+                        np.eye(3), atol=1e-12)
+
+    def test_view_to_view(self):
+        for i in range(3):
+            with self.subTest(i=i):
+                assert_allclose(view_to_view(self.src_cam,
+                                             self.dest_cam,
+                                             self.bounds[i]),
+                                self.expected_bounds[i],
+                                rtol=1e-9)
+
+    def test_view_to_view_batch(self):
+        tgt_boxes, valid = view_to_view_batch(self.src_cam,
+                                              self.dest_cam,
+                                              self.bounds)
+
+        self.assertTrue(np.all(valid[:3]))
+        assert_allclose(tgt_boxes[:3], self.expected_bounds, rtol=1e-9)
+
+    def test_view_to_view_batch_degenerate(self):
+        # Zero width boxes can't be back projected
+        tgt_boxes, valid = view_to_view_batch(self.src_cam,
+                                              self.dest_cam,
+                                              self.bounds)
+
+        self.assertFalse(valid[3])
+        self.assertTrue(np.all(np.isnan(tgt_boxes[3])))
+
+
+class TestViewLUT(unittest.TestCase):
+    def setUp(self):
+        super(TestViewLUT, self).setUp()
+
+        self.src_cam = _make_camera(120.0, 5.0, [0.0, -30.0, 15.0])
+        self.dest_cam = _make_camera(125.0, -10.0, [4.0, -32.0, 12.0])
+        # (A coarse grid, so a looser tolerance)
+        self.lut = ViewLUT.build(self.src_cam, self.dest_cam,
+                                 (17, 11, 9, 17), tolerance=2.0)
+
+        rng = np.random.RandomState(1)
+        x = rng.uniform(0, 1800, 2000)
+        y = rng.uniform(300, 900, 2000)
+        self.bounds = np.stack((x, y,
+                                x + rng.uniform(20, 120, 2000),
+                                y + rng.uniform(40, 160, 2000)), axis=1)
+
+    def test_samples(self):
+        # Boxes on the grid's samples are transferred as they were
+        lut = ViewLUT.build(self.src_cam, self.dest_cam, (17, 11, 9, 17),
+                            tolerance=float('inf'))
+        fx, fy, w, h = [a[[3, 5]] for a in lut.axes]
+        bounds = np.stack((fx - w / 2, fy - h, fx + w / 2, fy), axis=1)
+        tgt_boxes, valid = lut.lookup(bounds)
+        self.assertTrue(np.all(valid))
+        assert_allclose(tgt_boxes,
+                        view_to_view_batch(self.src_cam, self.dest_cam,
+                                           bounds)[0],
+                        rtol=1e-9)
+
+    def test_transfer(self):
+        self.assertGreater(self.lut.num_checked, 0)
+        self.assertLessEqual(self.lut.max_error, self.lut.tolerance)
+
+        exact_boxes, exact_valid = view_to_view_batch(self.src_cam,
+                                                      self.dest_cam,
+                                                      self.bounds)
+        tgt_boxes, valid = self.lut.transfer(self.src_cam, self.dest_cam,
+                                             self.bounds)
+        np.testing.assert_array_equal(valid, exact_valid)
+        self.assertGreater(np.mean(self.lut.lookup(self.bounds)[1]), 0.25)
+        assert_allclose(tgt_boxes, exact_boxes, atol=self.lut.tolerance)
+
+    def test_tolerance(self):
+        # Checked beyond the middles of the cells, so the error stays
+        # within the tolerance
+        lut = ViewLUT.build(self.src_cam, self.dest_cam, (17, 11, 9, 17))
+        lut.check(self.src_cam, self.dest_cam, num_samples=100000, seed=2)
+        self.assertGreater(lut.num_checked, 0)
+        self.assertLessEqual(lut.max_error, lut.tolerance)
+
+    def test_fallback(self):
+        # Boxes outside of the grid (or that can't be transferred) are
+        # transferred exactly
+        bounds = np.array([[-500.0, 500.0, -400.0, 600.0],
+                           [700.0, 700.0, 700.0, 760.0],
+                           [100.0, 800.0, 180.0, 900.0]])
+        self.assertEqual(self.lut.lookup(bounds)[1].tolist(),
+                         [False, False, True])
+
+        tgt_boxes, valid = self.lut.transfer(self.src_cam, self.dest_cam,
+                                             bounds)
+        exact_boxes, exact_valid = view_to_view_batch(self.src_cam,
+                                                      self.dest_cam,
+                                                      bounds)
+        np.testing.assert_array_equal(valid, exact_valid)
+        np.testing.assert_array_equal(tgt_boxes[0], exact_boxes[0])
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "lut.npz")
+            lut, built = load_view_lut(path, self.src_cam, self.dest_cam,
+                                       (17, 11, 9, 17))
+            self.assertTrue(built)
+
+            loaded, built = load_view_lut(path, self.src_cam,
+                                          self.dest_cam, (17, 11, 9, 17))
+            self.assertFalse(built)
+            self.assertEqual(loaded.key, lut.key)
+            self.assertEqual(loaded.max_error, lut.max_error)
+            np.testing.assert_array_equal(loaded.accurate, lut.accurate)
+            np.testing.assert_array_equal(
+                loaded.lookup(self.bounds)[0], lut.lookup(self.bounds)[0])
+
+            # Rebuilt for other cameras or grids
+            self.assertTrue(load_view_lut(path, self.dest_cam,
+                                          self.src_cam,
+                                          (17, 11, 9, 17))[1])
+            lut, built = load_view_lut(path, self.dest_cam, self.src_cam,
+                                       (9, 5, 5, 9))
+            self.assertTrue(built)
+            self.assertEqual(ViewLUT.load(path).grid, (9, 5, 5, 9))
+
+            # ... and for tables of older versions
+            with np.load(path) as data:
+                arrays = dict(data)
+            arrays['version'] = VIEW_LUT_VERSION - 1
+            with open(path, 'wb') as of:
+                np.savez(of, **arrays)
+            with self.assertRaises(ValueError):
+                ViewLUT.load(path)
+            self.assertTrue(load_view_lut(path, self.dest_cam, self.src_cam,
+                                          (9, 5, 5, 9))[1])
+            self.assertEqual(ViewLUT.load(path).grid, (9, 5, 5, 9))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import unittest
+import contextlib
+import gzip
+import io
+import os
+import re
+import sys
+import tempfile
+
+import numpy as np
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(script_path)
+
+import transfer_kw18  # noqa
+
+
+def _write_krtd(path, pitch_deg, yaw_deg, center):
+    K = np.array([[1000.0, 0.0, 960.0],
+                  [0.0, 1000.0, 540.0],
+                  [0.0, 0.0, 1.0]])
+    pitch, yaw = np.radians(pitch_deg), np.radians(yaw_deg)
+    Rx = np.array([[1.0, 0.0, 0.0],
+                   [0.0, np.cos(pitch), -np.sin(pitch)],
+                   [0.0, np.sin(pitch), np.cos(pitch)]])
+    Rz = np.array([[np.cos(yaw), -np.sin(yaw), 0.0],
+                   [np.sin(yaw), np.cos(yaw), 0.0],
+                   [0.0, 0.0, 1.0]])
+    R = np.matmul(Rx, Rz)
+    t = -np.matmul(R, center)
+    with open(path, 'w') as of:
+        for rows in (K, R, [t], [[0.0] * 5]):
+            for row in rows:
+                of.write(" ".join(repr(float(v)) for v in row) + "\n")
+            of.write("\n")
+
+
+def _kw18_row(track_id, frame, box):
+    x0, y0, x1, y1 = box
+    return ("%d 20 %d 0 0 0 0 %.2f %.2f %.2f %.2f %.2f %.2f %.2f 0 0 0 "
+            "%.3f\n" % (track_id, frame, (x0 + x1) / 2, (y0 + y1) / 2,
+                        x0, y0, x1, y1, (x1 - x0) * (y1 - y0),
+                        frame / 30.0))
+
+
+def _kw18_lines():
+    # Rows of three tracks (one falling out of the target frame and
+    # one of zero width, which can't be transferred), with comment and
+    # blank lines at the start, middle and end
+    lines = ["# 1:Track-id 2:Track-length 3:Frame-number ...\n",
+             "# (synthetic)\n"]
+    for frame in range(12):
+        lines.append(_kw18_row(1, frame, (900 + 5 * frame, 500,
+                                          950 + 5 * frame, 620)))
+        lines.append(_kw18_row(2, frame, (100 + 180 * frame, 800,
+                                          180 + 180 * frame, 900)))
+        if frame % 4 == 0:
+            lines.append(_kw18_row(3, frame, (900, 500, 900, 560)))
+        if frame == 6:
+            lines += ["# half way\n", "\n"]
+    lines.append("# end\n")
+    return lines
+
+
+class TestTransferKW18(unittest.TestCase):
+    def setUp(self):
+        super(TestTransferKW18, self).setUp()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.src_krtd = self._path("src.krtd")
+        self.tgt_krtd = self._path("tgt.krtd")
+        _write_krtd(self.src_krtd, 120.0, 5.0, [0.0, -30.0, 15.0])
+        _write_krtd(self.tgt_krtd, 125.0, -10.0, [4.0, -32.0, 12.0])
+
+        self.lines = _kw18_lines()
+        self.kw18 = self._path("in.kw18")
+        with open(self.kw18, 'w') as of:
+            of.writelines(self.lines)
+
+    def _path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def _transfer(self, src_kw18, chunk_size, tgt_kw18=None):
+        # Returns the transferred KW18 and what was printed
+        tgt_kw18 = tgt_kw18 or self._path("out_%d.kw18" % chunk_size)
+        argv = ["transfer_kw18.py", "-o", "-2",
+                "--chunk-size", str(chunk_size),
+                self.src_krtd, src_kw18, self.tgt_krtd, tgt_kw18]
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            sys_argv, sys.argv = sys.argv, argv
+            try:
+                transfer_kw18.main()
+            finally:
+                sys.argv = sys_argv
+        with transfer_kw18.open_file(tgt_kw18) as f:
+            return f.read(), output.getvalue()
+
+    def test_chunk_sizes(self):
+        # The same output whatever the chunk size, including chunks
+        # that split the rows around comments and a short last chunk
+        expected, printed = self._transfer(self.kw18, len(self.lines))
+        out_lines = expected.splitlines(True)
+        comments = [line for line in self.lines if line.startswith('#')]
+        self.assertEqual([line for line in out_lines
+                          if line.startswith('#')], comments)
+        self.assertEqual(out_lines[:2], comments[:2])
+        self.assertEqual(out_lines[-1], "# end\n")
+        # (Warned of for each run of rows between comments)
+        self.assertEqual(sum(map(int, re.findall(r"warning, (\d+) bad",
+                                                 printed))),
+                         3)
+
+        # Tracks 1 and 2 from frame 2, less what leaves the frame
+        rows = [line.split() for line in out_lines
+                if not line.startswith('#')]
+        self.assertEqual(sorted(set(row[0] for row in rows)), ["1", "2"])
+        self.assertEqual(min(int(row[2]) for row in rows), 0)
+        self.assertLess(len(rows), 20)
+        self.assertEqual(set(len(row) for row in rows), {18})
+        halfway = out_lines.index("# half way\n")
+        self.assertEqual(max(int(row[2]) for row in
+                             (line.split() for line in out_lines[2:halfway])),
+                         4)
+
+        for chunk_size in (1, 2, 3, 5, 7, 16):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self._transfer(self.kw18, chunk_size)[0],
+                                 expected)
+
+    def test_compressed(self):
+        expected, _ = self._transfer(self.kw18, 100)
+        gz_kw18 = self._path("in.kw18.gz")
+        with gzip.open(gz_kw18, 'wt') as of:
+            of.writelines(self.lines)
+        self.assertEqual(self._transfer(gz_kw18, 4,
+                                        self._path("out.kw18.xz"))[0],
+                         expected)
+
+    def test_empty(self):
+        for lines in ([], ["# only a comment\n"], ["\n", "\n"]):
+            with self.subTest(lines=lines):
+                with open(self.kw18, 'w') as of:
+                    of.writelines(lines)
+                for chunk_size in (1, 100):
+                    self.assertEqual(self._transfer(self.kw18,
+                                                    chunk_size)[0],
+                                     "".join(line for line in lines
+                                             if line.startswith('#')))
+
+    def test_iter_kw18_chunks(self):
+        chunks = list(transfer_kw18.iter_kw18_chunks(self.kw18, 10))
+        self.assertEqual("".join(header for header, _ in chunks),
+                         "".join(line for line in self.lines
+                                 if line.startswith('#')))
+        self.assertEqual(sum(len(rows) for _, rows in chunks), 27)
+        self.assertEqual(chunks[0][1].shape, (8, 18))
+        self.assertEqual(chunks[0][1][0, 2], "0")
+
+
+if __name__ == '__main__':
+    unittest.main()
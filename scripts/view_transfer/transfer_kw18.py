@@ -35,25 +35,131 @@ Map KW18 from one camera to another
 
 """
 
+import itertools
+import os.path
+import sys
+
 import numpy as np
-import numpy.linalg as npl
 from camera_io import load_camera_krtd_file
-import os.path
-import cv2
+# compressed_io is shared with the cli_helpers (and kept with them, as
+# they're installed)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, "cli_helpers"))
+from compressed_io import open_file  # noqa
+from view import (project,  # noqa
+                  backproject_bbox_batch,
+                  box_around_box3d_batch,
+                  load_view_lut,
+                  VIEW_LUT_GRID,
+                  VIEW_LUT_TOLERANCE)
+
+try:
+    import cv2
+except ImportError:
+    # (Only needed for --gui)
+    cv2 = None
 
 from optparse import OptionParser
 
 
-def load_kw18_file(fname):
-    data = []
-    header = ""
-    with open(fname) as f:
-        for line in f:
-            if line.lstrip()[0] == '#':
-                header += line
+# Number of KW18 rows to read, transfer and write at a time
+KW18_CHUNK_SIZE = 65536
+
+
+def _rows_array(lines):
+    # (N, columns) object array of the column strings of each of the
+    # (non-comment) lines
+    tokens = "".join(lines).split()
+    num_columns = len(lines[0].split()) if len(lines) > 0 else 18
+    if num_columns == 0 or len(tokens) != len(lines) * num_columns:
+        # (Blank lines, or rows of differing lengths)
+        rows = [line.split() for line in lines if line.strip()]
+        num_columns = len(rows[0]) if len(rows) > 0 else 18
+        if any(len(row) != num_columns for row in rows):
+            raise ValueError("KW18 rows have differing numbers of columns")
+        tokens = [t for row in rows for t in row]
+    return np.array(tokens, dtype=object).reshape(-1, num_columns)
+
+
+def iter_kw18_chunks(fname, chunk_size=KW18_CHUNK_SIZE):
+    """Iterate over a KW18 file a chunk of lines at a time, yielding the
+    comment lines and the rows after them (as an (N, columns) object
+    array of column strings); a chunk is split where comments fall
+    between its rows, so they're written back in place whatever the
+    chunk size"""
+    with open_file(fname) as f:
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if len(lines) == 0:
+                break
+
+            if '#' not in "".join(lines):
+                yield "", _rows_array(lines)
                 continue
-            data.append(line.rstrip().split())
-    return data, header
+
+            comments, row_lines = [], []
+            for line in lines:
+                if not line.lstrip().startswith('#'):
+                    row_lines.append(line)
+                    continue
+                if len(row_lines) > 0:
+                    yield "".join(comments), _rows_array(row_lines)
+                    comments, row_lines = [], []
+                comments.append(line)
+            yield "".join(comments), _rows_array(row_lines)
+
+
+def _row_template(num_columns):
+    # Output rows are written as they were read, other than the frame
+    # number (2), image location (7, 8) and bounding box (9 to 12)
+    fields = ["%s"] * num_columns
+    fields[2] = "%d"
+    fields[7:13] = ["%.2f"] * 6
+    return " ".join(fields) + "\n"
+
+
+def transfer_kw18_rows(src_cam, tgt_cam, rows, offset=0,
+                       frame_size=(1920, 1080), show=None, lut=None):
+    """Transfer a chunk of KW18 rows (as from iter_kw18_chunks) from the
+    source to the target camera, returning the output text.
+
+    Frames are offset by 'offset', and rows that can't be transferred,
+    fall before frame 0 or end up outside of 'frame_size' are dropped.
+    'show', if given, is called with the source box, 3D box and target
+    box of each row that is transferred (whether or not it's in frame).
+    'lut', if given, is a ViewLUT for the cameras to interpolate the
+    boxes from, where it's accurate enough (and can't be used with
+    'show').
+    """
+    boxes = rows[:, 9:13].astype(np.float64)
+    if lut is not None:
+        tgt_boxes, valid = lut.transfer(src_cam, tgt_cam, boxes)
+    else:
+        box3ds, valid = backproject_bbox_batch(src_cam, boxes)
+        tgt_boxes = box_around_box3d_batch(tgt_cam, box3ds)
+    num_bad = int(np.count_nonzero(~valid))
+    if num_bad > 0:
+        print("warning, %d bad projection%s" % (num_bad,
+                                                "s" if num_bad > 1 else ""))
+
+    frames = rows[:, 2].astype(np.int64) + offset
+    keep = valid & (frames >= 0)
+    if show is not None:
+        for i in np.flatnonzero(keep).tolist():
+            show(boxes[i].tolist(), box3ds[i], tgt_boxes[i].tolist())
+
+    width, height = frame_size
+    keep &= ~((tgt_boxes[:, 2] < 0) | (tgt_boxes[:, 3] < 0) |
+              (tgt_boxes[:, 0] > width) | (tgt_boxes[:, 1] > height))
+
+    out_rows = rows[keep]
+    tgt_boxes = tgt_boxes[keep]
+    out_rows[:, 2] = frames[keep]
+    out_rows[:, 7] = (tgt_boxes[:, 0] + tgt_boxes[:, 2]) / 2
+    out_rows[:, 8] = (tgt_boxes[:, 1] + tgt_boxes[:, 3]) / 2
+    out_rows[:, 9:13] = tgt_boxes
+    return ((_row_template(rows.shape[1]) * len(out_rows)) %
+            tuple(out_rows.ravel().tolist()))
 
 
 def write_kwiver_tracks(f, data, img_num):
@@ -61,76 +167,6 @@ def write_kwiver_tracks(f, data, img_num):
         f.write("%d %d %g %g 1.0 1.0 0.0 255 255 255 0\n" % (id, img_num, u, v))
 
 
-def project(cam, wld_pt):
-    """Project a world point into an image with a camera"""
-    # map to normalized image coordinates
-    img_pt = cam[0] * (cam[1] * np.matrix(wld_pt.flat).transpose() + cam[2])
-    return img_pt[:2] / img_pt[2]
-
-
-def backproject_to_height(cam, img_pt, height=0):
-    """Back an image point to a specified world height"""
-    # map to normalized image coordinates
-    npt = npl.solve(cam[0], np.array(list(img_pt)+[1.0]))
-    M = cam[1].copy()
-    M[:, 2] = height * M[:, 2] + cam[2]
-    wpt = npl.solve(M, npt)
-    return np.matrix([wpt[0]/wpt[2], wpt[1]/wpt[2], height]).transpose()
-
-
-def backproject_to_plane(cam, img_pt, plane):
-    """Back an image point to a specified world plane"""
-    # map to normalized image coordinates
-    npt = np.matrix(npl.solve(cam[0], np.array(list(img_pt)+[1.0])))
-    M = cam[1].transpose()
-    n = np.matrix(plane[:3]).flatten()
-    d = plane.flat[3]
-    Mt = M * cam[2]
-    Mp = M * npt.transpose()
-    return Mp * (np.dot(n, Mt) - d) / np.dot(n, Mp) - Mt
-
-
-def backproject_bbox(cam, box):
-    # project base of the box to the ground
-    pc = backproject_to_height(cam, ((box[0]+box[2])/2, box[3]), 0)
-    ray = pc - (-cam[1].transpose() * cam[2])
-    ray[2] = 0.0
-    ray = ray / npl.norm(ray)
-
-    p1 = backproject_to_height(cam, (box[0], box[3]), 0)
-    p2 = backproject_to_height(cam, (box[2], box[3]), 0)
-    vh = p2 - p1
-    vd = np.matrix([-vh.item(1), vh.item(0), 0]).transpose()
-    vd = ray * npl.norm(vh)
-    vh = np.matrix([-vd.item(1), vd.item(0), 0]).transpose()
-    p1 = pc - vh/2
-    p2 = pc + vh/2
-    p3 = p2 + vd
-    p4 = p1 + vd
-    if npl.norm(vd) == 0.0:
-        return None
-    n = vd / npl.norm(vd)
-    d = - (n.transpose() * p3).item()
-    back_plane = np.vstack((n,d))
-    p5 = backproject_to_plane(cam, (box[0], box[1]), back_plane)
-    height = p5.flat[2]
-    box3d = np.zeros((8,3))
-    box3d[0, :] = p1.flatten()
-    box3d[1, :] = p2.flatten()
-    box3d[2, :] = p3.flatten()
-    box3d[3, :] = p4.flatten()
-    box3d[4:, :] = box3d[:4, :]
-    box3d[4:, 2] = height
-    return box3d
-
-
-def box_around_box3d(cam, box3d):
-    pts = np.zeros((8, 2))
-    for c, p in enumerate(box3d):
-        pts[c, :] = project(cam, p).flat
-    return np.min(pts, 0).tolist() + np.max(pts, 0).tolist()
-
-
 def draw_box(img, box, color=(255,0,0), width=2):
     box = list(map(int, box))
     cv2.line(img, (box[0], box[1]), (box[0], box[3]), color, width)
@@ -163,6 +199,7 @@ def draw_box3d(img, cam, box3d, color=(0,0,255), width=1):
 def main():
     usage = "usage: %prog [options] src_krtd src_kw18 tgt_krtd tgt_kw18\n\n"
     usage += "  Map KW18 from one camera to another\n"
+    usage += "  (KW18 files ending in .gz, .xz or .zst are compressed)\n"
     parser = OptionParser(usage=usage)
 
     parser.add_option("-g", "--gui", default=False,
@@ -171,6 +208,31 @@ def main():
     parser.add_option("-o", "--frame-offset", default=0, type='int',
                       action="store", dest="offset",
                       help="frames to offset output tracks")
+    parser.add_option("--compress-threads", default=1, type='int',
+                      action="store", dest="compress_threads",
+                      help="threads to compress the output KW18 with, if "
+                      "its name ends in .gz, .xz or .zst (0 for one per CPU)")
+    parser.add_option("--chunk-size", default=KW18_CHUNK_SIZE, type='int',
+                      action="store", dest="chunk_size",
+                      help="number of KW18 rows to transfer at a time")
+    parser.add_option("--lut", default=None, type='string',
+                      action="store", dest="lut",
+                      help="approximate the transfer by interpolating in a "
+                      "lookup table of sampled transfers saved at this "
+                      "(.npz) path, building it there if there's none for "
+                      "the cameras yet")
+    parser.add_option("--lut-grid", default="x".join(map(str, VIEW_LUT_GRID)),
+                      type='string', action="store", dest="lut_grid",
+                      help="samples of the --lut table along each of foot "
+                      "x, foot y, width and height of the source boxes "
+                      "(default is %default)")
+    parser.add_option("--lut-tolerance", default=VIEW_LUT_TOLERANCE,
+                      type='float', action="store", dest="lut_tolerance",
+                      help="largest error in pixels (from the exact "
+                      "transfer, checked at the middles of each cell of the "
+                      "--lut table and of its faces) of the cells to "
+                      "interpolate in; other boxes are transferred exactly "
+                      "(default is %default)")
 
     (options, args) = parser.parse_args()
 
@@ -187,46 +249,52 @@ def main():
     #print((plane[:3] * pt)+plane[3])
     #print(project(src_cam, pt))
 
+    lut = None
+    if options.lut is not None:
+        if options.gui:
+            parser.error("--lut can't be used with --gui")
+        lut_grid = tuple(map(int, options.lut_grid.split('x')))
+        if len(lut_grid) != 4:
+            parser.error("--lut-grid must be four numbers separated by 'x'")
+        lut, built = load_view_lut(options.lut, src_cam, tgt_cam, lut_grid,
+                                   options.lut_tolerance)
+        print("%s view LUT '%s': %s" % ("Built" if built else "Loaded",
+                                        options.lut, lut.describe()))
+        if lut.max_error > lut.tolerance:
+            print("Warning, view LUT errors of up to %.3f px exceed its "
+                  "tolerance of %s px; a finer --lut-grid may be needed"
+                  % (lut.max_error, lut.tolerance))
+
+    show = None
     if options.gui:
+        if cv2 is None:
+            parser.error("--gui requires OpenCV (cv2)")
         img_src = cv2.imread('G335.png')
         img_dst = cv2.imread('G341.png')
 
-    src_tracks, header = load_kw18_file(src_kw18)
-
-    with open(tgt_kw18, 'w') as out:
-        out.write(header)
-        for ts in src_tracks:
-            box = list(map(float, ts[9:13]))
-            box3d = backproject_bbox(src_cam, box)
-            if box3d is None:
-                print("warning, bad projection")
-                continue
-            tgt_box = box_around_box3d(tgt_cam, box3d)
-            center = [(tgt_box[0] + tgt_box[2])/2, (tgt_box[1] + tgt_box[3])/2]
-            frame = int(ts[2]) + options.offset
-            if frame < 0:
-                continue
-
-            if options.gui:
-                img1 = img_src.copy()
-                img2 = img_dst.copy()
-                draw_box(img1, box)
-                draw_box3d(img1, src_cam, box3d)
-                draw_box3d(img2, tgt_cam, box3d)
-                draw_box(img2, tgt_box)
-                img1 = cv2.resize(img1, None, fx=0.5, fy=0.5)
-                img2 = cv2.resize(img2, None, fx=0.5, fy=0.5)
-                cv2.imshow('source',img1)
-                cv2.imshow('dest',img2)
-                cv2.waitKey(10)
-
-            if tgt_box[2] < 0 or tgt_box[3] < 0 or tgt_box[0] > 1920 or tgt_box[1] > 1080:
-                continue
-
-            ts[2] = str(frame)
-            ts[7:9] = map(lambda v : "{0:.2f}".format(v), center)
-            ts[9:13] = map(lambda v : "{0:.2f}".format(v), tgt_box)
-            out.write(' '.join(ts)+"\n")
+        def _show(box, box3d, tgt_box):
+            img1 = img_src.copy()
+            img2 = img_dst.copy()
+            draw_box(img1, box)
+            draw_box3d(img1, src_cam, box3d)
+            draw_box3d(img2, tgt_cam, box3d)
+            draw_box(img2, tgt_box)
+            img1 = cv2.resize(img1, None, fx=0.5, fy=0.5)
+            img2 = cv2.resize(img2, None, fx=0.5, fy=0.5)
+            cv2.imshow('source',img1)
+            cv2.imshow('dest',img2)
+            cv2.waitKey(10)
+
+        show = _show
+
+    # Each chunk of rows is transferred and written before the next is
+    # read, so memory use doesn't grow with the size of the file
+    with open_file(tgt_kw18, 'w', threads=options.compress_threads) as out:
+        for header, rows in iter_kw18_chunks(src_kw18, options.chunk_size):
+            out.write(header)
+            out.write(transfer_kw18_rows(src_cam, tgt_cam, rows,
+                                         options.offset, show=show,
+                                         lut=lut))
 
 
 if __name__ == "__main__":